@@ -0,0 +1,78 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Keeping the front of an AFPO-like population up to date with ParetoArchive.sync against recomputing it with
+DominanceSort every generation. Every generation all robots age by one, half of the population is replaced and the
+fronts are checked to agree.
+Run from the repository root: python benchmarks/bench_archive.py [generations]
+"""
+
+import sys
+import time
+import random
+
+from common import ToyRobot
+
+from evo.pareto import DominanceSort, ParetoArchive
+
+POP_SIZES = [1000, 5000, 10000, 20000]
+
+
+class ThreeObjectiveRobot(ToyRobot):
+    def __init__(self, seq_num):
+        ToyRobot.__init__(self, seq_num)
+        self.size = random.random()
+
+    def get_minimize_vals(self):
+        return [self.age, self.size]
+
+
+def run(pop_size, generations):
+    random.seed(0)
+    ids = [0]
+
+    def new_robot():
+        ids[0] += 1
+        return ThreeObjectiveRobot(ids[0])
+
+    population = [new_robot() for _ in range(pop_size)]
+    archive = ParetoArchive()
+    archive.sync(population)
+    sort_time = archive_time = 0.0
+    for _ in range(generations):
+        for robot in population:
+            robot.iterate_generation()
+        random.shuffle(population)
+        population = population[:pop_size // 2] + [new_robot() for _ in range(pop_size - pop_size // 2)]
+
+        start = time.perf_counter()
+        expected = DominanceSort(population).front()
+        sort_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        front = archive.sync(population)
+        archive_time += time.perf_counter() - start
+        assert list(front) == list(expected)
+    return sort_time / generations, archive_time / generations, len(front)
+
+
+if __name__ == '__main__':
+    generations = int(sys.argv[1]) if len(sys.argv) >= 2 else 5
+
+    print("%8s %8s %14s %14s %10s" % ("pop", "front", "sort (s/gen)", "archive (s/gen)", "speedup"))
+    for pop_size in POP_SIZES:
+        sort_time, archive_time, front_size = run(pop_size, generations)
+        print("%8d %8d %14.4f %14.4f %9.1fx" % (pop_size, front_size, sort_time, archive_time,
+                                                sort_time / archive_time))
@@ -0,0 +1,80 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Evaluations per second of AFPOMoo on a process pool against the number of robots sent per task
+(evo.batching.AdaptiveChunking), for cheap evaluations where the per task overhead dominates. Robots send a small
+payload and burn a fixed amount of cpu per evaluation. "auto" picks the chunk size from the measured evaluation times,
+its last line shows the size it settled on.
+Run from the repository root: python benchmarks/bench_chunking.py [evaluation ms] [workers] [pop size]
+"""
+
+import sys
+import time
+
+from common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.batching import AdaptiveChunking
+from evo.executors import ProcessExecutor
+
+CHUNK_SIZES = [None, 1, 2, 4, 8, 16, 32, 64, 128, "auto"]
+GENERATIONS = 10
+
+EVALUATION_SECONDS = 0.0002
+
+
+class CheapRobot(ToyRobot):
+    def get_work_payload(self):
+        return self.seq_num
+
+    @classmethod
+    def complete_payload(cls, payload):
+        end = time.perf_counter() + EVALUATION_SECONDS
+        while time.perf_counter() < end:
+            pass
+        return (payload * 7919 % 1000) / 1000.0
+
+
+def run(chunk_size, workers, pop_size):
+    if chunk_size is None:
+        chunking = None
+    else:
+        chunking = AdaptiveChunking(fixed_size=None if chunk_size == "auto" else chunk_size)
+    afpo = AFPOMoo(lambda: CheapRobot(0), pop_size=pop_size, cull_mode="crowding", executor=ProcessExecutor(workers),
+                   chunking=chunking)
+    # the first generation starts the workers and lets auto measure the evaluations.
+    afpo.generation()
+    evaluations = 0
+    start = time.perf_counter()
+    for _ in range(GENERATIONS):
+        afpo.generation()
+        evaluations += afpo.generation_stats["evaluations"]
+    elapsed = time.perf_counter() - start
+    size = afpo.generation_stats.get("chunk_size")
+    afpo.cleanup()
+    return evaluations / elapsed, size
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        EVALUATION_SECONDS = float(sys.argv[1]) / 1000
+    workers = int(sys.argv[2]) if len(sys.argv) >= 3 else 4
+    pop_size = int(sys.argv[3]) if len(sys.argv) >= 4 else 2000
+
+    print("%.2f ms evaluations, %d workers, %d children per generation"
+          % (1000 * EVALUATION_SECONDS, workers, pop_size))
+    print("%10s %10s %12s" % ("chunk size", "used", "evals/s"))
+    for chunk_size in CHUNK_SIZES:
+        rate, size = run(chunk_size, workers, pop_size)
+        print("%10s %10s %12.0f" % ("per robot" if chunk_size is None else chunk_size, size or "-", rate))
@@ -0,0 +1,59 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cost of making a child in AFPOMoo.generation: copy.deepcopy + mutate against clone_for_mutation + mutate.
+Needs EvoSoroCore. Run from the repository root: python benchmarks/bench_clone.py [number of children]
+"""
+
+import sys
+import copy
+import time
+import random
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+import utils
+from softbot_robot import SoftbotRobot
+from utils import StructureGenotype, StructurePhenotype, get_seq_num
+
+
+def make_children(parents, count, clone):
+    copy_time = mutate_time = 0.0
+    for i in range(count):
+        start = time.perf_counter()
+        child = clone(parents[i % len(parents)])
+        copied = time.perf_counter()
+        child.mutate()
+        copy_time += copied - start
+        mutate_time += time.perf_counter() - copied
+    return copy_time / count, mutate_time / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) >= 2 else 200
+
+    random.seed(0)
+    np.random.seed(0)
+    parents = [SoftbotRobot(StructurePhenotype(StructureGenotype), get_seq_num, "bench") for _ in range(20)]
+
+    print("IND_SIZE %s, %d materials, %d children" % (utils.IND_SIZE, utils.NUM_MATERIALS, count))
+    print("%20s %12s %12s %12s" % ("", "copy (ms)", "mutate (ms)", "total (ms)"))
+    for name, clone in (("copy.deepcopy", copy.deepcopy), ("clone_for_mutation", SoftbotRobot.clone_for_mutation)):
+        random.seed(1)
+        np.random.seed(1)
+        copy_time, mutate_time = make_children(parents, count, clone)
+        print("%20s %12.3f %12.3f %12.3f" % (name, 1000 * copy_time, 1000 * mutate_time,
+                                             1000 * (copy_time + mutate_time)))
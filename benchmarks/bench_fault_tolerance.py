@@ -0,0 +1,93 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generation times of AFPOMoo on a process pool with and without evo.fault_tolerance.FaultTolerance, for toy robots
+whose evaluations are mostly quick but sometimes straggle (a noisy shared machine), crash or hang. Without fault
+tolerance a crash stops the run and a hang never finishes, so those are only run with it.
+Run from the repository root: python benchmarks/bench_fault_tolerance.py [workers] [generations]
+"""
+
+import sys
+import time
+import random
+
+from common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.executors import ProcessExecutor
+from evo.fault_tolerance import FaultTolerance
+
+POP_SIZE = 40
+EVALUATION_SECONDS = 0.01
+STRAGGLER_SECONDS = 1.0
+TIMEOUT = 0.5
+
+
+class NoisyRobot(ToyRobot):
+    kind = None
+
+    def compute_work(self, serial=False):
+        time.sleep(EVALUATION_SECONDS)
+        draw = random.random()
+        if self.kind == "straggle" and draw < 0.05:
+            time.sleep(STRAGGLER_SECONDS)
+        elif self.kind == "crash" and draw < 0.1:
+            raise RuntimeError("simulator crashed")
+        elif self.kind == "hang" and draw < 0.02:
+            time.sleep(3600)
+        ToyRobot.compute_work(self)
+
+    def get_penalty_letter(self):
+        return -1.0
+
+
+def run(kind, fault_tolerance, workers, generations):
+    NoisyRobot.kind = kind
+    random.seed(0)
+    afpo = AFPOMoo(lambda: NoisyRobot(0), pop_size=POP_SIZE, cull_mode="tournament", executor=ProcessExecutor(workers),
+                   fault_tolerance=fault_tolerance)
+    afpo.generation()
+    times = []
+    totals = {}
+    for _ in range(generations):
+        start = time.perf_counter()
+        afpo.generation()
+        times.append(time.perf_counter() - start)
+        for k, v in afpo.generation_stats.items():
+            if k.startswith("dispatch_"):
+                totals[k[len("dispatch_"):]] = totals.get(k[len("dispatch_"):], 0) + v
+    afpo.cleanup()
+    return times, totals
+
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1]) if len(sys.argv) >= 2 else 4
+    generations = int(sys.argv[2]) if len(sys.argv) >= 3 else 10
+
+    cases = [
+        ("straggle", "none", None),
+        ("straggle", "speculate", FaultTolerance(speculate_after=0.8)),
+        ("crash", "retries", FaultTolerance(retries=2)),
+        ("hang", "timeout", FaultTolerance(timeout=TIMEOUT, retries=1)),
+        ("hang", "timeout+spec", FaultTolerance(timeout=TIMEOUT, retries=1, speculate_after=0.8)),
+    ]
+    print("%d workers, %d generations of %d children, %.0f ms evaluations"
+          % (workers, generations, POP_SIZE, 1000 * EVALUATION_SECONDS))
+    print("%9s %13s %9s %9s %9s  %s" % ("robots", "dispatch", "mean (s)", "max (s)", "stdev (s)", "events"))
+    for kind, name, fault_tolerance in cases:
+        times, totals = run(kind, fault_tolerance, workers, generations)
+        mean = sum(times) / len(times)
+        stdev = (sum((t - mean) ** 2 for t in times) / len(times)) ** 0.5
+        events = ", ".join("%s %d" % (k, v) for k, v in totals.items() if v)
+        print("%9s %13s %9.2f %9.2f %9.2f  %s" % (kind, name, mean, max(times), stdev, events))
@@ -0,0 +1,109 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cost of an id from IdAllocator against uuid.uuid1 and a plain global counter, and a stress test: many processes,
+forked from a parent which already drew ids, mutate toy robots in parallel and every id must be unique.
+Run from the repository root: python benchmarks/bench_ids.py [processes] [ids per process]
+"""
+
+import sys
+import time
+import uuid
+import pickle
+import random
+
+from multiprocessing import Pool, Process, Queue
+
+from common import ToyRobot
+from evo.ids import IdAllocator
+
+IDS = IdAllocator(name="bench")
+
+counter = 0
+
+
+def plain_counter():
+    global counter
+    counter += 1
+    return counter
+
+
+def per_call(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return 1e9 * (time.perf_counter() - start) / count
+
+
+class MutatingRobot(ToyRobot):
+    def __init__(self, seq_num_gen):
+        self.seq_num_gen = seq_num_gen
+        ToyRobot.__init__(self, seq_num_gen())
+
+    def mutate(self):
+        ToyRobot.mutate(self)
+        self.seq_num = self.seq_num_gen()
+
+
+def mutate_many(robot, count):
+    # the robot (and its allocator) reach the worker pickled, like robots sent to an executor.
+    robot = pickle.loads(robot)
+    ids = []
+    for _ in range(count):
+        robot.mutate()
+        ids.append(robot.get_seq_num())
+    return ids
+
+
+def forked_worker(count, results):
+    results.put([IDS() for _ in range(count)])
+
+
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) >= 2 else 8
+    per_process = int(sys.argv[2]) if len(sys.argv) >= 3 else 100000
+
+    count = 10 ** 6
+    print("uuid.uuid1:     %6.0f ns per id" % per_call(uuid.uuid1, count // 10))
+    print("global counter: %6.0f ns per id" % per_call(plain_counter, count))
+    print("IdAllocator:    %6.0f ns per id" % per_call(IDS, count))
+    print("pickled IdAllocator: %d bytes" % len(pickle.dumps(IDS)))
+
+    random.seed(0)
+    parent_ids = [IDS() for _ in range(1000)]
+
+    # processes forked directly.
+    results = Queue()
+    workers = [Process(target=forked_worker, args=(per_process, results)) for _ in range(processes)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    ids = [i for _ in workers for i in results.get()]
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    # and robots mutated in a pool, with the parent drawing ids at the same time.
+    robot = pickle.dumps(MutatingRobot(IDS))
+    with Pool(processes) as pool:
+        pending = [pool.apply_async(mutate_many, (robot, per_process // 10)) for _ in range(processes * 4)]
+        parent_ids += [IDS() for _ in range(per_process)]
+        for p in pending:
+            ids += p.get()
+    ids += parent_ids
+
+    assert len(ids) == len(set(ids)), "%d duplicate ids" % (len(ids) - len(set(ids)))
+    print("%d unique ids from %d processes, %.0f ns per id in the forked processes"
+          % (len(ids), processes * 2 + 1, 1e9 * elapsed / (processes * per_process)))
@@ -0,0 +1,75 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Overhead of evo.instrumentation: the cost of one span when profiling is off and on, and AFPOMoo generations of toy
+robots on a serial executor with and without a messages_file.
+Run from the repository root: python benchmarks/bench_instrumentation.py [population size]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from common import ToyRobot, time_call
+from evo.afpomoo import AFPOMoo
+from evo.executors import SerialExecutor
+from evo.instrumentation import NULL_PROFILER, Profiler
+
+
+def spans(profiler, count):
+    for _ in range(count):
+        with profiler.span("x"):
+            pass
+
+
+def empty_loop(count):
+    for _ in range(count):
+        pass
+
+
+def run_generations(pop_size, generations, messages_file):
+    random.seed(0)
+    ids = [0]
+
+    def factory():
+        ids[0] += 1
+        return ToyRobot(ids[0])
+
+    afpo = AFPOMoo(factory, pop_size=pop_size, messages_file=messages_file, cull_mode="tournament",
+                   executor=SerialExecutor())
+    start = time.perf_counter()
+    for _ in range(generations):
+        afpo.generation()
+    elapsed = time.perf_counter() - start
+    afpo.cleanup()
+    return elapsed / generations
+
+
+if __name__ == "__main__":
+    pop_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    count = 10 ** 6
+
+    loop = time_call(empty_loop, count)
+    print("span overhead, disabled: %6.0f ns" % (1e9 * (time_call(spans, NULL_PROFILER, count) - loop) / count))
+    print("span overhead, enabled:  %6.0f ns" % (1e9 * (time_call(spans, Profiler(), count) - loop) / count))
+
+    with tempfile.TemporaryDirectory() as directory:
+        messages_file = os.path.join(directory, "profile.jsonl")
+        off = min(run_generations(pop_size, 20, None) for _ in range(3))
+        on = min(run_generations(pop_size, 20, messages_file) for _ in range(3))
+    print("generation of %d toy robots: %.2f ms without profiling, %.2f ms with profiling (%+.1f%%)"
+          % (pop_size, 1000 * off, 1000 * on, 100 * (on - off) / off))
@@ -0,0 +1,83 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Evaluations per second against the number of cores, for one population evaluating on a process pool and for one
+island per core. Robots are toy robots whose evaluation burns a fixed amount of cpu, so with cheap evaluations the
+single population is limited by sorting, culling and mutating in the parent while the islands are not.
+Run from the repository root: python benchmarks/bench_islands.py [evaluation ms] [max cores]
+"""
+
+import os
+import sys
+import time
+import random
+
+from common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.executors import ProcessExecutor
+from evo.islands import IslandModel
+
+CORES = [1, 2, 4, 8, 16, 32]
+POP_SIZE = 50
+GENERATIONS = 20
+
+EVALUATION_SECONDS = 0.001
+
+
+class BusyRobot(ToyRobot):
+    def compute_work(self, serial=False):
+        end = time.perf_counter() + EVALUATION_SECONDS
+        while time.perf_counter() < end:
+            pass
+        self.fitness = random.random()
+
+
+def factory():
+    return BusyRobot(0)
+
+
+def single_population(cores):
+    random.seed(0)
+    afpo = AFPOMoo(factory, pop_size=POP_SIZE, cull_mode="tournament", executor=ProcessExecutor(cores))
+    start = time.perf_counter()
+    evaluations = 0
+    for _ in range(GENERATIONS):
+        afpo.generation()
+        evaluations += afpo.generation_stats["evaluations"]
+    elapsed = time.perf_counter() - start
+    afpo.cleanup()
+    return evaluations / elapsed
+
+
+def islands(cores):
+    model = IslandModel(factory, seeds=range(cores), pop_size=POP_SIZE, migration_interval=5, cull_mode="tournament")
+    evaluations = 0
+    start = time.perf_counter()
+    for _ in range(GENERATIONS // model.migration_interval):
+        evaluations += sum(s["evaluations"] for s in model.epoch())
+    elapsed = time.perf_counter() - start
+    model.cleanup()
+    return evaluations / elapsed
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2:
+        EVALUATION_SECONDS = float(sys.argv[1]) / 1000
+    max_cores = int(sys.argv[2]) if len(sys.argv) >= 3 else os.cpu_count()
+
+    print("%d cpus, %.1f ms per evaluation" % (os.cpu_count(), 1000 * EVALUATION_SECONDS))
+    print("%6s %22s %22s" % ("cores", "one population (ev/s)", "islands (ev/s)"))
+    for cores in [c for c in CORES if c <= max_cores]:
+        print("%6d %22.0f %22.0f" % (cores, single_population(cores), islands(cores)))
@@ -0,0 +1,84 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streams a synthetic run (every robot the child of a random robot of the previous generation) into a LineageRecorder,
+then times the queries. Reports how long recording took the run's thread against how long the writer needed, and
+the size of the database.
+Run from the repository root: python benchmarks/bench_lineage.py [records] [robots per generation] [database]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from common import ToyRobot, time_call
+from evo.lineage import LineageRecorder
+
+
+class DigestRobot(ToyRobot):
+    def __init__(self, seq_num):
+        ToyRobot.__init__(self, seq_num)
+        self.needs_eval = False
+
+    def get_cache_key(self):
+        return self.seq_num.to_bytes(16, "little")
+
+
+if __name__ == '__main__':
+    records = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000000
+    per_generation = int(sys.argv[2]) if len(sys.argv) >= 3 else 1000
+    directory = tempfile.mkdtemp()
+    path = sys.argv[3] if len(sys.argv) >= 4 else os.path.join(directory, "lineage.db")
+
+    random.seed(0)
+    lineage = LineageRecorder(path)
+    generations = records // per_generation
+    previous = [None]
+    recording = 0.0
+    start = time.perf_counter()
+    for generation in range(generations):
+        robots = [DigestRobot(generation * per_generation + i + 1) for i in range(per_generation)]
+        before = time.perf_counter()
+        for robot in robots:
+            parent = previous[random.randrange(len(previous))]
+            if parent is not None:
+                lineage.born(robot, parent)
+            lineage.evaluated(robot)
+        lineage.end_generation(robots, robots[:20], per_generation)
+        recording += time.perf_counter() - before
+        previous = [r.get_id() for r in robots]
+    lineage.flush()
+    total = time.perf_counter() - start
+    size = sum(os.path.getsize(path + suffix) for suffix in ["", "-wal"] if os.path.exists(path + suffix))
+
+    print("%d records in %d generations" % (generations * per_generation, generations))
+    print("recording: %.2f s in the run's thread (%.2f us per record), %.2f s until written (%.0f records/s)"
+          % (recording, 1e6 * recording / records, total, records / total))
+    print("database: %.1f MB (%.0f bytes per record)" % (size / 2 ** 20, size / records))
+
+    last = previous[0]
+    queries = [
+        ("get", lineage.get, last),
+        ("ancestry (%d deep)" % len(lineage.ancestry(last)), lineage.ancestry, last),
+        ("children", lineage.children, per_generation // 2),
+        ("robots_in", lineage.robots_in, generations // 2),
+        ("front", lineage.front, generations // 2),
+        ("generation_stats (all)", lineage.generation_stats, 0),
+    ]
+    for name, query, arg in queries:
+        print("%24s %10.3f ms" % (name, 1000 * time_call(query, arg)))
+    lineage.close()
@@ -0,0 +1,54 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cost of handing a morphology to the simulator: the original per voxel serializer against the vectorized text and
+binary formats, and writing it to a file in the current directory, /dev/shm or a memfd.
+Run from the repository root: python benchmarks/bench_morphology_io.py
+"""
+
+import numpy as np
+
+from common import time_call
+
+from morphology_io import morphology_handoff, morphology_to_bytes, morphology_to_text
+
+IND_SIZES = [(8, 8, 7), (16, 16, 16), (32, 32, 32), (64, 64, 64)]
+NUM_MATERIALS = 10
+MIN_PERCENT_FULL = 0.5
+
+
+def legacy_to_text(morphology):
+    return '\n'.join("%d,%d,%d|%d" % (*index, x) for index, x in np.ndenumerate(morphology) if x)
+
+
+def handoff(morphology, mode, binary):
+    with morphology_handoff(morphology, "Robot_Morph_bench.txt", mode=mode, binary=binary) as path:
+        with open(path, "rb") as f:
+            f.read()
+
+
+if __name__ == '__main__':
+    rng = np.random.RandomState(0)
+    print("%12s %12s %12s %12s %12s %12s %12s" % ("IND_SIZE", "legacy (ms)", "text (ms)", "binary (ms)",
+                                                  "file (ms)", "shm (ms)", "memfd (ms)"))
+    for ind_size in IND_SIZES:
+        morphology = rng.randint(1, NUM_MATERIALS + 1, ind_size) * (rng.rand(*ind_size) < MIN_PERCENT_FULL)
+        assert morphology_to_text(morphology) == legacy_to_text(morphology)
+
+        times = [time_call(legacy_to_text, morphology, repeats=1),
+                 time_call(morphology_to_text, morphology),
+                 time_call(morphology_to_bytes, morphology)]
+        times += [time_call(handoff, morphology, mode, False) for mode in ("file", "shm", "memfd")]
+        print("%12s" % ("x".join(map(str, ind_size)),) + "".join(" %12.2f" % (1000 * t) for t in times))
@@ -0,0 +1,50 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares the legacy pairwise dominance scan with the vectorized DominanceSort.
+Run from the repository root: python benchmarks/bench_pareto.py [max legacy pop size]
+"""
+
+import sys
+
+from common import ToyRobot, toy_population, time_call
+
+from evo.pareto import DominanceSort, legacy_front
+
+POP_SIZES = [21, 50, 100, 500, 1000, 2000, 5000, 10000]
+
+
+def wide_front_population(size):
+    # older robots are fitter, so nobody dominates anybody: the worst case for the legacy scan.
+    return [ToyRobot(i, fitness=float(i), age=i) for i in range(size)]
+
+
+if __name__ == '__main__':
+    # the legacy scan is quadratic in python, so by default do not run it on the largest populations.
+    legacy_max = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000
+
+    print("%8s %8s %12s %12s %12s %10s" % ("pop", "scenario", "legacy (s)", "front (s)", "ranks (s)", "speedup"))
+    for pop_size in POP_SIZES:
+        for scenario, students in (("random", toy_population(pop_size)), ("wide", wide_front_population(pop_size))):
+            front_time = time_call(lambda: DominanceSort(students).front())
+            ranks_time = time_call(lambda: DominanceSort(students).ranks())
+
+            if pop_size <= legacy_max:
+                legacy_time = time_call(legacy_front, students, repeats=1)
+                assert list(DominanceSort(students).front()) == legacy_front(students)
+                print("%8d %8s %12.4f %12.4f %12.4f %9.1fx" % (pop_size, scenario, legacy_time, front_time,
+                                                               ranks_time, legacy_time / front_time))
+            else:
+                print("%8d %8s %12s %12.4f %12.4f %10s" % (pop_size, scenario, "-", front_time, ranks_time, "-"))
@@ -0,0 +1,80 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Phenotypes built and mutated per second, with and without the shared CPPN input grids, and random valid phenotypes
+built one by one against in batches (PhenotypeSampler) for several MIN_PERCENT_FULL.
+Needs EvoSoroCore. Run from the repository root: python benchmarks/bench_phenotype.py [number of phenotypes]
+"""
+
+import sys
+import time
+import random
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+import utils
+from softbot_robot import SoftbotRobot
+from utils import GridCachedCPPN, PhenotypeSampler, StructureGenotype, StructurePhenotype, get_seq_num
+
+
+def throughput(count):
+    random.seed(0)
+    np.random.seed(0)
+    start = time.perf_counter()
+    robots = [SoftbotRobot(StructurePhenotype(StructureGenotype), get_seq_num, "bench") for _ in range(count)]
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for robot in robots:
+        robot.mutate()
+    mutated = time.perf_counter() - start
+    return count / built, count / mutated
+
+
+def valid_phenotypes(count, min_percent_full, batch_size):
+    random.seed(0)
+    np.random.seed(0)
+    utils.MIN_PERCENT_FULL = min_percent_full
+    StructurePhenotype.checked = StructurePhenotype.accepted = 0
+    start = time.perf_counter()
+    if batch_size:
+        sampler = PhenotypeSampler(batch_size=batch_size, min_percent_full=min_percent_full)
+        for _ in range(count):
+            sampler()
+        rate = sampler.acceptance_rate()
+    else:
+        for _ in range(count):
+            StructurePhenotype(StructureGenotype)
+        rate = StructurePhenotype.accepted / max(StructurePhenotype.checked, 1)
+    return count / (time.perf_counter() - start), rate
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) >= 2 else 200
+
+    print("IND_SIZE %s, %d materials, %d phenotypes" % (utils.IND_SIZE, utils.NUM_MATERIALS, count))
+    print("%14s %14s %14s" % ("input grids", "built / s", "mutated / s"))
+    for cache_inputs in (False, True):
+        GridCachedCPPN.cache_inputs = cache_inputs
+        GridCachedCPPN.input_grids.clear()
+        print("%14s %14.1f %14.1f" % (("shared" if cache_inputs else "per network",) + throughput(count)))
+
+    print()
+    print("%14s %14s %14s %14s" % ("min % full", "batch", "valid / s", "accepted"))
+    for min_percent_full in (0.25, 0.5, 0.75):
+        for batch_size in (0, 32):
+            rate, acceptance = valid_phenotypes(count, min_percent_full, batch_size)
+            print("%14.2f %14s %14.1f %13.1f%%" % (min_percent_full, batch_size or "-", rate, 100 * acceptance))
@@ -0,0 +1,87 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generation time and memory of AFPOMoo with its students in a plain list against an evo.population.ColumnarPopulation,
+for large populations of toy robots evaluated in process. Uses crowding culling, the tournament needs the O(n^2)
+dominance matrix. Both runs must keep the same students.
+Memory is what tracemalloc sees: the population once built, and the peak during a generation on top of it.
+Run from the repository root: python benchmarks/bench_population.py [pop size] [generations]
+"""
+
+import sys
+import time
+import random
+import tracemalloc
+
+from common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.executors import SerialExecutor
+from evo.instrumentation import Profiler
+
+SPANS = ["iterate", "clone", "mutate", "evaluate", "dominance", "cull"]
+
+
+class CheapCloneRobot(ToyRobot):
+    def clone_for_mutation(self):
+        return CheapCloneRobot(self.seq_num, self.fitness, self.age)
+
+
+def factory():
+    return CheapCloneRobot(0)
+
+
+def run(pop_size, generations, columnar, trace):
+    """
+    :param trace: measure memory instead of time, tracemalloc slows everything down.
+    """
+    random.seed(0)
+    if trace:
+        tracemalloc.start()
+    afpo = AFPOMoo(factory, pop_size=pop_size, cull_mode="crowding", executor=SerialExecutor(), columnar=columnar)
+    afpo.profiler = Profiler()
+    for _ in range(generations):
+        afpo.generation()
+    if trace:
+        population = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    afpo.generation()
+    elapsed = time.perf_counter() - start
+    students = [s.get_id() for s in afpo.students]
+    afpo.cleanup()
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] - population
+        tracemalloc.stop()
+        return population, peak, students
+    return elapsed, {name: afpo.profiler.last_report["spans"].get(name, 0.0) for name in SPANS}, students
+
+
+if __name__ == '__main__':
+    pop_size = int(sys.argv[1]) if len(sys.argv) >= 2 else 100000
+    generations = int(sys.argv[2]) if len(sys.argv) >= 3 else 2
+
+    print("pop size %d (%d students per generation), timing generation %d" % (pop_size, 2 * pop_size, generations + 1))
+    print("%9s %9s %s %12s %12s" % ("store", "total (s)", " ".join("%9s" % s for s in SPANS), "memory (MB)",
+                                     "peak (MB)"))
+    results = {}
+    for columnar in [False, True]:
+        elapsed, spans, students = run(pop_size, generations, columnar, trace=False)
+        population, peak, results[columnar] = run(pop_size, generations, columnar, trace=True)
+        assert results[columnar] == students
+        print("%9s %9.2f %s %12.1f %12.1f" % ("columnar" if columnar else "list", elapsed,
+                                              " ".join("%9.2f" % spans[s] for s in SPANS), population / 2 ** 20,
+                                              peak / 2 ** 20))
+    assert results[False] == results[True], "the list and columnar populations diverged"
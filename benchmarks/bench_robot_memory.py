@@ -0,0 +1,98 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Memory per SoftbotRobot for each softbot_robot.MORPHOLOGY_STORAGE and workspace size: resident memory (RSS) and
+what tracemalloc sees for a population of mutated children, the size of a pickled robot (what a checkpoint writes),
+and how long decoding the morphology (for a payload or a cache key) takes.
+Each setting runs in its own process, so resident memory is not shared between them. Needs EvoSoroCore.
+Run from the repository root: python benchmarks/bench_robot_memory.py [robots] [ind sizes, e.g. 8x8x7,32x32x32]
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import resource
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+
+STORAGES = [None, "dense", "sparse", "rle", "auto"]
+
+
+def resident():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def run(robots, ind_size, storage):
+    import utils
+    import softbot_robot
+
+    utils.configure(ind_size=ind_size)
+    softbot_robot.MORPHOLOGY_STORAGE = storage
+    random.seed(0)
+    np.random.seed(0)
+    parent = softbot_robot.SoftbotRobot(utils.random_phenotype(), utils.get_seq_num, "bench")
+
+    before = resident()
+    tracemalloc.start()
+    population = []
+    for _ in range(robots):
+        child = parent.clone_for_mutation()
+        child.mutate()
+        population.append(child)
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss = resident() - before
+
+    start = time.perf_counter()
+    for robot in population:
+        robot.morphology
+    decode = (time.perf_counter() - start) / robots
+    stored = population[0]._stored_morphology()
+    return {
+        "rss": rss / robots,
+        "traced": traced / robots,
+        "pickled": sum(len(pickle.dumps(r, protocol=pickle.HIGHEST_PROTOCOL)) for r in population) / robots,
+        "decode": decode,
+        "encoding": getattr(stored, "encoding", "array"),
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        config = json.loads(sys.argv[2])
+        print(json.dumps(run(config["robots"], config["ind_size"], config["storage"])))
+        sys.exit(0)
+
+    robots = int(sys.argv[1]) if len(sys.argv) >= 2 else 500
+    ind_sizes = sys.argv[2] if len(sys.argv) >= 3 else "8x8x7,32x32x32"
+    print("%d mutated children per setting" % robots)
+    print("%10s %8s %8s %12s %12s %12s %12s" % ("ind size", "storage", "encoding", "rss (KB)", "traced (KB)",
+                                                 "pickled (KB)", "decode (us)"))
+    for ind_size in ind_sizes.split(","):
+        for storage in STORAGES:
+            config = {"robots": robots, "ind_size": [int(x) for x in ind_size.split("x")], "storage": storage}
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", json.dumps(config)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print("%10s %8s %8s %12.1f %12.1f %12.1f %12.1f"
+                  % (ind_size, storage or "arrays", result["encoding"], result["rss"] / 1024,
+                     result["traced"] / 1024, result["pickled"] / 1024, 1e6 * result["decode"]))
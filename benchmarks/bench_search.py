@@ -0,0 +1,166 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+End to end runs of the search as shipped (CPPN phenotypes, SoftbotRobot, AFPOMoo) with a synthetic simulator
+(fitness_functions.SyntheticSimulator) for every combination of POP_SIZE, IND_SIZE, NUM_MATERIALS and worker count.
+Prints the time per generation spent in each phase and the evaluations per second, and appends one JSON line per run to
+--output, tagged with the git commit, so versions can be compared: --baseline FILE prints the speedup over the runs
+with the same settings in FILE. Runs are seeded, and the digest of the final fitnesses must match between versions
+which should not change the search.
+Each run is a separate process. Needs EvoSoroCore.
+Run from the repository root, e.g.:
+python benchmarks/bench_search.py --pop-sizes 21,100 --ind-sizes 8x8x7,16x16x14 --materials 2,10 --workers 1,4
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+
+PHASES = ["immigrant", "clone", "mutate", "dispatch", "wait", "dominance", "cull"]
+SETTINGS = ["pop_size", "ind_size", "materials", "workers", "fitness", "seconds", "mode", "generations", "seed"]
+
+
+def run(config):
+    # imported here, so that utils is configured before anything uses it.
+    import utils
+    import softbot_robot
+    from evo.afpomoo import AFPOMoo
+    from evo.executors import ProcessExecutor, SerialExecutor
+    from evo.instrumentation import Profiler
+    from fitness_functions import SyntheticSimulator
+
+    utils.configure(ind_size=config["ind_size"], num_materials=config["materials"])
+    softbot_robot.SIMULATOR = SyntheticSimulator(config["fitness"], seconds=config["seconds"], mode=config["mode"])
+    random.seed(config["seed"])
+    np.random.seed(config["seed"])
+
+    def robot_factory():
+        return softbot_robot.SoftbotRobot(utils.random_phenotype(), utils.get_seq_num, "bench")
+
+    start = time.perf_counter()
+    executor = ProcessExecutor(config["workers"]) if config["workers"] else SerialExecutor()
+    afpo = AFPOMoo(robot_factory, pop_size=config["pop_size"], cull_mode="tournament", executor=executor,
+                   id_allocator=utils.ROBOT_IDS)
+    afpo.profiler = Profiler()
+    initialize = time.perf_counter() - start
+
+    phases = dict.fromkeys(PHASES, 0.0)
+    evaluations = 0
+    start = time.perf_counter()
+    for _ in range(config["generations"]):
+        afpo.generation()
+        evaluations += afpo.generation_stats["evaluations"]
+        for phase in PHASES:
+            phases[phase] += afpo.profiler.last_report["spans"].get(phase, 0.0)
+    elapsed = time.perf_counter() - start
+    fitnesses = sorted(round(s.get_fitness(), 9) for s in afpo.students)
+    afpo.cleanup()
+
+    generations = config["generations"]
+    return {
+        "initialize": initialize,
+        "generation": elapsed / generations,
+        "phases": {phase: seconds / generations for phase, seconds in phases.items()},
+        "evaluations_per_second": evaluations / elapsed,
+        "best_fitness": fitnesses[-1],
+        "digest": hashlib.md5(repr(fitnesses).encode()).hexdigest()[:12],
+    }
+
+
+def version():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def key(config):
+    return tuple(json.dumps(config[s]) for s in SETTINGS)
+
+
+def load(path):
+    baseline = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            baseline[key(record["config"])] = record
+    return baseline
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        print(json.dumps(run(json.loads(sys.argv[2]))))
+        sys.exit(0)
+
+    def numbers(text):
+        return [int(x) for x in text.split(",")]
+
+    parser = argparse.ArgumentParser(description="end to end benchmark of the search with a synthetic simulator")
+    parser.add_argument("--pop-sizes", type=numbers, default=[21, 100])
+    parser.add_argument("--ind-sizes", default="8x8x7,16x16x14", help="comma separated workspace sizes, e.g. 8x8x7")
+    parser.add_argument("--materials", type=numbers, default=[10])
+    parser.add_argument("--workers", type=numbers, default=[1], help="0 evaluates in this process")
+    parser.add_argument("--fitness", default="compactness")
+    parser.add_argument("--seconds", type=float, default=0.001, help="time of one synthetic evaluation")
+    parser.add_argument("--mode", choices=["burn", "sleep"], default="burn")
+    parser.add_argument("--generations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="append the results as JSON lines to this file")
+    parser.add_argument("--baseline", default=None, help="JSON lines from an earlier --output to compare with")
+    args = parser.parse_args()
+
+    baseline = load(args.baseline) if args.baseline is not None else {}
+    ind_sizes = [[int(x) for x in size.split("x")] for size in args.ind_sizes.split(",")]
+    tag = version()
+    print("version %s, python %s, %d cpus, %s evaluations of %.1f ms (%s)"
+          % (tag, platform.python_version(), os.cpu_count(), args.fitness, 1000 * args.seconds, args.mode))
+    print("%5s %9s %4s %3s %9s %9s %s %8s %12s %9s" % ("pop", "ind size", "mat", "wrk", "init (s)", "gen (s)",
+                                                      " ".join("%9s" % p for p in PHASES), "evals/s", "digest",
+                                                      "speedup"))
+    for pop_size in args.pop_sizes:
+        for ind_size in ind_sizes:
+            for materials in args.materials:
+                for workers in args.workers:
+                    config = {"pop_size": pop_size, "ind_size": ind_size, "materials": materials, "workers": workers,
+                              "fitness": args.fitness, "seconds": args.seconds, "mode": args.mode,
+                              "generations": args.generations, "seed": args.seed}
+                    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run",
+                                                      json.dumps(config)])
+                    result = json.loads(output.decode().strip().splitlines()[-1])
+                    speedup = ""
+                    if key(config) in baseline:
+                        before = baseline[key(config)]["result"]
+                        speedup = "%.2fx" % (before["generation"] / result["generation"])
+                        if before["digest"] != result["digest"]:
+                            speedup += " (differs)"
+                    print("%5d %9s %4d %3d %9.2f %9.3f %s %8.0f %12s %9s"
+                          % (pop_size, "x".join(map(str, ind_size)), materials, workers, result["initialize"],
+                             result["generation"], " ".join("%9.4f" % result["phases"][p] for p in PHASES),
+                             result["evaluations_per_second"], result["digest"], speedup))
+                    if args.output is not None:
+                        with open(args.output, "a") as f:
+                            f.write(json.dumps({"version": tag, "time": time.time(), "config": config,
+                                                "result": result}) + "\n")
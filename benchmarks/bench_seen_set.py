@@ -0,0 +1,97 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Memory and lookup cost of remembering every morphology seen, for FORCE_MORPH_ONCE.
+The old tuple keyed dict is measured on fewer morphologies since it needs several KB per morphology.
+Run from the repository root: python benchmarks/bench_seen_set.py [number of morphologies ...]
+"""
+
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+from evo.seen_set import BloomFilter, DigestSet
+
+IND_SIZE = (8, 8, 7)
+NUM_MATERIALS = 10
+BATCH = 10000
+
+
+def morphologies(count, seed):
+    rng = np.random.RandomState(seed)
+    for start in range(0, count, BATCH):
+        for m in rng.randint(0, NUM_MATERIALS + 1, (min(BATCH, count - start),) + IND_SIZE).astype(np.uint8):
+            yield m
+
+
+class TupleDict(object):
+    # the original MORPHOLOGIES_SEEN_BEFORE: tuples of the numpy integer scalars of the phenotype's state.
+    def __init__(self):
+        self.seen = {}
+        self.nbytes = None
+
+    def __contains__(self, m):
+        return tuple(m.astype(int).flatten()) in self.seen
+
+    def add(self, m):
+        self.seen[tuple(m.astype(int).flatten())] = 1
+
+
+def measure(name, make, count):
+    seen = make()
+    tracing = seen.nbytes is None
+    if tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for m in morphologies(count, 0):
+        seen.add(m)
+    insert = time.perf_counter() - start
+    if tracing:
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    else:
+        # the sets live in shared memory, which tracemalloc does not see.
+        memory = seen.nbytes
+
+    lookups = min(count, 100000)
+    start = time.perf_counter()
+    hits = sum(m in seen for m in morphologies(lookups, 0))
+    hit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    false_hits = sum(m in seen for m in morphologies(lookups, 1))
+    miss_time = time.perf_counter() - start
+    assert hits == lookups
+
+    print("%-16s %10d %12.1f %10.1f %10.2f %10.2f %10.2f %8.4f%%" % (
+        name, count, memory / 2 ** 20, memory / count, 1e6 * insert / count, 1e6 * hit_time / lookups,
+        1e6 * miss_time / lookups, 100.0 * false_hits / lookups))
+
+
+if __name__ == '__main__':
+    counts = [int(float(c)) for c in sys.argv[1:]] or [10 ** 6]
+
+    print("%-16s %10s %12s %10s %10s %10s %10s %9s" % ("set", "n", "memory (MB)", "B/entry", "insert us",
+                                                        "hit us", "miss us", "false +"))
+    measure("tuple dict", TupleDict, 10 ** 4)
+    for count in counts:
+        # keep the digest set at most 50% full.
+        capacity = 1 << int(np.ceil(np.log2(2 * count)))
+        measure("digest 64 bit", lambda: DigestSet(capacity, digest_bits=64), count)
+        measure("digest 128 bit", lambda: DigestSet(capacity, digest_bits=128), count)
+        measure("bloom 1%", lambda: BloomFilter(count, 0.01), count)
+        measure("bloom 0.1%", lambda: BloomFilter(count, 0.001), count)
@@ -0,0 +1,69 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Latency of evaluating morphologies with a simulator process (simulator_server.py serving a synthetic fitness, which
+takes --startup-seconds to start) that is started for every robot, against one simulator_sessions.WarmSimulator
+session kept across evaluations. Start up (cold start) and evaluation (steady state) are timed separately.
+Run from the repository root: python benchmarks/bench_sessions.py [evaluations] [startup seconds]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on the path)
+from simulator_sessions import WarmSimulator, session_stats
+
+SERVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulator_server.py")
+
+
+def measure(simulator, morphologies):
+    stats = session_stats()
+    before = dict(stats)
+    latencies = []
+    for morphology in morphologies:
+        start = time.perf_counter()
+        simulator(morphology)
+        latencies.append(time.perf_counter() - start)
+    simulator.close()
+    starts = stats["starts"] - before["starts"]
+    evaluations = stats["evaluations"] - before["evaluations"]
+    return {
+        "starts": starts,
+        "start": (stats["start_seconds"] - before["start_seconds"]) / starts,
+        "evaluate": (stats["evaluate_seconds"] - before["evaluate_seconds"]) / evaluations,
+        "median": np.median(latencies),
+        "p95": np.percentile(latencies, 95),
+        "total": sum(latencies),
+    }
+
+
+if __name__ == '__main__':
+    evaluations = int(sys.argv[1]) if len(sys.argv) >= 2 else 100
+    startup = float(sys.argv[2]) if len(sys.argv) >= 3 else 0.2
+    rng = np.random.RandomState(0)
+    morphologies = [rng.randint(0, 3, size=(8, 8, 7)).astype(np.uint8) for _ in range(evaluations)]
+    command = [sys.executable, SERVER, "--synthetic-fitness", "compactness", "--startup-seconds", str(startup)]
+
+    print("%d evaluations, simulator start up %.0f ms" % (evaluations, 1000 * startup))
+    print("%24s %7s %12s %14s %12s %12s %10s" % ("", "starts", "start (ms)", "evaluate (ms)", "median (ms)",
+                                                "p95 (ms)", "total (s)"))
+    for name, max_evaluations in [("process per robot", 1), ("warm session", None)]:
+        result = measure(WarmSimulator(command, max_evaluations=max_evaluations), morphologies)
+        print("%24s %7d %12.2f %14.3f %12.3f %12.3f %10.2f"
+              % (name, result["starts"], 1000 * result["start"], 1000 * result["evaluate"], 1000 * result["median"],
+                 1000 * result["p95"], result["total"]))
@@ -0,0 +1,97 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import random
+
+# benchmarks are run as scripts from the repository root, e.g. python benchmarks/bench_pareto.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from evo.moo_interfaces import MOORobotInterface
+
+
+class ToyRobot(MOORobotInterface):
+    """
+    A robot with a random fitness and age, used to benchmark the search machinery without a simulator.
+    """
+    age_attribute = "age"
+
+    def __init__(self, seq_num, fitness=None, age=None):
+        self.seq_num = seq_num
+        self.fitness = random.random() if fitness is None else fitness
+        self.age = random.randrange(20) if age is None else age
+        self.needs_eval = True
+
+    def __repr__(self):
+        return "TOY BOT: f: %.2f age: %d -- ID: %s" % (self.fitness, self.age, self.seq_num)
+
+    def set_id(self, new_id):
+        self.seq_num = new_id
+
+    def get_id(self):
+        return self.seq_num
+
+    def get_seq_num(self):
+        return self.seq_num
+
+    def iterate_generation(self):
+        self.age += 1
+
+    def needs_evaluation(self):
+        return self.needs_eval
+
+    def mutate(self):
+        self.needs_eval = True
+        self.fitness = 0
+
+    def get_minimize_vals(self):
+        return [self.age]
+
+    def get_maximize_vals(self):
+        return [self.fitness]
+
+    def get_fitness(self):
+        return self.fitness
+
+    def dominates_final_selection(self, other):
+        return self.get_fitness() > other.get_fitness()
+
+    def compute_work(self, serial=False):
+        self.fitness = random.random()
+
+    def write_letter(self):
+        return self.fitness
+
+    def open_letter(self, letter):
+        self.fitness = letter
+        self.needs_eval = False
+
+
+def toy_population(size, seed=0):
+    random.seed(seed)
+    return [ToyRobot(i) for i in range(size)]
+
+
+def time_call(func, *args, repeats=3):
+    """
+    :return: the best wall clock time over repeats, in seconds.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
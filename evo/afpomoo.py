@@ -13,25 +13,69 @@
 # limitations under the License.
 
 
-import copy
+import time
 import random
 
-from multiprocessing import Pool
-
+from evo.instrumentation import NULL_PROFILER, Profiler, timed_call
 from evo.moo_interfaces import RobotInterface
+from evo.culling import CULL_MODES
+from evo.executors import Executor, ProcessExecutor, TaskFailed
+from evo.ids import IdAllocator
+from evo.pareto import LegacyDominanceSort, ParetoArchive, make_sorter
+from evo.population import ColumnarPopulation
 
 class AFPOMoo(object):
-    def __init__(self, robot_factory, pop_size=50, messages_file=None):
-        assert isinstance(robot_factory(), RobotInterface), 'robot_factory needs to produce robots which conform to the RobotInterface interface'
+    def __init__(self, robot_factory, pop_size=50, messages_file=None, cull_mode="legacy", executor=None,
+                 fitness_cache=None, id_allocator=None, surrogate=None, columnar=False,
+                 lineage=None, fault_tolerance=None, chunking=None, fidelity=None):
+        sample_robot = robot_factory()
+        assert isinstance(sample_robot, RobotInterface), 'robot_factory needs to produce robots which conform to the RobotInterface interface'
+        assert cull_mode in CULL_MODES, 'cull_mode must be one of %s' % sorted(CULL_MODES)
+        assert fault_tolerance is None or chunking is None, 'fault tolerance dispatches robots one at a time'
+
+        # "tournament" and "crowding" finish in bounded time, "legacy" (the default) reproduces runs from before they
+        # existed.
+        self.cull_mode = cull_mode
+        self.generation_stats = {}
 
+        # optional evo.fitness_cache.FitnessCache, consulted before robots are sent to the executor.
+        self.fitness_cache = fitness_cache
+        # optional evo.surrogate.Surrogate. Children it predicts to be poor are dropped without being simulated.
+        self.surrogate = surrogate
+        # optional evo.lineage.LineageRecorder, which streams every robot's parent and fitness to disk.
+        self.lineage = lineage
+        # optional evo.fault_tolerance.FaultTolerance: deadlines, retries, penalty letters and speculative copies.
+        self.fault_tolerance = fault_tolerance
+        # optional evo.batching.AdaptiveChunking: robots are evaluated in chunks, one task per chunk.
+        self.chunking = chunking
+        # optional evo.fidelity.MultiFidelity: children are screened at a low fidelity before being fully evaluated.
+        self.fidelity = fidelity
+
+        # per generation timings are written to messages_file as JSON lines, see evo.instrumentation.Profiler.
         self.messages_file = messages_file
+        self.profiler = Profiler(messages_file) if messages_file is not None else NULL_PROFILER
+        self.submit_times = {}
 
         self.pop_size = pop_size
         self.robot_factory = robot_factory
 
         self.students = [None] * self.pop_size
-        self.robot_id = 0
-        self.pool = Pool()
+        # keep the students in an evo.population.ColumnarPopulation, so ageing, sorting and culling large populations
+        # are array operations. self.students still behaves like a list of robots.
+        self.columnar = columnar
+        # hands out robot ids. Pass the one the robots use for their own seq nums (e.g. utils.ROBOT_IDS) to have a
+        # single sequence of ids.
+        self.id_allocator = id_allocator if id_allocator is not None else IdAllocator()
+        # the non-dominated front is kept up to date across generations instead of being recomputed.
+        self.archive = ParetoArchive()
+        self.dominating = None
+        # where evaluations run, see evo.executors. Either an Executor or a function which makes one given how many
+        # cpus each robot requests. Defaults to a process pool on this host.
+        if executor is None:
+            executor = ProcessExecutor
+        if not isinstance(executor, Executor):
+            executor = executor(cpus_per_task=sample_robot.cpus_requested())
+        self.executor = executor
         self.initialize()
 
     def __str__(self):
@@ -41,77 +85,289 @@ class AFPOMoo(object):
         for i in range(self.pop_size):
             self.students[i] = self.robot_factory()
             self.students[i].set_id(self.get_robot_id())
+        if self.columnar:
+            self.students = ColumnarPopulation(self.students)
 
     def get_robot_id(self):
-        self.robot_id += 1
-        return self.robot_id
+        return self.id_allocator()
 
     def cleanup(self):
-        self.pool.close()
+        self.executor.close()
+        self.profiler.close()
+        if self.fitness_cache is not None:
+            self.fitness_cache.close()
+        if self.lineage is not None:
+            self.lineage.close()
 
     def get_data_for_pickling(self):
         return self.students
 
     def _iterate_generation(self):
         # update generation dependent values of the students.
+        if self.columnar:
+            self.students.iterate_generation()
+            return
         for s in self.students:
             s.iterate_generation()
 
-    def _evaluate_all(self):
+    def _submit(self, student):
+        payload = student.get_work_payload()
+        if payload is None:
+            # robots which did not opt in to letter-only dispatch are pickled whole.
+            func, args = student.complete_work, (True,)
+        else:
+            func, args = type(student).complete_payload, (payload,)
+        return self._submit_call(func, *args)
+
+    def _submit_chunk(self, groups):
+        # one task evaluates the first robot of every group. It is always timed, the chunking learns from it.
+        robots = [g[0] for g in groups]
+        payloads = [r.get_work_payload() for r in robots]
+        if payloads[0] is None:
+            func, args = type(robots[0]).complete_work_batch, (robots, True)
+        else:
+            func, args = type(robots[0]).complete_payload_batch, (payloads,)
+        return self._submit_call(timed_call, func, *args)
+
+    def _submit_call(self, func, *args):
+        if not self.profiler.enabled:
+            return self.executor.submit(func, *args)
+        ticket = self.executor.submit(timed_call, func, *args)
+        self.submit_times[ticket] = time.time()
+        return ticket
+
+    def _next_completed(self, timeout=None):
+        # like Executor.next_completed, recording how long the task waited and ran when profiling.
+        with self.profiler.span("wait"):
+            try:
+                ticket, result = self.executor.next_completed(timeout)
+            except TaskFailed as e:
+                self.submit_times.pop(e.ticket, None)
+                raise
+        if not self.profiler.enabled:
+            return ticket, result
+        letter, started, finished, pid = result
+        self.profiler.record_task(self.submit_times.pop(ticket), started, finished, pid)
+        return ticket, letter
+
+    def _dispatch(self, students_to_evaluate, submit=None):
+        """
+        Submits the robots which need to be evaluated.
+        :param submit: function robot -> ticket, defaults to sending the robot to the executor.
+        :return: (ticket -> robots waiting for that letter, number of robots which share a body with another one)
+        """
+        submit = submit if submit is not None else self._submit
+        if self.fitness_cache is None:
+            return {submit(s): [s] for s in students_to_evaluate}, 0
+
+        # robots whose body was evaluated before get their letter from the cache, and robots sharing a body
+        # which is not cached yet are only evaluated once.
+        tickets = {}
+        waiting = {}
+        duplicates = 0
+        for s in students_to_evaluate:
+            key = s.get_cache_key()
+            if key is None:
+                tickets[submit(s)] = [s]
+            elif key in waiting:
+                waiting[key].append(s)
+                duplicates += 1
+            else:
+                letter = self.fitness_cache.get(key)
+                if letter is not None:
+                    s.open_letter(letter)
+                else:
+                    waiting[key] = [s]
+                    tickets[submit(s)] = waiting[key]
+        return tickets, duplicates
+
+    def _deliver(self, students, letter, cache=True):
+        for s in students:
+            s.open_letter(letter)
+        if cache and self.fitness_cache is not None and students[0].get_cache_key() is not None:
+            self.fitness_cache.put(students[0].get_cache_key(), letter)
+
+    def _evaluate_chunks(self, groups):
+        size = self.chunking.chunk_size(len(groups), self.executor.workers)
+        with self.profiler.span("dispatch"):
+            tickets = {self._submit_chunk(chunk): chunk for chunk in self.chunking.split(groups, size)}
+        self.generation_stats["chunk_size"] = size
+        self.generation_stats["chunks"] = self.generation_stats.get("chunks", 0) + len(tickets)
+        while tickets:
+            ticket, (letters, started, finished, pid) = self._next_completed()
+            chunk = tickets.pop(ticket)
+            self.chunking.observe(len(chunk), finished - started)
+            for students, letter in zip(chunk, letters):
+                self._deliver(students, letter)
+
+    def _evaluate(self, students_to_evaluate):
+        """
+        Evaluates robots at their current fidelity.
+        :return: (ids of the robots which got a penalty letter, number of robots which shared a body with another one)
+        """
+        penalties = set()
+        if self.chunking is not None:
+            with self.profiler.span("dispatch"):
+                groups, duplicates = self._dispatch(students_to_evaluate, submit=id)
+            self._evaluate_chunks(list(groups.values()))
+        elif self.fault_tolerance is None:
+            with self.profiler.span("dispatch"):
+                tickets, duplicates = self._dispatch(students_to_evaluate)
+            # letters are opened as soon as they come back.
+            while tickets:
+                ticket, letter = self._next_completed()
+                self._deliver(tickets.pop(ticket), letter)
+        else:
+            # the fault tolerance submits the robots itself, a few at a time.
+            groups, duplicates = self._dispatch(students_to_evaluate, submit=id)
+            for students, letter, penalized in self.fault_tolerance.evaluate(self.executor, list(groups.values()),
+                                                                             self._submit, self._next_completed):
+                self._deliver(students, letter, cache=not penalized)
+                if penalized:
+                    penalties.update(id(s) for s in students)
+            for k, v in self.fault_tolerance.reset_stats().items():
+                self.generation_stats["dispatch_" + k] = self.generation_stats.get("dispatch_" + k, 0) + v
+        self.generation_stats["evaluations"] = self.generation_stats.get("evaluations", 0) + len(students_to_evaluate)
+        return penalties, duplicates
+
+    def _discard(self, students):
+        if self.columnar:
+            self.students.discard(students)
+        else:
+            students = set(id(s) for s in students)
+            self.students = [s for s in self.students if id(s) not in students]
+
+    def _evaluate_all(self, children=()):
         # get the robots to evaluate, store how many simulations each robot needs.
-        students_to_evaluate = [s for s in self.students if s.needs_evaluation()]
-        results = [self.pool.apply_async(s.complete_work, (True,)) for s in students_to_evaluate]
-        for student, result in zip(students_to_evaluate, results):
-            student.open_letter(result.get())
+        # only the mutated children are screened by the surrogate, never the random immigrant.
+        if self.columnar:
+            students_to_evaluate = self.students.needing_evaluation()
+        else:
+            students_to_evaluate = [s for s in self.students if s.needs_evaluation()]
+        candidates = students_to_evaluate
+
+        if self.surrogate is not None:
+            with self.profiler.span("screen"):
+                screened = set(id(c) for c in children)
+                others = [s for s in students_to_evaluate if id(s) not in screened]
+                students_to_evaluate, rejected = self.surrogate.screen([s for s in students_to_evaluate
+                                                                        if id(s) in screened])
+                students_to_evaluate = others + students_to_evaluate
+            if rejected:
+                self._discard(rejected)
+
+        # robots sharing a body with another one, at either fidelity.
+        duplicates = [0]
+        if self.fidelity is not None:
+            # the low fidelity evaluations are counted in the evaluation stats too.
+            def evaluate(students):
+                duplicates[0] += self._evaluate(students)[1]
+            if self.columnar:
+                # the front is compared with the children as robots, so it needs the ages of this generation.
+                self.students.sync_ages(self.dominating)
+            students_to_evaluate, rejected = self.fidelity.screen(students_to_evaluate, self.dominating, evaluate)
+            if rejected:
+                self._discard(rejected)
+            self.generation_stats.update(("fidelity_" + k, v) for k, v in self.fidelity.reset_stats().items())
+
+        penalties, full_duplicates = self._evaluate(students_to_evaluate)
+        duplicates = duplicates[0] + full_duplicates
+        if self.columnar:
+            self.students.refresh()
+
+        if self.lineage is not None:
+            # including the robots which were dropped, without a fitness.
+            with self.profiler.span("lineage"):
+                for s in candidates:
+                    self.lineage.evaluated(s)
+        if self.surrogate is not None:
+            # a penalty says nothing about how good the body is.
+            self.surrogate.observe([s for s in students_to_evaluate if id(s) not in penalties])
+
+        if self.fitness_cache is not None:
+            self.fitness_cache.flush()
+            hits, misses = self.fitness_cache.reset_stats()
+            self.generation_stats.update({"cache_hits": hits, "cache_misses": misses, "cache_duplicates": duplicates})
+
+    def _front(self, sorter):
+        """
+        :return: sorted indices of the non-dominated students.
+        """
+        if isinstance(sorter, LegacyDominanceSort):
+            return sorter.front()
+        if self.columnar:
+            return self.students.front(self.archive)
+        return self.archive.sync(self.students)
 
     def generation(self):
+        self.generation_stats = {}
+        profiler = self.profiler
+        if self.columnar and not isinstance(self.students, ColumnarPopulation):
+            # e.g. a checkpoint restored a plain list.
+            self.students = ColumnarPopulation(self.students)
+
         # update the generation dependent behavioral_sem_error of the bots.
-        self._iterate_generation()
+        with profiler.span("iterate"):
+            self._iterate_generation()
 
         # add a new Student even if the population already is full.
-        new_student = self.robot_factory()
-        new_student.set_id(self.get_robot_id())
-        self.students.append(new_student)
+        with profiler.span("immigrant"):
+            new_student = self.robot_factory()
+            new_student.set_id(self.get_robot_id())
+            self.students.append(new_student)
 
-        # expand the population.
-        while len(self.students) < self.pop_size * 2:
+        # expand the population. parents are only drawn from the first pop_size students, so the children can be
+        # added all at once.
+        children = []
+        while len(self.students) + len(children) < self.pop_size * 2:
             parent_index = random.randrange(0, self.pop_size)
-            new_student = copy.deepcopy(self.students[parent_index])
-            new_student.mutate()
+            with profiler.span("clone"):
+                parent = self.students[parent_index]
+                new_student = parent.clone_for_mutation()
+            with profiler.span("mutate"):
+                new_student.mutate()
             new_student.set_id(self.get_robot_id())
-            self.students.append(new_student)
+            children.append(new_student)
+            if self.lineage is not None:
+                self.lineage.born(new_student, parent.get_id())
+        self.students.extend(children)
 
         # evaluate all robots
-        self._evaluate_all()
-
-        numb_students = self.pop_size * 2
+        with profiler.span("evaluate"):
+            self._evaluate_all(children)
 
-        dominating_individuals = 0
-        dom_ind = []
+        # fewer than pop_size * 2 if the surrogate dropped some children.
+        numb_students = len(self.students)
 
         # calculate real number of dominating individuals.
-        for s in range(len(self.students)):
-            dominated = False
-            for t in range(len(self.students)):
-                if self.students[t].dominates(self.students[s]):
-                    dominated = True
-                    break
-            if not dominated:
-                dom_ind.append(self.students[s])
-                dominating_individuals += 1
-
-        while numb_students > max(self.pop_size, dominating_individuals):
-            i1 = random.randrange(len(self.students))
-            i2 = random.randrange(len(self.students))
-            if i1 == i2:
-                continue
-            if self.students[i1] is None or self.students[i2] is None:
-                continue
-            if self.students[i1].dominates(self.students[i2]):
-                self.students[i2] = None
-                numb_students -= 1
-        # compress the population
-        self.students = [p for p in self.students if p is not None]
+        archive_comparisons = self.archive.comparisons
+        with profiler.span("dominance"):
+            sorter = self.students.sorter() if self.columnar else make_sorter(self.students)
+            dom_ind = [self.students[i] for i in self._front(sorter)]
+            dominating_individuals = len(dom_ind)
+
+        with profiler.span("cull"):
+            cull_comparisons = CULL_MODES[self.cull_mode](self.students, sorter,
+                                                          max(self.pop_size, dominating_individuals),
+                                                          numb_students=numb_students)
+        if self.surrogate is not None:
+            self.surrogate.record_front(dom_ind)
+            self.generation_stats.update(("surrogate_" + k, v) for k, v in self.surrogate.reset_stats().items())
+        self.generation_stats.update({"dominance_comparisons": sorter.comparisons,
+                                      "cull_comparisons": cull_comparisons,
+                                      "archive_comparisons": self.archive.comparisons - archive_comparisons})
+        profiler.end_generation(population=len(self.students), front=dominating_individuals,
+                                stats=self.generation_stats)
+
+        # compress the population. culling never removes a member of the front.
+        if self.columnar:
+            self.students.compact()
+        else:
+            self.students = [p for p in self.students if p is not None]
+        self.dominating = dom_ind
+        if self.lineage is not None:
+            with profiler.span("lineage"):
+                self.lineage.end_generation(self.students, dom_ind, self.generation_stats["evaluations"])
 
         # print warnings if necessary
         if dominating_individuals >= 2 * self.pop_size:
@@ -130,8 +386,9 @@ class AFPOMoo(object):
         return bots
 
     def get_best(self):
+        # the best robot is not dominated, so after a generation only the front needs to be searched.
         best_student = None
-        for s in self.students:
+        for s in self.dominating if self.dominating else self.students:
             if best_student is None:
                 best_student = s
             if s is not None and s.dominates_final_selection(best_student):
@@ -0,0 +1,157 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+import time
+
+from evo.afpomoo import AFPOMoo
+from evo.culling import CULL_MODES
+from evo.pareto import make_sorter
+
+
+class AsyncAFPOMoo(AFPOMoo):
+    """
+    Steady-state AFPO. Instead of waiting for a whole generation of children, every time an evaluation finishes the
+    child is inserted, the population is culled against the current front and a new mutant is submitted, so the
+    executor never runs out of work because of one slow simulation.
+
+    Ages move on a per-evaluation clock: every pop_size completed evaluations counts as one generation, which calls
+    iterate_generation on every robot (including the ones being evaluated) and adds one random immigrant.
+
+    A fitness_cache works as in AFPOMoo, except that robots sharing a body which are in flight at the same time are
+    each evaluated. Surrogate screening ranks whole generations of children, so there is none.
+    """
+    def __init__(self, robot_factory, pop_size=50, messages_file=None, cull_mode="legacy", executor=None,
+                 queue_depth=None, id_allocator=None, lineage=None, fitness_cache=None):
+        """
+        :param queue_depth: number of evaluations to keep submitted at once, defaults to twice the executor's workers.
+        """
+        self.in_flight = {}
+        self.pending = []
+        # robots which got their letter from the fitness cache, to be inserted by the next steps.
+        self.cached = []
+        self.evaluations = 0
+        self.cull_comparisons = 0
+        self.start_time = None
+        AFPOMoo.__init__(self, robot_factory, pop_size=pop_size, messages_file=messages_file, cull_mode=cull_mode,
+                         executor=executor, id_allocator=id_allocator, lineage=lineage, fitness_cache=fitness_cache)
+        self.queue_depth = queue_depth if queue_depth is not None else 2 * self.executor.workers
+
+    def initialize(self):
+        # the initial robots join the population once they have been evaluated.
+        self.students = []
+        for i in range(self.pop_size):
+            robot = self.robot_factory()
+            robot.set_id(self.get_robot_id())
+            self.pending.append(robot)
+
+    def _iterate_generation(self):
+        for s in self.students + list(self.in_flight.values()) + self.pending:
+            s.iterate_generation()
+
+        immigrant = self.robot_factory()
+        immigrant.set_id(self.get_robot_id())
+        self.pending.append(immigrant)
+
+    def _fill(self):
+        while len(self.in_flight) < self.queue_depth and not self.cached:
+            if self.pending:
+                robot = self.pending.pop(0)
+            elif self.students:
+                parent = self.students[random.randrange(len(self.students))]
+                robot = parent.clone_for_mutation()
+                robot.mutate()
+                robot.set_id(self.get_robot_id())
+                if self.lineage is not None:
+                    self.lineage.born(robot, parent.get_id())
+            else:
+                robot = self.robot_factory()
+                robot.set_id(self.get_robot_id())
+            key = robot.get_cache_key() if self.fitness_cache is not None else None
+            letter = self.fitness_cache.get(key) if key is not None else None
+            if letter is not None:
+                robot.open_letter(letter)
+                self.cached.append(robot)
+                continue
+            with self.profiler.span("dispatch"):
+                self.in_flight[self._submit(robot)] = robot
+
+    def _cull(self):
+        if len(self.students) <= self.pop_size:
+            return
+        with self.profiler.span("dominance"):
+            sorter = make_sorter(self.students)
+            target = max(self.pop_size, len(self._front(sorter)))
+        with self.profiler.span("cull"):
+            self.cull_comparisons += CULL_MODES[self.cull_mode](self.students, sorter, target)
+        self.students = [s for s in self.students if s is not None]
+
+    def step(self):
+        """
+        Waits for one evaluation to finish and inserts the robot into the population.
+        :return: the robot which was just evaluated
+        """
+        if self.start_time is None:
+            self.start_time = time.time()
+        self._fill()
+
+        if self.cached:
+            robot = self.cached.pop(0)
+        else:
+            ticket, letter = self._next_completed()
+            robot = self.in_flight.pop(ticket)
+            self._deliver([robot], letter)
+        self.students.append(robot)
+        if self.lineage is not None:
+            self.lineage.evaluated(robot)
+        self.evaluations += 1
+
+        self._cull()
+        if self.evaluations % self.pop_size == 0:
+            self._iterate_generation()
+        self._fill()
+        return robot
+
+    def generation(self):
+        """
+        Runs pop_size evaluations, i.e. one generation on the per-evaluation clock.
+        :return: (number of dominating individuals, the dominating individuals), like AFPOMoo.generation
+        """
+        start = time.time()
+        self.cull_comparisons = 0
+        archive_comparisons = self.archive.comparisons
+        for _ in range(self.pop_size):
+            self.step()
+        elapsed = time.time() - start
+
+        sorter = make_sorter(self.students)
+        dom_ind = [self.students[i] for i in self._front(sorter)]
+        self.dominating = dom_ind
+        self.generation_stats = {
+            "dominance_comparisons": sorter.comparisons,
+            "cull_comparisons": self.cull_comparisons,
+            "archive_comparisons": self.archive.comparisons - archive_comparisons,
+            "evaluations": self.pop_size,
+            "evaluations_per_second": self.pop_size / elapsed if elapsed > 0 else float("inf"),
+            "total_evaluations_per_second": self.evaluations / max(time.time() - self.start_time, 1e-9),
+        }
+        if self.fitness_cache is not None:
+            self.fitness_cache.flush()
+            hits, misses = self.fitness_cache.reset_stats()
+            self.generation_stats.update({"cache_hits": hits, "cache_misses": misses, "cache_duplicates": 0})
+        if self.lineage is not None:
+            self.lineage.end_generation(self.students, dom_ind, self.pop_size)
+        self.profiler.end_generation(population=len(self.students), front=len(dom_ind), in_flight=len(self.in_flight),
+                                     stats=self.generation_stats)
+        return len(dom_ind), dom_ind
@@ -0,0 +1,85 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+
+class AdaptiveChunking(object):
+    """
+    Sends robots to the executor in chunks, one task per chunk (see Work.complete_work_batch), so pickling, IPC and
+    scheduling are paid once per chunk instead of once per robot when evaluations are short.
+
+    The chunk size is picked every generation so a chunk takes about target_seconds of a worker's time, using a moving
+    average of the seconds per robot the workers reported for earlier chunks. It is capped so every worker still gets
+    min_chunks_per_worker chunks, which keeps them all busy when evaluation times vary. Until something was measured
+    chunks hold initial_size robots.
+    """
+    def __init__(self, target_seconds=0.05, initial_size=1, max_size=1024, min_chunks_per_worker=2, smoothing=0.3,
+                 fixed_size=None):
+        """
+        :param target_seconds: how long a chunk should keep a worker busy.
+        :param initial_size: chunk size before any chunk was timed.
+        :param max_size: largest chunk.
+        :param min_chunks_per_worker: chunks each worker should get, when there are enough robots.
+        :param smoothing: weight of the newest measurement in the moving average.
+        :param fixed_size: always use this chunk size instead of adapting it.
+        """
+        self.target_seconds = target_seconds
+        self.initial_size = initial_size
+        self.max_size = max_size
+        self.min_chunks_per_worker = min_chunks_per_worker
+        self.smoothing = smoothing
+        self.fixed_size = fixed_size
+        self.seconds_per_robot = None
+
+    def chunk_size(self, robots, workers):
+        """
+        :param robots: how many robots are about to be evaluated.
+        :param workers: how many tasks the executor runs at the same time.
+        :return: how many robots to put in each chunk.
+        """
+        if self.fixed_size is not None:
+            return self.fixed_size
+        if self.seconds_per_robot is None:
+            size = self.initial_size
+        elif self.seconds_per_robot <= 0:
+            size = self.max_size
+        else:
+            size = int(self.target_seconds / self.seconds_per_robot)
+        size = min(size, math.ceil(robots / (workers * self.min_chunks_per_worker)))
+        return max(1, min(size, self.max_size))
+
+    def observe(self, robots, seconds):
+        """
+        Records how long a worker took to evaluate a chunk.
+        :param robots: number of robots in the chunk.
+        :param seconds: time between the worker starting and finishing the chunk.
+        """
+        per_robot = seconds / robots
+        if self.seconds_per_robot is None:
+            self.seconds_per_robot = per_robot
+        else:
+            self.seconds_per_robot += self.smoothing * (per_robot - self.seconds_per_robot)
+
+    def split(self, groups, size):
+        """
+        :param groups: lists of robots which share a letter (see AFPOMoo._dispatch). The first of each is evaluated.
+        :return: lists of at most size groups whose robots can be evaluated by one call: the same class, and all or
+                 none of them have a work payload.
+        """
+        kinds = {}
+        for group in groups:
+            robot = group[0]
+            kinds.setdefault((type(robot), robot.get_work_payload() is None), []).append(group)
+        return [chunk[i:i + size] for chunk in kinds.values() for i in range(0, len(chunk), size)]
@@ -0,0 +1,189 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import zlib
+import pickle
+import random
+
+import numpy as np
+
+from evo.pareto import ParetoArchive
+
+MANIFEST = "checkpoint.pkl"
+
+
+def _atomic_write(path, data):
+    # write next to the destination and rename over it, so a crash never leaves a half written file behind.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpointer(object):
+    """
+    Incremental snapshots of an AFPOMoo run, stored in a directory as
+      robots_<n>.pkl.z: zlib compressed pickle of the robots which were new in snapshot n.
+      journal_<n>.pkl.z: zlib compressed pickle of what the caller added to state kept outside of the algorithm
+                        since snapshot n - 1, e.g. the morphologies seen. Journals are kept for good, load_journal
+                        replays them.
+      checkpoint.pkl:   zlib compressed pickle of which segment holds each live robot, which of them are on the
+                        front, what changed about the live robots since they were written (see
+                        RobotInterface.get_checkpoint_state), the algorithm's counters, the states of the random and
+                        numpy random generators and anything else the caller needs to resume.
+    A segment is deleted once none of its robots are alive any more.
+    """
+    def __init__(self, directory, every=1):
+        """
+        :param directory: where to keep the snapshots. Created if needed.
+        :param every: save every this many generations.
+        """
+        self.directory = directory
+        self.every = every
+        os.makedirs(directory, exist_ok=True)
+        self.segments = {}  # robot id -> segment number
+        self.next_segment = 0
+        self.journals = 0
+        self.last_save_seconds = 0.0
+        self.last_save_robots = 0
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.directory, MANIFEST))
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, "robots_%d.pkl.z" % segment)
+
+    def _journal_path(self, journal):
+        return os.path.join(self.directory, "journal_%d.pkl.z" % journal)
+
+    def maybe_save(self, algorithm, generation, extra=None, journal=None):
+        """
+        Saves if generation is a multiple of every. extra and journal may be functions returning them, which are only
+        called when a snapshot is written.
+        :return: True if a snapshot was written.
+        """
+        if (generation + 1) % self.every != 0:
+            return False
+        self.save(algorithm, generation, extra() if callable(extra) else extra,
+                  journal() if callable(journal) else journal)
+        return True
+
+    def save(self, algorithm, generation, extra=None, journal=None):
+        """
+        :param algorithm: the AFPOMoo to save.
+        :param generation: the last generation which was completed.
+        :param extra: anything else to restore on resume, e.g. counters kept outside of the algorithm.
+        :param journal: what was added to some state kept outside of the algorithm since the last snapshot, so large
+                        state which only grows is not written out in full every time. None if nothing was added.
+        """
+        start = time.time()
+        students = algorithm.students
+
+        # robots which are new, or which can not tell us what changed about them, are written out in full.
+        new_robots = {}
+        dynamic = {}
+        for s in students:
+            state = s.get_checkpoint_state()
+            if s.get_id() not in self.segments or state is None:
+                new_robots[s.get_id()] = s
+            else:
+                dynamic[s.get_id()] = state
+
+        if new_robots:
+            segment = self.next_segment
+            self.next_segment += 1
+            data = zlib.compress(pickle.dumps(new_robots, protocol=pickle.HIGHEST_PROTOCOL))
+            _atomic_write(self._segment_path(segment), data)
+            for robot_id in new_robots:
+                self.segments[robot_id] = segment
+
+        if journal is not None:
+            # a journal written by a snapshot which did not get to write its manifest is overwritten.
+            _atomic_write(self._journal_path(self.journals),
+                          zlib.compress(pickle.dumps(journal, protocol=pickle.HIGHEST_PROTOCOL)))
+            self.journals += 1
+
+        live_ids = [s.get_id() for s in students]
+        old_segments = set(self.segments.values())
+        self.segments = {robot_id: self.segments[robot_id] for robot_id in live_ids}
+
+        manifest = {
+            "generation": generation,
+            "students": live_ids,
+            "front": None if algorithm.dominating is None else [s.get_id() for s in algorithm.dominating],
+            "segments": self.segments,
+            "dynamic": dynamic,
+            "next_segment": self.next_segment,
+            "journals": self.journals,
+            "next_robot_id": algorithm.id_allocator.get_state(),
+            "random_state": random.getstate(),
+            "numpy_random_state": np.random.get_state(),
+            "extra": extra,
+        }
+        _atomic_write(os.path.join(self.directory, MANIFEST),
+                      zlib.compress(pickle.dumps(manifest, protocol=pickle.HIGHEST_PROTOCOL)))
+
+        # only once the new manifest is in place is it safe to drop segments nobody refers to.
+        for segment in old_segments - set(self.segments.values()):
+            os.remove(self._segment_path(segment))
+
+        self.last_save_robots = len(new_robots)
+        self.last_save_seconds = time.time() - start
+
+    def load(self, algorithm):
+        """
+        Restores the population, counters and random states saved last into algorithm.
+        :return: (the last generation which was completed, the extra data passed to save)
+        """
+        with open(os.path.join(self.directory, MANIFEST), "rb") as f:
+            manifest = pickle.loads(zlib.decompress(f.read()))
+
+        robots = {}
+        for segment in sorted(set(manifest["segments"].values())):
+            with open(self._segment_path(segment), "rb") as f:
+                robots.update(pickle.loads(zlib.decompress(f.read())))
+
+        students = []
+        for robot_id in manifest["students"]:
+            robot = robots[robot_id]
+            if robot_id in manifest["dynamic"]:
+                robot.set_checkpoint_state(manifest["dynamic"][robot_id])
+            students.append(robot)
+
+        algorithm.students = students
+        # the front of the last generation, e.g. what children are screened against, is made of restored students.
+        # the archive works it out again.
+        by_id = {s.get_id(): s for s in students}
+        algorithm.dominating = None if manifest["front"] is None else [by_id[i] for i in manifest["front"]]
+        algorithm.archive = ParetoArchive()
+        algorithm.id_allocator.set_state(manifest["next_robot_id"])
+        random.setstate(manifest["random_state"])
+        np.random.set_state(manifest["numpy_random_state"])
+
+        self.segments = dict(manifest["segments"])
+        self.next_segment = manifest["next_segment"]
+        self.journals = manifest["journals"]
+        return manifest["generation"], manifest["extra"]
+
+    def load_journal(self):
+        """
+        :return: iterator over the journals saved up to the snapshot loaded last, oldest first.
+        """
+        for journal in range(self.journals):
+            with open(self._journal_path(journal), "rb") as f:
+                yield pickle.loads(zlib.decompress(f.read()))
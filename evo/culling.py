@@ -0,0 +1,110 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import numpy as np
+
+from evo.pareto import crowding_distance
+
+# Every cull function removes students (by setting their slot to None) until at most target remain, never removes a
+# member of the non-dominated front and returns the number of pairwise comparisons it made.
+
+
+def cull_legacy(students, sorter, target, numb_students=None):
+    """
+    The original culling: draw random pairs until enough students have been dominated.
+    The running time is unbounded when few pairs are comparable. Kept so old runs can be reproduced.
+    """
+    if numb_students is None:
+        numb_students = len(students)
+    comparisons = 0
+    while numb_students > target:
+        i1 = random.randrange(len(students))
+        i2 = random.randrange(len(students))
+        if i1 == i2:
+            continue
+        if students[i1] is None or students[i2] is None:
+            continue
+        comparisons += 1
+        if sorter.dominates(i1, i2):
+            students[i2] = None
+            numb_students -= 1
+    return comparisons
+
+
+def cull_tournament(students, sorter, target, numb_students=None):
+    """
+    Random tournaments drawn only from live, comparable pairs: pick a live dominated student and a live student that
+    it dominates or is dominated by, and remove whichever of the two loses.
+    Every tournament removes one student, so exactly len(students) - target tournaments are run.
+    """
+    alive = np.array([s is not None for s in students])
+    candidates = list(np.flatnonzero(alive & (sorter.dominator_counts() > 0)))
+    position = {c: i for i, c in enumerate(candidates)}
+    comparisons = 0
+    numb_students = int(alive.sum())
+    while numb_students > target and candidates:
+        a = candidates[random.randrange(len(candidates))]
+        comparable = sorter.dominated_by([a])[0]
+        comparable[sorter.dominators_of(a)] = True
+        rivals = np.flatnonzero(comparable & alive)
+        b = rivals[random.randrange(len(rivals))]
+
+        comparisons += 1
+        loser = b if sorter.dominates(a, b) else a
+        students[loser] = None
+        alive[loser] = False
+        numb_students -= 1
+
+        # the loser was dominated, so it is a candidate. Swap it to the end of the list and drop it.
+        i = position.pop(loser)
+        last = candidates.pop()
+        if last != loser:
+            candidates[i] = last
+            position[last] = i
+    return comparisons
+
+
+def cull_crowding(students, sorter, target, numb_students=None):
+    """
+    Deterministic NSGA-II style truncation: keep whole fronts in rank order, then fill the remaining room from the
+    next front by crowding distance (larger first), breaking ties by seq num.
+    """
+    if len(students) <= target:
+        return 0
+    ranks = sorter.ranks()
+    # the whole fronts which fit, found at once since large populations can have thousands of fronts.
+    whole = int(np.searchsorted(np.cumsum(np.bincount(ranks)), target, side="right"))
+    survivors = ranks < whole
+    members = np.flatnonzero(ranks == whole)
+    room = target - int(survivors.sum())
+    if len(members):
+        if sorter.objectives is not None:
+            distance = crowding_distance(sorter.objectives[members])
+        else:
+            distance = np.zeros(len(members))
+        order = np.lexsort((sorter.seq_nums[members], -distance))
+        survivors[members[order[:room]]] = True
+
+    for i in np.flatnonzero(~survivors):
+        students[i] = None
+    return 0
+
+
+CULL_MODES = {
+    "legacy": cull_legacy,
+    "tournament": cull_tournament,
+    "crowding": cull_crowding,
+}
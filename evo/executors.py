@@ -0,0 +1,340 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import queue
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, Process, cpu_count
+from multiprocessing.connection import Client, Listener
+
+
+class TaskFailed(Exception):
+    """
+    Raised by Executor.next_completed when a task raised instead of returning. The original error is the __cause__.
+    """
+    def __init__(self, ticket, error):
+        Exception.__init__(self, "task %d failed: %r" % (ticket, error))
+        self.ticket = ticket
+        self.error = error
+
+
+class TaskTimedOut(TaskFailed):
+    """
+    A task which ran past its deadline, see evo.fault_tolerance.FaultTolerance.
+    """
+    def __init__(self, ticket, seconds):
+        TaskFailed.__init__(self, ticket, TimeoutError("no result after %.1f s" % seconds))
+
+
+class Executor(object):
+    """
+    Runs functions somewhere and hands back their results in the order they complete.
+    Functions and arguments must be picklable for every executor except SerialExecutor and ThreadExecutor.
+    """
+    def __init__(self):
+        self._results = queue.Queue()
+        self._next_ticket = 0
+
+    @property
+    def workers(self):
+        """
+        :return: how many tasks can run at the same time.
+        """
+        raise NotImplementedError
+
+    def submit(self, func, *args):
+        """
+        Schedules func(*args).
+        :return: a ticket identifying the task in next_completed.
+        """
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._dispatch(ticket, func, args)
+        return ticket
+
+    def _dispatch(self, ticket, func, args):
+        raise NotImplementedError
+
+    def _done(self, ticket, ok, value):
+        self._results.put((ticket, ok, value))
+
+    def next_completed(self, timeout=None):
+        """
+        Blocks until a task completes.
+        :param timeout: seconds to wait, or None to wait forever. Raises queue.Empty when it runs out.
+        :return: (ticket, result) of the completed task.
+        """
+        ticket, ok, value = self._results.get(timeout=timeout)
+        if not ok:
+            raise TaskFailed(ticket, value) from value
+        return ticket, value
+
+    def cancel(self, ticket):
+        """
+        Gives up on a task. Its result may still arrive through next_completed.
+        :return: set of tickets whose workers this freed, which may include tasks cancelled earlier. Empty if the task
+                 keeps its worker busy until it finishes, which is all most executors can do.
+        """
+        return set()
+
+    def map_unordered(self, func, args_list):
+        """
+        :return: generator of (index into args_list, result) in the order the tasks complete.
+        """
+        tickets = {self.submit(func, *args): i for i, args in enumerate(args_list)}
+        while tickets:
+            ticket, result = self.next_completed()
+            yield tickets.pop(ticket), result
+
+    def close(self):
+        pass
+
+
+class SerialExecutor(Executor):
+    """
+    Runs every task immediately in the calling process. Useful for debugging and profiling.
+    """
+    @property
+    def workers(self):
+        return 1
+
+    def _dispatch(self, ticket, func, args):
+        try:
+            self._done(ticket, True, func(*args))
+        except Exception as e:
+            self._done(ticket, False, e)
+
+
+class ProcessExecutor(Executor):
+    """
+    A multiprocessing Pool bounded by how many cpus each task asks for.
+    """
+    def __init__(self, processes=None, cpus_per_task=1):
+        """
+        :param processes: number of cpus to use, defaults to all of them on this host.
+        :param cpus_per_task: cpus used by each task, i.e. Work.cpus_requested()
+        """
+        Executor.__init__(self)
+        self.processes = max(1, (processes or cpu_count()) // max(1, cpus_per_task))
+        self.pool = Pool(self.processes)
+        # tasks are kept until they finish, so they can be run again on a new pool.
+        self._outstanding = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    @property
+    def workers(self):
+        return self.processes
+
+    def _dispatch(self, ticket, func, args):
+        with self._lock:
+            self._outstanding[ticket] = (func, args)
+        self._apply(self.pool, ticket, func, args)
+
+    def _apply(self, pool, ticket, func, args):
+        pool.apply_async(func, args,
+                         callback=lambda value: self._finished(pool, ticket, True, value),
+                         error_callback=lambda e: self._finished(pool, ticket, False, e))
+
+    def _finished(self, pool, ticket, ok, value):
+        with self._lock:
+            if pool is not self.pool:
+                # the pool was replaced and the task was run again on the new one.
+                return
+            self._outstanding.pop(ticket, None)
+            self._cancelled.discard(ticket)
+        self._done(ticket, ok, value)
+
+    def cancel(self, ticket):
+        """
+        A Pool can not stop a single task, so cancelled tasks keep their workers. Once every worker is stuck on a
+        cancelled task (e.g. a hung simulator) the pool is replaced, and the tasks which were not cancelled run again.
+        Cancelled tasks which had not started yet are dropped with it.
+        """
+        with self._lock:
+            if ticket not in self._outstanding:
+                return set()
+            self._cancelled.add(ticket)
+            # the pool runs tasks in the order they were given to it, so the oldest outstanding tasks are the running
+            # ones. cancelled tasks which are still queued do not hold a worker.
+            running = set(list(self._outstanding)[:self.processes])
+            if len(self._cancelled & running) < self.processes:
+                return set()
+            freed = self._cancelled
+            for t in freed:
+                del self._outstanding[t]
+            self._cancelled = set()
+            old, self.pool = self.pool, Pool(self.processes)
+            restart = list(self._outstanding.items())
+        old.terminate()
+        for t, (func, args) in restart:
+            self._apply(self.pool, t, func, args)
+        return freed
+
+    def close(self):
+        self.pool.close()
+
+
+class ThreadExecutor(Executor):
+    """
+    A thread pool. Only useful when the work releases the GIL, e.g. a simulator called through a C extension or a
+    subprocess.
+    """
+    def __init__(self, threads=None, cpus_per_task=1):
+        Executor.__init__(self)
+        self.threads = max(1, (threads or cpu_count()) // max(1, cpus_per_task))
+        self.pool = ThreadPoolExecutor(self.threads)
+        self._futures = {}
+
+    @property
+    def workers(self):
+        return self.threads
+
+    def _dispatch(self, ticket, func, args):
+        def done(future):
+            self._futures.pop(ticket, None)
+            if future.cancelled():
+                return
+            error = future.exception()
+            self._done(ticket, error is None, error if error is not None else future.result())
+        future = self.pool.submit(func, *args)
+        self._futures[ticket] = future
+        future.add_done_callback(done)
+        if future.done():
+            # done ran before the future was stored.
+            self._futures.pop(ticket, None)
+
+    def cancel(self, ticket):
+        # only tasks which have not started yet can be stopped.
+        future = self._futures.get(ticket)
+        return {ticket} if future is not None and future.cancel() else set()
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+class WorkerFarmExecutor(Executor):
+    """
+    Sends tasks over TCP to worker processes which may join from any node at any time (see run_workers).
+    Each connected worker runs one task at a time. If a worker disconnects, its task is given to another worker.
+    Tasks are pickled, so only let trusted workers connect: the authkey is used to authenticate every connection.
+    """
+    def __init__(self, address=("localhost", 0), authkey=None):
+        """
+        :param address: (host, port) to listen on. Port 0 picks a free port, see self.address.
+        :param authkey: shared secret bytes. Defaults to a random key, which is only useful for workers started by
+        this process.
+        """
+        Executor.__init__(self)
+        self.authkey = authkey if authkey is not None else os.urandom(16)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self._tasks = queue.Queue()
+        self._connected = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def workers(self):
+        return max(1, self._connected)
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                conn = self.listener.accept()
+            except Exception as e:
+                # either the listener was closed, or a worker failed to authenticate (e.g. it has another authkey).
+                if not self._closed:
+                    print("WARNING: a farm worker could not connect: %r" % e, file=sys.stderr)
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with self._lock:
+            self._connected += 1
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    # passed on, so that every worker stops, including ones which connect while the farm closes.
+                    self._tasks.put(None)
+                    conn.send(None)
+                    return
+                try:
+                    conn.send(task[1:])
+                    ok, value = conn.recv()
+                except (EOFError, OSError):
+                    # the worker went away, let somebody else do its task.
+                    self._tasks.put(task)
+                    return
+                except Exception as e:
+                    # the task could not be pickled (or its result unpickled). Messages are pickled whole before
+                    # they are sent, so the connection is still fine.
+                    ok, value = False, e
+                self._done(task[0], ok, value)
+        finally:
+            with self._lock:
+                self._connected -= 1
+            conn.close()
+
+    def _dispatch(self, ticket, func, args):
+        self._tasks.put((ticket, func, args))
+
+    def close(self):
+        self._closed = True
+        self._tasks.put(None)
+        self.listener.close()
+
+
+def run_worker(address, authkey):
+    """
+    Connects to a WorkerFarmExecutor and completes tasks until it is closed.
+    """
+    conn = Client(tuple(address), authkey=authkey)
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+            func, args = task
+            try:
+                reply = (True, func(*args))
+            except Exception as e:
+                reply = (False, e)
+            try:
+                conn.send(reply)
+            except Exception as e:
+                # the error itself could not be pickled.
+                conn.send((False, RuntimeError(repr(e))))
+    finally:
+        conn.close()
+
+
+def run_workers(address, authkey, processes=None):
+    """
+    Starts one worker process per cpu on this node and waits for them to finish.
+    """
+    workers = [Process(target=run_worker, args=(address, authkey)) for _ in range(processes or cpu_count())]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return workers
@@ -0,0 +1,173 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import queue
+
+from collections import deque
+
+from evo.executors import TaskFailed, TaskTimedOut
+
+
+class FaultTolerance(object):
+    """
+    Evaluates a generation without letting one hung or crashing simulation stop the run:
+      deadlines:   a task still running timeout seconds after it was submitted is given up on (Executor.cancel).
+      retries:     a task which raised or timed out is submitted again, up to retries times.
+      penalties:   after that the robots get a penalty letter (Work.get_penalty_letter) instead of stopping the run.
+      speculation: once speculate_after of the generation has finished, idle workers run copies of the tasks which
+                   have been running longest, and whichever copy finishes first is used.
+    Only as many tasks as the executor has workers are submitted at a time, so a task starts when it is submitted and
+    its deadline means what it says. Workers which are still busy with a task that was given up on are not counted
+    as free until it finishes or the executor frees them (ProcessExecutor replaces its pool once all of them are
+    stuck). If no worker comes back within timeout an error is raised rather than waiting forever.
+    """
+    def __init__(self, timeout=None, retries=2, penalty=None, speculate_after=None):
+        """
+        :param timeout: seconds a task may run, None for no limit.
+        :param retries: times a failed task is submitted again before its robots get the penalty letter.
+        :param penalty: function robot -> letter, defaults to robot.get_penalty_letter(). If the letter is None the
+                        error is raised.
+        :param speculate_after: fraction of the tasks which must have finished before stragglers are copied, None to
+                                never copy them.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.penalty = penalty
+        self.speculate_after = speculate_after
+        self.zombies = set()  # tickets given up on whose workers are still busy.
+        self.stats = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        :return: the events counted since the last call.
+        """
+        stats = self.stats
+        self.stats = {"failures": 0, "timeouts": 0, "retries": 0, "penalties": 0, "speculative": 0,
+                      "speculative_wins": 0}
+        return stats
+
+    def _penalty_letter(self, robot, error):
+        letter = self.penalty(robot) if self.penalty is not None else robot.get_penalty_letter()
+        if letter is None:
+            raise error
+        self.stats["penalties"] += 1
+        return letter
+
+    def evaluate(self, executor, groups, submit, next_completed):
+        """
+        :param executor: the executor submit sends tasks to.
+        :param groups: lists of robots which share a letter (see AFPOMoo._dispatch). The first of each is submitted.
+        :param submit: function robot -> ticket.
+        :param next_completed: function timeout -> (ticket, letter), which raises queue.Empty and TaskFailed like
+                               Executor.next_completed.
+        :return: generator of (robots, letter, True if it is a penalty letter), in the order letters arrive.
+        """
+        waiting = deque(groups)
+        live = {}  # ticket -> group
+        started = {}  # ticket -> submit time
+        copies = {}  # id(group) -> live tickets
+        attempts = {}  # id(group) -> failed attempts
+        speculative = set()  # tickets which are copies
+        speculated = set()  # id(group) of groups which were copied
+        finished = 0
+        total = len(groups)
+
+        def launch(group):
+            ticket = submit(group[0])
+            live[ticket] = group
+            started[ticket] = time.time()
+            copies[id(group)] = copies.get(id(group), 0) + 1
+            return ticket
+
+        def retire(ticket):
+            group = live.pop(ticket)
+            del started[ticket]
+            copies[id(group)] -= 1
+            return group
+
+        def give_up(ticket):
+            self.zombies.add(ticket)
+            self.zombies -= executor.cancel(ticket)
+
+        while finished < total:
+            # keep every free worker busy, with stragglers' copies once most of the work is done.
+            free = executor.workers - len(live) - len(self.zombies)
+            while free > 0 and waiting:
+                launch(waiting.popleft())
+                free -= 1
+            if self.speculate_after is not None and free > 0 and finished >= self.speculate_after * total:
+                for ticket in sorted(live, key=started.get):
+                    group = live[ticket]
+                    if free <= 0:
+                        break
+                    if id(group) in speculated:
+                        continue
+                    speculated.add(id(group))
+                    speculative.add(launch(group))
+                    self.stats["speculative"] += 1
+                    free -= 1
+
+            wait = None
+            if self.timeout is not None:
+                # with nothing running, wait as long for a worker to come back.
+                wait = max(0.0, min(started.values()) + self.timeout - time.time()) if started else self.timeout
+            error = None
+            try:
+                ticket, letter = next_completed(wait)
+            except queue.Empty:
+                if not live:
+                    raise RuntimeError("all %d workers are still busy with tasks which were given up on"
+                                       % executor.workers)
+                ticket = None
+            except TaskFailed as e:
+                ticket, error = e.ticket, e
+
+            failed = []
+            if ticket is not None and ticket not in live:
+                # a late result of a task which was given up on.
+                self.zombies.discard(ticket)
+            elif ticket is not None:
+                group = retire(ticket)
+                if error is None:
+                    for other in [t for t, g in live.items() if g is group]:
+                        retire(other)
+                        give_up(other)
+                    if ticket in speculative:
+                        self.stats["speculative_wins"] += 1
+                    finished += 1
+                    yield group, letter, False
+                else:
+                    self.stats["failures"] += 1
+                    if copies[id(group)] == 0:
+                        failed.append((group, error))
+
+            if self.timeout is not None:
+                now = time.time()
+                for t in [t for t, start in started.items() if start + self.timeout <= now]:
+                    self.stats["timeouts"] += 1
+                    group = retire(t)
+                    give_up(t)
+                    if copies[id(group)] == 0:
+                        failed.append((group, TaskTimedOut(t, self.timeout)))
+
+            for group, error in failed:
+                attempts[id(group)] = attempts.get(id(group), 0) + 1
+                if attempts[id(group)] <= self.retries:
+                    self.stats["retries"] += 1
+                    waiting.appendleft(group)
+                else:
+                    finished += 1
+                    yield group, self._penalty_letter(group[0], error), True
@@ -0,0 +1,89 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+FULL_FIDELITY = 1.0
+
+
+def _dominates(a, b):
+    assert a.get_fidelity() == b.get_fidelity(), "robots evaluated at different fidelities can not be compared"
+    return a.dominates(b)
+
+
+class MultiFidelity(object):
+    """
+    Evaluates children at a low fidelity first (e.g. a shorter simulation, see Work.set_fidelity) and only evaluates
+    those which could reach the current front at full fidelity.
+
+    A child could reach the front if no robot on it dominates the child, both seen at the low fidelity. Front robots
+    keep the result of their own low fidelity evaluation (or are evaluated at it once, e.g. after a checkpoint), so
+    the comparison never mixes fidelities. Children which could not reach the front are dropped like the rejects of
+    a surrogate, so the population only ever holds robots evaluated at full fidelity.
+
+    Until there is a front everything is evaluated at full fidelity directly.
+    """
+    def __init__(self, low=0.25, cost=None):
+        """
+        :param low: the fidelity children are screened at, in (0, 1).
+        :param cost: function fidelity -> cost of one evaluation relative to a full one, defaults to the fidelity
+                     itself (e.g. the fraction of the simulated time). Only used to report the compute saved.
+        """
+        assert 0 < low < FULL_FIDELITY, "the low fidelity must be in (0, 1)"
+        self.low = low
+        self.cost = cost if cost is not None else (lambda fidelity: fidelity)
+        self.stats = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        :return: the counts gathered since the last call. compute_saved is in full evaluations.
+        """
+        stats = self.stats
+        self.stats = {"screened": 0, "promoted": 0, "low_evaluations": 0, "compute_saved": 0.0}
+        return stats
+
+    def screen(self, robots, front, evaluate):
+        """
+        Picks which robots to evaluate at full fidelity.
+        :param robots: robots which need to be evaluated.
+        :param front: the non-dominated robots of the last generation, all evaluated at full fidelity.
+        :param evaluate: function list of robots -> None which evaluates them at their current fidelity.
+        :return: (robots to evaluate at full fidelity, robots rejected)
+        """
+        if not front:
+            return robots, []
+        screened = [r for r in robots if r.get_fidelity() is not None]
+        if not screened:
+            return robots, []
+        keep = [r for r in robots if r.get_fidelity() is None]
+        front = [r for r in front if r.get_fidelity() is not None]
+
+        for r in screened + front:
+            r.set_fidelity(self.low)
+        low = [r for r in screened + front if r.needs_evaluation()]
+        evaluate(low)
+
+        rejected = []
+        for r in screened:
+            if any(_dominates(f, r) for f in front):
+                rejected.append(r)
+            else:
+                keep.append(r)
+        for r in screened + front:
+            r.set_fidelity(FULL_FIDELITY)
+
+        self.stats["screened"] += len(screened)
+        self.stats["promoted"] += len(screened) - len(rejected)
+        self.stats["low_evaluations"] += len(low)
+        self.stats["compute_saved"] += len(rejected) - len(low) * self.cost(self.low)
+        return keep, rejected
@@ -0,0 +1,118 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pickle
+import sqlite3
+import hashlib
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+def array_digest(array):
+    """
+    :return: a 128 bit digest of the array's dtype, shape and contents.
+    """
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+    h.update(array.data)
+    return h.digest()
+
+
+class FitnessCache(object):
+    """
+    Content addressed cache of letters, so robots with a body that was already evaluated are not simulated again.
+    Only valid when a robot's letter depends on nothing but its cache key (see Work.get_cache_key).
+
+    The most recently used max_entries letters are kept in memory. If a path is given, every letter is also written
+    to an sqlite database there which outlives the run and is consulted on a memory miss. The database records which
+    evaluator wrote it and is only opened for the same evaluator, so a changed simulator does not get stale letters.
+    """
+    def __init__(self, max_entries=100000, path=None, evaluator=""):
+        """
+        :param max_entries: letters kept in memory.
+        :param path: sqlite file to also keep every letter in, or None.
+        :param evaluator: names what computes the letters, e.g. the simulator and its version.
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS letters (key BLOB PRIMARY KEY, letter BLOB)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('evaluator', ?)", (evaluator,))
+            written_by, = self.db.execute("SELECT value FROM meta WHERE name = 'evaluator'").fetchone()
+            self.db.commit()
+            if written_by != evaluator:
+                self.db.close()
+                raise ValueError("%s holds fitnesses from %r, not from %r" % (path, written_by, evaluator))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        :return: the cached letter, or None on a miss.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        if self.db is not None:
+            row = self.db.execute("SELECT letter FROM letters WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                letter = pickle.loads(row[0])
+                self._remember(key, letter)
+                self.hits += 1
+                return letter
+
+        self.misses += 1
+        return None
+
+    def put(self, key, letter):
+        self._remember(key, letter)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO letters VALUES (?, ?)", (key, pickle.dumps(letter)))
+
+    def _remember(self, key, letter):
+        self.entries[key] = letter
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def flush(self):
+        if self.db is not None:
+            self.db.commit()
+
+    def reset_stats(self):
+        """
+        :return: (hits, misses) since the last reset.
+        """
+        stats = self.hits, self.misses
+        self.hits = 0
+        self.misses = 0
+        return stats
+
+    def close(self):
+        if self.db is not None:
+            self.db.commit()
+            self.db.close()
+            self.db = None
@@ -0,0 +1,96 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import weakref
+import itertools
+
+from multiprocessing import Lock, RawValue
+
+# every allocator by name, so that pickling one (e.g. as part of a robot) only sends its name, and unpickling it in a
+# forked worker finds the same shared counter. Only weakly, so an allocator (and its shared memory) goes away with the
+# last object using it, e.g. an AFPOMoo which made its own.
+_ALLOCATORS = weakref.WeakValueDictionary()
+_unnamed = itertools.count()
+
+# ids from different nodes never collide: node n hands out n * NODE_SPACE + 1, n * NODE_SPACE + 2, ...
+NODE_SPACE = 2 ** 40
+
+
+def _named_allocator(name):
+    return _ALLOCATORS[name]
+
+
+def _after_fork():
+    # a forked child inherits the parent's blocks, which the parent keeps using, so it has to reserve its own.
+    for allocator in list(_ALLOCATORS.values()):
+        allocator._current = allocator._end = 0
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class IdAllocator(object):
+    """
+    Hands out unique, increasing integer ids, e.g. robot ids and seq nums. Call it to get the next id.
+
+    The next free id lives in shared memory. Each process reserves a contiguous block of block_size ids at a time under
+    a lock and then hands them out without touching shared memory, so ids are unique across every process forked after
+    the allocator was created, and a process which is the only one drawing ids gets 1, 2, 3, ... exactly like a plain
+    counter. Processes on other machines must use their own node number.
+    """
+    def __init__(self, block_size=256, node=0, name=None):
+        """
+        :param block_size: number of ids a process reserves at a time.
+        :param node: which machine this is, when ids from several machines must not collide.
+        :param name: name to register the allocator under, see _ALLOCATORS.
+        """
+        self.block_size = block_size
+        self.node = node
+        self.name = name if name is not None else "ids-%d-%d" % (os.getpid(), next(_unnamed))
+        assert self.name not in _ALLOCATORS, "there already is an IdAllocator called %s" % self.name
+        _ALLOCATORS[self.name] = self
+
+        self._next_free = RawValue("q", 1)
+        self._lock = Lock()
+        self._current = self._end = 0
+
+    def __reduce__(self):
+        return _named_allocator, (self.name,)
+
+    def _reserve(self):
+        with self._lock:
+            self._current = self._next_free.value
+            self._next_free.value += self.block_size
+        self._end = self._current + self.block_size
+
+    def __call__(self):
+        if self._current >= self._end:
+            self._reserve()
+        value = self._current
+        self._current += 1
+        return self.node * NODE_SPACE + value
+
+    def get_state(self):
+        """
+        :return: the next id this process would hand out (skipping what is left of other processes' blocks).
+        """
+        if self._current < self._end and self._end == self._next_free.value:
+            return self._current
+        return self._next_free.value
+
+    def set_state(self, state):
+        with self._lock:
+            self._next_free.value = state
+        self._current = self._end = 0
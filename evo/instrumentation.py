@@ -0,0 +1,135 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import json
+import time
+
+from collections import defaultdict
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+
+
+def timed_call(func, *args):
+    """
+    Runs in the worker: calls func and reports when it started and finished alongside the result.
+    :return: (result, start time, finish time, worker pid)
+    """
+    start = time.time()
+    result = func(*args)
+    return result, start, time.time(), os.getpid()
+
+
+class _Span(object):
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.seconds[self.name] += time.perf_counter() - self.start
+        self.profiler.counts[self.name] += 1
+
+
+class Profiler(object):
+    """
+    Times the phases of each generation and writes one JSON line per generation.
+    When disabled every method returns immediately, so it can be left in the hot path.
+
+    Each line holds the total seconds spent in each span, how many times each span was entered, and for the tasks
+    sent to the executor the time they sat in the queue (submit to worker start) and the time the workers spent on
+    them. Queue wait compares clocks of different processes, so it is only meaningful on a single host.
+    """
+    def __init__(self, path=None, enabled=True):
+        """
+        :param path: file to append JSON lines to, or None to only keep the last report in self.last_report
+        :param enabled: False to turn every call into a no-op.
+        """
+        self.enabled = enabled
+        self.path = path
+        self.file = open(path, "a") if enabled and path is not None else None
+        self.generation = 0
+        self.last_report = None
+        self._reset()
+
+    def _reset(self):
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.tasks = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.compute = 0.0
+        self.max_compute = 0.0
+        self.workers = set()
+
+    def span(self, name):
+        """
+        :return: a context manager which adds the time spent inside it to the span called name.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record_task(self, submitted, started, finished, pid):
+        if not self.enabled:
+            return
+        self.tasks += 1
+        self.queue_wait += started - submitted
+        self.max_queue_wait = max(self.max_queue_wait, started - submitted)
+        self.compute += finished - started
+        self.max_compute = max(self.max_compute, finished - started)
+        self.workers.add(pid)
+
+    def end_generation(self, **fields):
+        """
+        Writes the report for this generation and starts a new one.
+        :param fields: anything else to include in the report, e.g. AFPOMoo.generation_stats
+        """
+        if not self.enabled:
+            return
+        report = {
+            "event": "generation",
+            "generation": self.generation,
+            "time": time.time(),
+            "spans": dict(self.seconds),
+            "counts": dict(self.counts),
+            "tasks": {
+                "count": self.tasks,
+                "workers": len(self.workers),
+                "queue_wait": self.queue_wait,
+                "max_queue_wait": self.max_queue_wait,
+                "compute": self.compute,
+                "max_compute": self.max_compute,
+            },
+        }
+        report.update(fields)
+        self.last_report = report
+        if self.file is not None:
+            self.file.write(json.dumps(report) + "\n")
+            self.file.flush()
+        self.generation += 1
+        self._reset()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,196 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import random
+
+from multiprocessing import Pipe, Process
+
+import numpy as np
+
+from evo.afpomoo import AFPOMoo
+from evo.executors import SerialExecutor
+from evo.ids import IdAllocator
+from evo.pareto import objective_matrix
+
+TOPOLOGIES = ("ring", "all", "random")
+
+
+def migration_targets(topology, island, islands, epoch):
+    """
+    :param topology: "ring": to the next island. "all": to every other island. "random": to one other island, picked
+                     anew every epoch (the same way on every run).
+    :param island: index of the sending island.
+    :param islands: number of islands.
+    :param epoch: number of migrations so far.
+    :return: indices of the islands which receive the migrants of island.
+    """
+    if islands < 2:
+        return []
+    if topology == "ring":
+        return [(island + 1) % islands]
+    if topology == "all":
+        return [i for i in range(islands) if i != island]
+    if topology == "random":
+        other = random.Random(epoch * islands + island).randrange(islands - 1)
+        return [other if other < island else other + 1]
+    raise ValueError("unknown migration topology %s" % topology)
+
+
+def _serial_executor(cpus_per_task=1):
+    return SerialExecutor()
+
+
+def _run_island(conn, index, seed, robot_factory, afpo_kwargs):
+    # every island is seeded on its own and draws ids from its own node, so a run is reproducible no matter how the
+    # islands' processes are scheduled.
+    random.seed(seed)
+    np.random.seed(seed)
+    afpo = AFPOMoo(robot_factory, id_allocator=IdAllocator(node=index), **afpo_kwargs)
+    # migrants get an id of this island when they arrive, so they do not lose every get_seq_num tie break to the
+    # robots of an island with a lower node. this maps their id here to the id they were first sent with.
+    origins = {}
+    try:
+        while True:
+            command, arg = conn.recv()
+            if command == "run":
+                start = time.time()
+                evaluations = 0
+                for _ in range(arg):
+                    afpo.generation()
+                    evaluations += afpo.generation_stats["evaluations"]
+                fitness, _ = afpo.get_best()
+                conn.send({"island": index, "evaluations": evaluations, "seconds": time.time() - start,
+                           "best_fitness": fitness, "front": len(afpo.dominating), "population": len(afpo.students)})
+            elif command == "emigrate":
+                # random members of the front.
+                front = list(afpo.dominating)
+                migrants = random.sample(front, min(arg, len(front)))
+                objectives = objective_matrix(migrants)[0] if migrants else []
+                conn.send([(origins.get(m.get_id(), m.get_id()), tuple(o), m.get_genome())
+                           for m, o in zip(migrants, objectives)])
+            elif command == "immigrate":
+                ids = set(s.get_id() for s in afpo.students)
+                origins = {i: origin for i, origin in origins.items() if i in ids}
+                present = set(origins.get(i, i) for i in ids)
+                sample = afpo.students[0]
+                for robot_id, _, genome in arg:
+                    if robot_id not in present:
+                        robot = sample.from_genome(genome)
+                        robot.set_id(afpo.get_robot_id())
+                        origins[robot.get_id()] = robot_id
+                        afpo.students.append(robot)
+                        present.add(robot_id)
+                conn.send(None)
+            elif command == "best":
+                fitness, robot = afpo.get_best()
+                conn.send((fitness, robot))
+            elif command == "stop":
+                break
+    finally:
+        afpo.cleanup()
+        conn.close()
+
+
+class IslandModel(object):
+    """
+    Runs one AFPOMoo population per process, so that sorting, culling and mutation are spread over cores as well as
+    evaluations. Every migration_interval generations each island sends copies of random members of its front, as
+    compact (id, objectives, genome) records (see RobotInterface.get_genome), to the islands picked by the topology.
+
+    Islands evaluate their robots in their own process by default. robot_factory is inherited by the islands' processes,
+    so it need not be picklable, but the islands must be forked.
+    """
+    def __init__(self, robot_factory, seeds, pop_size=50, migration_interval=5, migrants=2, topology="ring",
+                 cull_mode="legacy", executor=_serial_executor):
+        """
+        :param seeds: one random seed per island.
+        :param migration_interval: generations between migrations.
+        :param migrants: number of robots each island sends per migration.
+        :param topology: one of TOPOLOGIES, see migration_targets.
+        :param executor: executor factory called by every island, see AFPOMoo. Defaults to evaluating in the island.
+        """
+        assert topology in TOPOLOGIES, "topology must be one of %s" % (TOPOLOGIES,)
+        self.seeds = list(seeds)
+        self.migration_interval = migration_interval
+        self.migrants = migrants
+        self.topology = topology
+        self.epochs = 0
+        self.generations = 0
+        self.stats = []
+        self.elapsed = 0.0
+
+        afpo_kwargs = {"pop_size": pop_size, "cull_mode": cull_mode, "executor": executor}
+        self.connections = []
+        self.processes = []
+        for index, seed in enumerate(self.seeds):
+            parent_conn, child_conn = Pipe()
+            process = Process(target=_run_island, args=(child_conn, index, seed, robot_factory, afpo_kwargs),
+                              daemon=True)
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    @property
+    def islands(self):
+        return len(self.seeds)
+
+    def _all(self, command, args):
+        # sends every island its argument, then waits for all of their replies.
+        for conn, arg in zip(self.connections, args):
+            conn.send((command, arg))
+        return [conn.recv() for conn in self.connections]
+
+    def epoch(self):
+        """
+        Runs migration_interval generations on every island, then migrates.
+        :return: a list with the stats of every island.
+        """
+        start = time.time()
+        self.stats = self._all("run", [self.migration_interval] * self.islands)
+        self.generations += self.migration_interval
+
+        outgoing = self._all("emigrate", [self.migrants] * self.islands)
+        incoming = [[] for _ in range(self.islands)]
+        for island, records in enumerate(outgoing):
+            for target in migration_targets(self.topology, island, self.islands, self.epochs):
+                incoming[target].extend(records)
+        self._all("immigrate", incoming)
+        self.epochs += 1
+
+        self.elapsed = time.time() - start
+        return self.stats
+
+    def evaluations_per_second(self):
+        return sum(s["evaluations"] for s in self.stats) / max(self.elapsed, 1e-9)
+
+    def get_best(self):
+        """
+        :return: (fitness, robot) of the best robot on any island.
+        """
+        best = None
+        for fitness, robot in self._all("best", [None] * self.islands):
+            if best is None or robot.dominates_final_selection(best[1]):
+                best = (fitness, robot)
+        return best
+
+    def cleanup(self):
+        for conn in self.connections:
+            try:
+                conn.send(("stop", None))
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join()
@@ -0,0 +1,245 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import queue
+import sqlite3
+import threading
+
+ROBOT_FIELDS = ("id", "parent", "generation", "age", "fitness", "digest")
+GENERATION_FIELDS = ("generation", "time", "population", "front", "evaluations", "best_fitness", "mean_fitness")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS robots (id INTEGER PRIMARY KEY, parent INTEGER, generation INTEGER, age INTEGER,
+                                   fitness REAL, digest BLOB);
+CREATE INDEX IF NOT EXISTS robots_parent ON robots (parent);
+CREATE INDEX IF NOT EXISTS robots_generation ON robots (generation);
+CREATE TABLE IF NOT EXISTS fronts (generation INTEGER, id INTEGER, PRIMARY KEY (generation, id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS generations (generation INTEGER PRIMARY KEY, time REAL, population INTEGER,
+                                        front INTEGER, evaluations INTEGER, best_fitness REAL, mean_fitness REAL);
+"""
+
+
+def _connect(path):
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def _age(robot):
+    attribute = getattr(type(robot), "age_attribute", None)
+    return getattr(robot, attribute) if attribute is not None else None
+
+
+class LineageRecorder(object):
+    """
+    Streams the history of a run to an SQLite database (in WAL mode) instead of keeping old robots in memory:
+      robots:      (id, parent, generation, age, fitness, digest) of every evaluated robot. parent is the id of the
+                   robot it was cloned from (None for random robots), digest is its get_cache_key (e.g. a digest of the
+                   morphology), age is read from its age_attribute.
+      fronts:      the ids on the front after every generation.
+      generations: per generation stats.
+    Records are buffered and written batch_size at a time by a background thread, so the run only pays for building
+    the tuples. Reads wait for everything recorded so far to be written.
+    """
+    def __init__(self, path, batch_size=10000):
+        """
+        :param path: the database file, created if it does not exist. Recording continues an existing one.
+        :param batch_size: number of records to buffer before handing them to the writer.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.generation = 0
+        self.parents = {}  # robot id -> parent id, for robots which have not been evaluated yet.
+
+        connection = _connect(path)
+        connection.executescript(_SCHEMA)
+        last = connection.execute("SELECT MAX(generation) FROM generations").fetchone()[0]
+        connection.close()
+        if last is not None:
+            self.generation = last + 1
+
+        self._robots = []
+        self._fronts = []
+        self._generations = []
+        # bounded, so a slow disk slows the run down instead of filling memory.
+        self._queue = queue.Queue(maxsize=4)
+        self._error = None
+        self._writer = threading.Thread(target=self._write, daemon=True)
+        self._writer.start()
+        self._reader = None
+
+    def _write(self):
+        connection = _connect(self.path)
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                connection.close()
+                self._queue.task_done()
+                return
+            try:
+                if callable(batch):
+                    batch(connection)
+                else:
+                    robots, fronts, generations = batch
+                    connection.executemany("INSERT OR REPLACE INTO robots VALUES (?, ?, ?, ?, ?, ?)", robots)
+                    connection.executemany("INSERT OR REPLACE INTO fronts VALUES (?, ?)", fronts)
+                    connection.executemany("INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                           generations)
+                connection.commit()
+            except Exception as e:
+                # raised in the run's thread by the next flush.
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _hand_off(self):
+        if self._robots or self._fronts or self._generations:
+            self._queue.put((self._robots, self._fronts, self._generations))
+            self._robots, self._fronts, self._generations = [], [], []
+
+    def born(self, robot, parent_id):
+        """
+        Remembers which robot a mutant was cloned from, call once it has its id. Robots recorded without calling
+        this have no parent.
+        :param parent_id: id of the robot it was cloned from.
+        """
+        self.parents[robot.get_id()] = parent_id
+
+    def evaluated(self, robot):
+        """
+        Records a robot once its letter has been opened (or it was dropped without being evaluated).
+        """
+        robot_id = robot.get_id()
+        fitness = None if robot.needs_evaluation() else robot.get_fitness()
+        self._robots.append((robot_id, self.parents.pop(robot_id, None), self.generation, _age(robot), fitness,
+                             robot.get_cache_key()))
+        if len(self._robots) >= self.batch_size:
+            self._hand_off()
+
+    def end_generation(self, students, front, evaluations=None):
+        """
+        Records the front and the stats of the generation which just finished and starts the next one.
+        :param students: the population after culling.
+        :param front: the non-dominated robots.
+        """
+        fitness = [s.get_fitness() for s in students if s is not None]
+        self._fronts.extend((self.generation, r.get_id()) for r in front)
+        self._generations.append((self.generation, time.time(), len(fitness), len(front), evaluations,
+                                  max(fitness) if fitness else None,
+                                  sum(fitness) / len(fitness) if fitness else None))
+        self.generation += 1
+        if len(self._fronts) >= self.batch_size:
+            self._hand_off()
+
+    def flush(self):
+        """
+        Waits until everything recorded so far is in the database.
+        """
+        self._hand_off()
+        self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def truncate(self, generation):
+        """
+        Forgets generation and everything after it, e.g. when a run resumes from an older checkpoint.
+        """
+        def delete(connection):
+            for table in ("robots", "fronts", "generations"):
+                connection.execute("DELETE FROM %s WHERE generation >= ?" % table, (generation,))
+        self.flush()
+        self._queue.put(delete)
+        self.flush()
+        self.generation = generation
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    # queries
+
+    def _query(self, sql, args=()):
+        self.flush()
+        if self._reader is None:
+            self._reader = sqlite3.connect(self.path)
+        return self._reader.execute(sql, args).fetchall()
+
+    def get(self, robot_id):
+        """
+        :return: the record of a robot as a dict (see ROBOT_FIELDS), or None.
+        """
+        rows = self._query("SELECT * FROM robots WHERE id = ?", (robot_id,))
+        return dict(zip(ROBOT_FIELDS, rows[0])) if rows else None
+
+    def ancestry(self, robot_id):
+        """
+        :return: records of the robot, its parent, its parent's parent, ... back to a random robot.
+        """
+        rows = self._query("""
+            WITH RECURSIVE chain(id, depth) AS (
+                SELECT ?, 0
+                UNION ALL
+                SELECT robots.parent, chain.depth + 1 FROM robots JOIN chain ON robots.id = chain.id
+                WHERE robots.parent IS NOT NULL)
+            SELECT robots.* FROM chain JOIN robots ON robots.id = chain.id ORDER BY chain.depth""", (robot_id,))
+        return [dict(zip(ROBOT_FIELDS, row)) for row in rows]
+
+    def children(self, robot_id):
+        """
+        :return: records of the robots cloned from robot_id.
+        """
+        rows = self._query("SELECT * FROM robots WHERE parent = ? ORDER BY id", (robot_id,))
+        return [dict(zip(ROBOT_FIELDS, row)) for row in rows]
+
+    def descendant_count(self, robot_id):
+        """
+        :return: how many robots descend from robot_id.
+        """
+        return self._query("""
+            WITH RECURSIVE tree(id) AS (
+                SELECT id FROM robots WHERE parent = ?
+                UNION ALL
+                SELECT robots.id FROM robots JOIN tree ON robots.parent = tree.id)
+            SELECT COUNT(*) FROM tree""", (robot_id,))[0][0]
+
+    def front(self, generation):
+        """
+        :return: ids of the robots on the front after generation.
+        """
+        return [row[0] for row in self._query("SELECT id FROM fronts WHERE generation = ? ORDER BY id", (generation,))]
+
+    def generation_stats(self, first=0, last=None):
+        """
+        :return: the stats of generations first to last (inclusive) as dicts, see GENERATION_FIELDS.
+        """
+        rows = self._query("SELECT * FROM generations WHERE generation >= ? AND generation <= ? ORDER BY generation",
+                           (first, last if last is not None else 2 ** 62))
+        return [dict(zip(GENERATION_FIELDS, row)) for row in rows]
+
+    def robots_in(self, generation):
+        """
+        :return: records of the robots evaluated during generation.
+        """
+        rows = self._query("SELECT * FROM robots WHERE generation = ? ORDER BY id", (generation,))
+        return [dict(zip(ROBOT_FIELDS, row)) for row in rows]
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM robots")[0][0]
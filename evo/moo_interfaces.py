@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
+
 from abc import ABCMeta, abstractmethod
 
 class Work(object):
@@ -30,6 +32,80 @@ class Work(object):
         self.compute_work(serial=serial)
         return self.write_letter()
 
+    def get_work_payload(self):
+        """
+        Opt in to letter-only dispatch. Return a small picklable description of the work (e.g. a morphology and an id)
+        and the dispatcher will send only that to the worker instead of pickling the whole object.
+        :return: the payload, or None to have the whole object sent and complete_work called on it.
+        """
+        return None
+
+    @classmethod
+    def complete_payload(cls, payload):
+        """
+        Completes the work described by a payload from get_work_payload. Runs in the worker without an instance.
+        :param payload: the payload returned by get_work_payload
+        :return: A letter to be sent, exactly as complete_work would have returned it.
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def complete_work_batch(cls, works, serial=False):
+        """
+        Completes several pieces of work in one call to a worker, see evo.batching.AdaptiveChunking. Override to
+        evaluate them together, e.g. one simulator run or one vectorized fitness function for the whole chunk.
+        :param works: objects of this class which did not opt in to letter-only dispatch.
+        :return: their letters, in the same order.
+        """
+        return [w.complete_work(serial=serial) for w in works]
+
+    @classmethod
+    def complete_payload_batch(cls, payloads):
+        """
+        Like complete_work_batch, for payloads from get_work_payload.
+        :return: their letters, in the same order.
+        """
+        return [cls.complete_payload(p) for p in payloads]
+
+    def get_cache_key(self):
+        """
+        Opt in to fitness caching. Only do so if the letter depends on nothing but the key.
+        :return: hashable bytes identifying the work (e.g. a digest of the morphology), or None to always evaluate.
+        """
+        return None
+
+    def get_penalty_letter(self):
+        """
+        The letter for work which keeps failing or timing out, see evo.fault_tolerance.FaultTolerance.
+        :return: a letter to open instead of a result (e.g. one with the worst possible fitness), or None to stop the
+                 run with the error.
+        """
+        return None
+
+    def get_surrogate_features(self):
+        """
+        Opt in to surrogate pre-screening, see evo.surrogate.Surrogate.
+        :return: 1d array of cheap to compute features the fitness is predicted from, or None to always evaluate.
+        """
+        return None
+
+    def get_fidelity(self):
+        """
+        Opt in to multi-fidelity evaluation, see evo.fidelity.MultiFidelity.
+        :return: the fidelity the work is currently set to (1.0 is full fidelity), or None to always evaluate fully.
+        """
+        return None
+
+    def set_fidelity(self, fidelity):
+        """
+        Sets the fidelity the work is evaluated at next, and which of its results it reports: the letter must say
+        which fidelity it was computed at, results at other fidelities are kept, and needs_evaluation is True if there
+        is no result at this fidelity yet. get_cache_key must tell fidelities apart.
+        :param fidelity: in (0, 1], e.g. the fraction of the full simulation time.
+        :return: None
+        """
+        raise NotImplementedError
+
     def compute_work(self, serial=False):
         """
         Entry point to do the required computation.
@@ -93,6 +169,45 @@ class RobotInterface(Work):
        """
         raise NotImplementedError
 
+    def clone_for_mutation(self):
+        """
+        Copy this robot so the copy can be mutated without changing this robot. Override to share the parts of the
+        robot which mutate() replaces instead of changing in place.
+        :return: a copy of this robot.
+        """
+        return copy.deepcopy(self)
+
+    def get_checkpoint_state(self):
+        """
+        What can change about this robot after it has been evaluated, e.g. its age. Checkpoints write the rest of the
+        robot only once and just this on later snapshots.
+        :return: a small picklable value, or None to have the whole robot written on every snapshot.
+        """
+        return None
+
+    def set_checkpoint_state(self, state):
+        """
+        Restores the value returned by get_checkpoint_state.
+        :param state: the value returned by get_checkpoint_state
+        :return: None
+        """
+        raise NotImplementedError
+
+    def get_genome(self):
+        """
+        What another population needs to rebuild this robot, including what was learnt by evaluating it, e.g. when it
+        migrates between islands (see evo.islands). Override to send something more compact than the whole robot.
+        :return: a picklable value for from_genome.
+        """
+        return self
+
+    def from_genome(self, genome):
+        """
+        Builds a robot of the same kind as this one from the value returned by get_genome.
+        :param genome: the value returned by get_genome of a robot in another population.
+        :return: the new robot.
+        """
+        return genome
 
     @abstractmethod
     def dominates(self, other): raise NotImplementedError
@@ -105,6 +220,11 @@ class RobotInterface(Work):
 
 class MOORobotInterface(RobotInterface):
     __metaclass__ = ABCMeta
+
+    # name of the attribute holding the robot's age, for robots whose iterate_generation only adds one to it and whose
+    # first minimize value is the age. evo.population.ColumnarPopulation then ages everyone with one array operation.
+    age_attribute = None
+
     @abstractmethod
     def get_maximize_vals(self): raise NotImplementedError
 
@@ -147,6 +267,7 @@ class MOORobotInterface(RobotInterface):
 
 class AFPORobotInterface(MOORobotInterface):
     __metaclass__ = ABCMeta
+    age_attribute = "age"
 
     def __init__(self, optimize_mode="fitness"):
         self.age = 0
@@ -170,3 +291,8 @@ class AFPORobotInterface(MOORobotInterface):
     def get_age(self):
         return self.age
 
+    def get_checkpoint_state(self):
+        return self.age
+
+    def set_checkpoint_state(self, state):
+        self.age = state
@@ -0,0 +1,526 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import bisect
+
+import numpy as np
+
+from evo.moo_interfaces import MOORobotInterface
+
+
+def uses_default_dominance(student):
+    """
+    The vectorized engine reproduces MOORobotInterface.dominates exactly, so it may only be used for robots which
+    have not replaced that method with their own notion of dominance.
+    :param student: the robot to check
+    :return: True if the robot can be sorted by the vectorized engine.
+    """
+    return isinstance(student, MOORobotInterface) and type(student).dominates is MOORobotInterface.dominates
+
+
+def objective_matrix(students):
+    """
+    Gathers the objectives of every student into one matrix where every column is to be minimized.
+    :param students: list of MOORobotInterface robots
+    :return: (objectives, seq_nums) -- an (n, m) float array and an (n,) int array of tie breakers.
+    """
+    rows = [list(s.get_minimize_vals()) + [-v for v in s.get_maximize_vals()] for s in students]
+    objectives = np.array(rows, dtype=np.float64).reshape(len(students), -1)
+    seq_nums = np.array([s.get_seq_num() for s in students], dtype=np.int64)
+    return objectives, seq_nums
+
+
+def dominance_matrix(objectives, seq_nums, chunk_size=256):
+    """
+    Computes which rows dominate which, using the same rules (and seq num tie break) as MOORobotInterface.dominates.
+    Rows are computed a chunk at a time and stored bit packed so 10k individuals only need ~12MB.
+    :param objectives: (n, m) array of values to minimize
+    :param seq_nums: (n,) array of tie breakers, smaller wins.
+    :param chunk_size: number of rows to compute at a time.
+    :return: (n, ceil(n / 8)) uint8 array; bit j of row i is set if i dominates j.
+    """
+    n = objectives.shape[0]
+    packed = np.zeros((n, (n + 7) // 8), dtype=np.uint8)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        at_least_as_good = np.ones((stop - start, n), dtype=bool)
+        strictly_better = seq_nums[start:stop, None] < seq_nums[None, :]
+        for col in objectives.T:
+            block = col[start:stop, None]
+            at_least_as_good &= block <= col[None, :]
+            strictly_better |= block < col[None, :]
+        packed[start:stop] = np.packbits(at_least_as_good & strictly_better, axis=1)
+    return packed
+
+
+def _earlier_at_most(values):
+    """
+    For every i, how many j < i have values[j] <= values[i]. A bottom up merge sort, one vectorized pass per level.
+    :param values: (n,) int array with values in [0, n).
+    :return: (n,) int array of counts.
+    """
+    n = len(values)
+    counts = np.zeros(n, dtype=np.int64)
+    positions = np.arange(n)
+    width = 1
+    while width < n:
+        pair = positions // (2 * width)
+        left = (positions // width) % 2 == 0
+        # keyed by pair, the left halves of every pair can be sorted and searched at once.
+        keyed = pair * n + values
+        sorted_left = np.sort(keyed[left])
+        right = ~left
+        counts[right] += (np.searchsorted(sorted_left, keyed[right], side="right") -
+                          np.searchsorted(sorted_left, pair[right] * n, side="left"))
+        width *= 2
+    return counts
+
+
+def _lexicographic_order(objectives, seq_nums):
+    # everything which dominates an individual comes before it in this order.
+    return np.lexsort((seq_nums, objectives[:, 1], objectives[:, 0]))
+
+
+def dominator_counts_2d(objectives, seq_nums):
+    """
+    dominator counts for two objectives in O(n log^2 n) instead of O(n^2): in lexicographic order, an individual is
+    dominated by exactly the earlier individuals whose second objective is at most its own.
+    :param objectives: (n, 2) array of values to minimize
+    :param seq_nums: (n,) array of tie breakers, smaller wins.
+    :return: (n,) array with the number of individuals dominating each individual.
+    """
+    order = _lexicographic_order(objectives, seq_nums)
+    second = np.unique(objectives[order, 1], return_inverse=True)[1].reshape(-1)
+    counts = np.empty(len(order), dtype=np.int64)
+    counts[order] = _earlier_at_most(second)
+    return counts
+
+
+def ranks_2d(objectives, seq_nums):
+    """
+    Non-dominated sorting for two objectives in O(n log n): in lexicographic order, an individual joins the first
+    front which has no member with a second objective at most its own. The smallest second objective of every front
+    grows with the rank, so that front is found by bisection.
+    :return: (n,) int array of the front each individual belongs to.
+    """
+    order = _lexicographic_order(objectives, seq_nums)
+    ranks = np.empty(len(order), dtype=np.int64)
+    minima = []
+    for i, value in zip(order.tolist(), objectives[order, 1].tolist()):
+        rank = bisect.bisect_right(minima, value)
+        if rank == len(minima):
+            minima.append(value)
+        else:
+            minima[rank] = value
+        ranks[i] = rank
+    return ranks
+
+
+def legacy_front(students):
+    """
+    The original O(n^2) scan over robot.dominates. Kept for robots with custom dominance and for benchmarking.
+    :return: list of indices of non-dominated students.
+    """
+    front = []
+    for s in range(len(students)):
+        dominated = False
+        for t in range(len(students)):
+            if students[t].dominates(students[s]):
+                dominated = True
+                break
+        if not dominated:
+            front.append(s)
+    return front
+
+
+class DominanceSort(object):
+    """
+    Non-dominated sorting of a whole population at once. With two objectives (e.g. age and fitness) the dominator
+    counts, front and ranks are found without the O(n^2) dominance matrix, which is only built for pairwise queries.
+    """
+    def __init__(self, students, chunk_size=256):
+        self._setup(*objective_matrix(students), chunk_size=chunk_size)
+
+    @classmethod
+    def from_arrays(cls, objectives, seq_nums, chunk_size=256):
+        """
+        :param objectives: (n, m) array of values to minimize, as from objective_matrix.
+        :param seq_nums: (n,) array of tie breakers, smaller wins.
+        """
+        sorter = cls.__new__(cls)
+        sorter._setup(objectives, seq_nums, chunk_size=chunk_size)
+        return sorter
+
+    def _setup(self, objectives, seq_nums, chunk_size=256):
+        self.n = len(seq_nums)
+        self.objectives, self.seq_nums = objectives, seq_nums
+        self.chunk_size = chunk_size
+        self.comparisons = 0
+        self._packed = None
+        self._counts = None
+
+    @property
+    def packed(self):
+        if self._packed is None:
+            self._packed = self._compute_packed()
+        return self._packed
+
+    def _compute_packed(self):
+        self.comparisons += self.n * (self.n - 1)
+        return dominance_matrix(self.objectives, self.seq_nums, chunk_size=self.chunk_size)
+
+    def dominates(self, i, j):
+        return bool((self.packed[i, j >> 3] >> (7 - (j & 7))) & 1)
+
+    def dominated_by(self, rows):
+        """
+        :param rows: indices of the dominating individuals.
+        :return: (len(rows), n) bool array of who each row dominates.
+        """
+        return np.unpackbits(self.packed[rows], axis=1, count=self.n).astype(bool)
+
+    def dominators_of(self, j):
+        """
+        :return: indices of every individual which dominates j.
+        """
+        return np.flatnonzero((self.packed[:, j >> 3] >> (7 - (j & 7))) & 1)
+
+    def _two_objectives(self):
+        return self._packed is None and self.objectives is not None and self.objectives.shape[1] == 2
+
+    def dominator_counts(self):
+        """
+        :return: (n,) array with the number of individuals dominating each individual.
+        """
+        if self._counts is None and self._two_objectives():
+            self.comparisons += self.n * max(1, self.n.bit_length())
+            self._counts = dominator_counts_2d(self.objectives, self.seq_nums)
+        if self._counts is None:
+            counts = np.zeros(self.n, dtype=np.int64)
+            for start in range(0, self.n, self.chunk_size):
+                counts += self.dominated_by(np.arange(start, min(start + self.chunk_size, self.n))).sum(axis=0)
+            self._counts = counts
+        return self._counts
+
+    def front(self):
+        """
+        :return: sorted indices of the non-dominated individuals.
+        """
+        return np.flatnonzero(self.dominator_counts() == 0)
+
+    def ranks(self):
+        """
+        Peels the population into successive fronts. Rank 0 is the non-dominated front.
+        :return: (n,) int array of the front each individual belongs to.
+        """
+        if self._two_objectives():
+            self.comparisons += self.n * max(1, self.n.bit_length())
+            return ranks_2d(self.objectives, self.seq_nums)
+        counts = self.dominator_counts().copy()
+        ranks = np.full(self.n, -1, dtype=np.int64)
+        current = np.flatnonzero(counts == 0)
+        rank = 0
+        while current.size:
+            ranks[current] = rank
+            counts -= self.dominated_by(current).sum(axis=0)
+            current = np.flatnonzero((counts == 0) & (ranks < 0))
+            rank += 1
+        return ranks
+
+
+class LegacyDominanceSort(DominanceSort):
+    """
+    Same queries as DominanceSort, answered with each robot's own dominates method.
+    Used when robots define their own notion of dominance.
+    """
+    def __init__(self, students, chunk_size=256):
+        self.students = students
+        self.n = len(students)
+        self.objectives = None
+        self.seq_nums = np.array([s.get_id() for s in students])
+        self.chunk_size = chunk_size
+        self.comparisons = 0
+        self._packed = None
+        self._counts = None
+
+    def _compute_packed(self):
+        self.comparisons += self.n * (self.n - 1)
+        matrix = [[i != j and t.dominates(s) for j, s in enumerate(self.students)]
+                  for i, t in enumerate(self.students)]
+        return np.packbits(np.array(matrix, dtype=bool).reshape(self.n, self.n), axis=1)
+
+    def dominates(self, i, j):
+        if self._packed is not None:
+            return DominanceSort.dominates(self, i, j)
+        return self.students[i].dominates(self.students[j])
+
+    def front(self):
+        if self._packed is not None:
+            return DominanceSort.front(self)
+        front = []
+        for s in range(self.n):
+            for t in range(self.n):
+                self.comparisons += 1
+                if self.dominates(t, s):
+                    break
+            else:
+                front.append(s)
+        return np.array(front, dtype=np.int64)
+
+
+def make_sorter(students, chunk_size=256):
+    """
+    :return: a DominanceSort if every student uses the default dominance, a LegacyDominanceSort otherwise.
+    """
+    if all(uses_default_dominance(s) for s in students):
+        return DominanceSort(students, chunk_size=chunk_size)
+    return LegacyDominanceSort(students, chunk_size=chunk_size)
+
+
+def crowding_distance(objectives):
+    """
+    NSGA-II crowding distance: how much room there is around each individual in objective space.
+    :param objectives: (n, m) array of values to minimize
+    :return: (n,) array, boundary individuals get inf.
+    """
+    n, m = objectives.shape
+    distance = np.zeros(n)
+    if n <= 2:
+        distance[:] = np.inf
+        return distance
+    for col in objectives.T:
+        order = np.argsort(col, kind="stable")
+        span = col[order[-1]] - col[order[0]]
+        distance[order[0]] = distance[order[-1]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (col[order[2:]] - col[order[:-2]]) / span
+    return distance
+
+
+class ParetoArchive(object):
+    """
+    Keeps track of which members of a changing population are non-dominated, using the same rules as DominanceSort.
+    Every member is stored with its objectives (all minimized) and seq num; a flag marks the front.
+      insert: compared with the front only, O(|front| * m).
+      remove: only the members a removed front member dominated can join the front, O(n * m) plus their check.
+    Both have batch versions, which is what sync uses.
+      shift:  adding the same amount to a column of every member (e.g. every age going up by one) does not change
+              who dominates whom among them, so it only moves an offset, O(1).
+    """
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.num_objectives = None
+        self.values = None
+        self.offset = None
+        self.seq_nums = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.in_front = np.zeros(capacity, dtype=bool)
+        self.keys = [None] * capacity
+        self.rows = {}
+        self.free = list(range(capacity - 1, -1, -1))
+        self.comparisons = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def _grow(self):
+        old = self.capacity
+        self.capacity *= 2
+        self.values = np.concatenate([self.values, np.zeros((old, self.num_objectives))])
+        self.seq_nums = np.concatenate([self.seq_nums, np.zeros(old, dtype=np.int64)])
+        self.alive = np.concatenate([self.alive, np.zeros(old, dtype=bool)])
+        self.in_front = np.concatenate([self.in_front, np.zeros(old, dtype=bool)])
+        self.keys.extend([None] * old)
+        self.free.extend(range(self.capacity - 1, old - 1, -1))
+
+    def _objectives(self, rows):
+        return self.values[rows] + self.offset
+
+    def _dominance(self, values_a, seq_a, values_b, seq_b, chunk_size=256):
+        # (len(a), len(b)) bool array, True where a dominates b.
+        self.comparisons += len(values_a) * len(values_b)
+        result = np.zeros((len(values_a), len(values_b)), dtype=bool)
+        for start in range(0, len(values_a), chunk_size):
+            a = values_a[start:start + chunk_size, None, :]
+            at_least_as_good = (a <= values_b[None]).all(axis=2)
+            strictly_better = (a < values_b[None]).any(axis=2) | (seq_a[start:start + chunk_size, None] < seq_b[None])
+            result[start:start + chunk_size] = at_least_as_good & strictly_better
+        return result
+
+    def insert(self, key, objectives, seq_num):
+        """
+        :param key: a unique, hashable name for the member, e.g. the robot's id.
+        :param objectives: (m,) values to minimize.
+        :param seq_num: tie breaker, smaller wins.
+        :return: True if the member joined the front.
+        """
+        return bool(self.insert_many([key], [objectives], [seq_num])[0])
+
+    def insert_many(self, keys, objectives, seq_nums):
+        """
+        :param keys: unique, hashable names for the members, e.g. the robots' ids.
+        :param objectives: (k, m) values to minimize.
+        :param seq_nums: (k,) tie breakers, smaller wins.
+        :return: (k,) bool array, True for the members which are on the front afterwards.
+        """
+        if len(keys) == 0:
+            return np.zeros(0, dtype=bool)
+        objectives = np.asarray(objectives, dtype=np.float64).reshape(len(keys), -1)
+        seq_nums = np.asarray(seq_nums, dtype=np.int64)
+        if self.num_objectives is None:
+            self.num_objectives = objectives.shape[1]
+            self.values = np.zeros((self.capacity, self.num_objectives))
+            self.offset = np.zeros(self.num_objectives)
+        while len(self.free) < len(keys):
+            self._grow()
+        rows = np.array([self.free.pop() for _ in keys], dtype=np.int64)
+        for key, row in zip(keys, rows):
+            assert key not in self.rows, "%s is already in the archive" % (key,)
+            self.rows[key] = row
+            self.keys[row] = key
+        self.values[rows] = objectives - self.offset
+        self.seq_nums[rows] = seq_nums
+        self.alive[rows] = True
+
+        # anything which dominates a new member is dominated by, or is, a member of the front. Most new members are
+        # ruled out against the old front at once. Of the rest, those no other one dominates join the front and push
+        # out the old members they dominate.
+        front = np.flatnonzero(self.in_front)
+        dominated = self._dominance(self._objectives(front), self.seq_nums[front], objectives, seq_nums).any(axis=0)
+        candidates = rows[~dominated]
+        if len(candidates):
+            sorter = DominanceSort.from_arrays(self._objectives(candidates), self.seq_nums[candidates])
+            candidates = candidates[sorter.front()]
+            self.comparisons += sorter.comparisons
+            beaten = self._dominance(self._objectives(candidates), self.seq_nums[candidates],
+                                     self._objectives(front), self.seq_nums[front]).any(axis=0)
+            self.in_front[front[beaten]] = False
+            self.in_front[candidates] = True
+        return self.in_front[rows]
+
+    def remove(self, key):
+        self.remove_many([key])
+
+    def remove_many(self, keys):
+        rows = np.array([self.rows.pop(key) for key in keys], dtype=np.int64)
+        if len(rows) == 0:
+            return
+        removed_front = rows[self.in_front[rows]]
+        self.alive[rows] = False
+        self.in_front[rows] = False
+        for row in rows:
+            self.keys[row] = None
+        self.free.extend(rows.tolist())
+        if len(removed_front) == 0:
+            return
+
+        # only members which a removed front member dominated can join the front: those which nothing left on the
+        # front dominates, and which no other such member dominates.
+        others = np.flatnonzero(self.alive & ~self.in_front)
+        candidates = others[self._dominance(self._objectives(removed_front), self.seq_nums[removed_front],
+                                            self._objectives(others), self.seq_nums[others]).any(axis=0)]
+        front = np.flatnonzero(self.in_front)
+        candidates = candidates[~self._dominance(self._objectives(front), self.seq_nums[front],
+                                                 self._objectives(candidates), self.seq_nums[candidates]).any(axis=0)]
+        values = self._objectives(candidates)
+        self.in_front[candidates[~self._dominance(values, self.seq_nums[candidates], values,
+                                                  self.seq_nums[candidates]).any(axis=0)]] = True
+
+    def clear(self):
+        self.alive[:] = False
+        self.in_front[:] = False
+        self.keys = [None] * self.capacity
+        self.rows = {}
+        self.free = list(range(self.capacity - 1, -1, -1))
+        if self.offset is not None:
+            self.offset[:] = 0
+
+    def shift(self, deltas):
+        """
+        Adds deltas to the objectives of every member.
+        :param deltas: (m,) amounts to add to each objective.
+        """
+        self.offset = self.offset + np.asarray(deltas, dtype=np.float64)
+
+    def objectives_of(self, key):
+        return self.values[self.rows[key]] + self.offset
+
+    def front(self):
+        """
+        :return: the keys of the non-dominated members.
+        """
+        return [self.keys[row] for row in np.flatnonzero(self.in_front)]
+
+    def best(self, column):
+        """
+        :param column: the objective to look at.
+        :return: the key of the member with the smallest value of that objective, ties broken by seq num.
+        """
+        front = np.flatnonzero(self.in_front)
+        if len(front) == 0:
+            return None
+        # a member with the smallest value in any column is only dominated by members with the same value, so one of
+        # them is on the front.
+        order = np.lexsort((self.seq_nums[front], self.values[front, column]))
+        return self.keys[front[order[0]]]
+
+    def sync(self, students):
+        """
+        Brings the archive up to date with a population of MOORobotInterface robots: members no longer in students
+        are removed, new students are inserted and members whose objectives changed are moved. When every member
+        changed by the same amount (e.g. iterate_generation made everyone one generation older) that is a shift.
+        :return: sorted indices of the non-dominated students.
+        """
+        if not students:
+            return self.sync_arrays([], None, None)
+        objectives, seq_nums = objective_matrix(students)
+        return self.sync_arrays([s.get_id() for s in students], objectives, seq_nums)
+
+    def sync_arrays(self, keys, objectives, seq_nums):
+        """
+        sync for a population which already is in arrays, e.g. an evo.population.ColumnarPopulation.
+        :param keys: the members' unique names, e.g. robot ids.
+        :param objectives: (n, m) array of values to minimize.
+        :param seq_nums: (n,) array of tie breakers.
+        :return: sorted indices of the non-dominated members.
+        """
+        if len(keys) == 0:
+            self.clear()
+            return np.zeros(0, dtype=np.int64)
+
+        current = set(keys)
+        self.remove_many([k for k in self.rows if k not in current])
+
+        known = [i for i, k in enumerate(keys) if k in self.rows]
+        if known:
+            rows = np.array([self.rows[keys[i]] for i in known])
+            deltas = objectives[known] - (self.values[rows] + self.offset)
+            unique, counts = np.unique(deltas, axis=0, return_counts=True)
+            common = unique[np.argmax(counts)]
+            moved = np.flatnonzero((deltas != common).any(axis=1) | (self.seq_nums[rows] != seq_nums[known]))
+            if len(moved) > len(known) // 2:
+                self.clear()
+            else:
+                # shifting keeps the front consistent with what is stored, the moved members are then fixed up.
+                self.shift(common)
+                self.remove_many([keys[known[i]] for i in moved])
+
+        new = [i for i, key in enumerate(keys) if key not in self.rows]
+        self.insert_many([keys[i] for i in new], objectives[new], seq_nums[new])
+
+        rows = np.array([self.rows[k] for k in keys])
+        return np.flatnonzero(self.in_front[rows])
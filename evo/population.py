@@ -0,0 +1,191 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+from evo.pareto import DominanceSort, make_sorter, objective_matrix, uses_default_dominance
+
+
+class ColumnarPopulation(object):
+    """
+    A population of MOORobotInterface robots stored as a structure of arrays: the objectives (all minimized, see
+    objective_matrix), seq nums and evaluation flags are NumPy arrays, and the robots themselves sit in a side table.
+    It behaves like the list AFPOMoo keeps, holes (None) included, so user code and the cull functions still see robots.
+
+    A robot is read once it has been evaluated: when it is added, or by refresh for robots which still needed to be
+    evaluated then. Sorting, the front and culling work on the arrays. If the robots name an age_attribute (see
+    MOORobotInterface), iterate_generation adds one to the age column instead of calling every robot, and a robot's
+    age is written back when it is looked up.
+    """
+    def __init__(self, robots=(), capacity=1024):
+        self.capacity = capacity
+        self.robots = []
+        self.keys = []
+        self.objectives = None
+        self.seq_nums = np.zeros(capacity, dtype=np.int64)
+        self.needs_eval = np.zeros(capacity, dtype=bool)
+        self.age_attribute = None
+        self.default_dominance = True
+        self.extend(robots)
+
+    def __len__(self):
+        return len(self.robots)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.robots)
+        robot = self.robots[i]
+        if robot is not None and self.age_attribute is not None:
+            setattr(robot, self.age_attribute, int(self.objectives[i, 0]))
+        return robot
+
+    def __setitem__(self, i, robot):
+        # culling empties rows, robots are only added with append.
+        assert robot is None, "only None can be assigned to a row of a ColumnarPopulation"
+        self.robots[i] = None
+
+    def __iter__(self):
+        for i in range(len(self.robots)):
+            yield self[i]
+
+    def __getstate__(self):
+        # pickled as the robots, with their ages up to date.
+        return [r for r in self if r is not None]
+
+    def __setstate__(self, robots):
+        self.__init__(robots)
+
+    def _reserve(self, size):
+        while self.capacity < size:
+            old = self.capacity
+            self.capacity *= 2
+            self.objectives = np.concatenate([self.objectives, np.zeros((old, self.objectives.shape[1]))])
+            self.seq_nums = np.concatenate([self.seq_nums, np.zeros(old, dtype=np.int64)])
+            self.needs_eval = np.concatenate([self.needs_eval, np.zeros(old, dtype=bool)])
+
+    def append(self, robot):
+        self.extend([robot])
+
+    def extend(self, robots):
+        robots = list(robots)
+        if not robots:
+            return
+        if self.objectives is None:
+            self.objectives = np.zeros((self.capacity, objective_matrix(robots[:1])[0].shape[1]))
+            self.age_attribute = type(robots[0]).age_attribute
+        if any(type(r).age_attribute != self.age_attribute for r in robots):
+            # robots which age on their own: bring the ages of the others up to date and stop ageing by column.
+            for _ in self:
+                pass
+            self.age_attribute = None
+        self.default_dominance = self.default_dominance and all(uses_default_dominance(r) for r in robots)
+
+        start = len(self.robots)
+        rows = np.arange(start, start + len(robots))
+        self._reserve(rows[-1] + 1)
+        self.robots.extend(robots)
+        self.keys.extend(r.get_id() for r in robots)
+        self.needs_eval[rows] = [r.needs_evaluation() for r in robots]
+        # robots waiting to be evaluated are read by refresh, only their ages are needed until then.
+        waiting = rows[self.needs_eval[rows]]
+        self.objectives[waiting] = np.nan
+        if self.age_attribute is not None:
+            self.objectives[waiting, 0] = [getattr(self.robots[i], self.age_attribute) for i in waiting]
+        self.refresh(rows[~self.needs_eval[rows]])
+
+    def refresh(self, rows=None):
+        """
+        Reads the objectives of robots again, e.g. after they have been evaluated.
+        :param rows: rows to read, defaults to those which needed to be evaluated.
+        """
+        n = len(self.robots)
+        if rows is None:
+            rows = np.flatnonzero(self.needs_eval[:n])
+        rows = np.array([i for i in rows if self.robots[i] is not None], dtype=np.int64).reshape(-1)
+        if len(rows) == 0:
+            return
+        robots = [self[i] for i in rows]
+        self.objectives[rows], self.seq_nums[rows] = objective_matrix(robots)
+        self.needs_eval[rows] = [r.needs_evaluation() for r in robots]
+
+    def needing_evaluation(self):
+        """
+        :return: the robots which needed to be evaluated when they were added or last refreshed.
+        """
+        return [self[i] for i in np.flatnonzero(self.needs_eval[:len(self.robots)]) if self.robots[i] is not None]
+
+    def iterate_generation(self):
+        if self.age_attribute is not None:
+            self.objectives[:len(self.robots), 0] += 1
+            return
+        for robot in self.robots:
+            if robot is not None:
+                robot.iterate_generation()
+        self.refresh(range(len(self.robots)))
+
+    def sync_ages(self, robots):
+        """
+        Writes the ages back to robots of the population which are kept elsewhere too (e.g. the last front), like
+        looking them up does.
+        """
+        if self.age_attribute is None or not robots:
+            return
+        rows = {key: i for i, key in enumerate(self.keys)}
+        for robot in robots:
+            self[rows[robot.get_id()]]
+
+    def compact(self):
+        """
+        Drops the empty rows.
+        :return: self
+        """
+        keep = np.array([i for i, r in enumerate(self.robots) if r is not None], dtype=np.int64)
+        if len(keep) == len(self.robots):
+            return self
+        k = len(keep)
+        self.objectives[:k] = self.objectives[keep]
+        self.seq_nums[:k] = self.seq_nums[keep]
+        self.needs_eval[:k] = self.needs_eval[keep]
+        self.robots = [self.robots[i] for i in keep]
+        self.keys = [self.keys[i] for i in keep]
+        return self
+
+    def discard(self, robots):
+        """
+        Removes robots and compacts.
+        """
+        discarded = set(id(r) for r in robots)
+        for i, robot in enumerate(self.robots):
+            if robot is not None and id(robot) in discarded:
+                self.robots[i] = None
+        self.compact()
+
+    def sorter(self, chunk_size=256):
+        """
+        :return: a DominanceSort over the arrays (which it shares, so it is only valid until the population changes),
+                 or a LegacyDominanceSort if some robots have their own notion of dominance. No row may be empty.
+        """
+        assert all(r is not None for r in self.robots), "compact the population before sorting it"
+        if not self.default_dominance:
+            return make_sorter(list(self), chunk_size=chunk_size)
+        n = len(self.robots)
+        return DominanceSort.from_arrays(self.objectives[:n], self.seq_nums[:n], chunk_size=chunk_size)
+
+    def front(self, archive):
+        """
+        :param archive: an evo.pareto.ParetoArchive to bring up to date.
+        :return: sorted indices of the non-dominated robots.
+        """
+        n = len(self.robots)
+        return archive.sync_arrays(self.keys, self.objectives[:n], self.seq_nums[:n])
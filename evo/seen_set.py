@@ -0,0 +1,198 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import hashlib
+
+from multiprocessing import Lock, RawArray, RawValue
+
+import numpy as np
+
+# Compact sets of arrays that have been seen before, e.g. morphologies when every robot must be unique.
+# Both sets live in shared memory: create them before the worker processes are started (e.g. before the executor)
+# and every process forked afterwards adds to and queries the same set.
+
+
+def _digest(array, digest_size):
+    array = np.ascontiguousarray(array)
+    h = hashlib.blake2b(digest_size=digest_size)
+    h.update(("%s%s" % (array.dtype.str, array.shape)).encode())
+    h.update(array.data)
+    return h.digest()
+
+
+class DigestSet(object):
+    """
+    An open addressing hash table of 64 or 128 bit digests of the arrays added to it.
+    Uses 8 or 16 bytes per slot instead of a tuple of every element. The chance of two different arrays sharing a
+    digest is about n^2 / 2^(bits + 1), i.e. negligible for 128 bits and ~3e-8 at 10^6 arrays for 64 bits.
+    """
+    def __init__(self, capacity=2 ** 22, digest_bits=128, max_load=0.75):
+        """
+        :param capacity: number of slots. Fixed, since the table is shared with other processes.
+        :param digest_bits: 64 or 128.
+        :param max_load: refuse to add more than capacity * max_load arrays.
+        """
+        assert digest_bits in (64, 128), "digest_bits must be 64 or 128"
+        self.capacity = capacity
+        self.words = digest_bits // 64
+        self.max_entries = int(capacity * max_load)
+        self._shared = RawArray("Q", capacity * self.words)
+        # the slot of every digest, in the order they were added, so what was added since some point can be listed.
+        self._shared_log = RawArray("I" if capacity <= 2 ** 32 else "Q", self.max_entries)
+        self._count = RawValue("q", 0)
+        self._lock = Lock()
+        self.table = np.frombuffer(self._shared, dtype=np.uint64).reshape(capacity, self.words)
+        self.log = np.frombuffer(self._shared_log, dtype=np.uint32 if capacity <= 2 ** 32 else np.uint64)
+
+    @classmethod
+    def for_entries(cls, entries, digest_bits=128, max_load=0.75):
+        """
+        :return: a set with room for at least entries arrays. The number of slots is a power of two.
+        """
+        capacity = 1 << max(0, int(math.ceil(entries / max_load)) - 1).bit_length()
+        return cls(capacity, digest_bits=digest_bits, max_load=max_load)
+
+    def __len__(self):
+        return self._count.value
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + self.log.nbytes
+
+    def _key(self, array):
+        digest = _digest(array, 8 * self.words)
+        key = [int.from_bytes(digest[i:i + 8], "little") for i in range(0, len(digest), 8)]
+        # all zeros marks an empty slot.
+        return key if any(key) else [1] * self.words
+
+    def _find(self, key):
+        # linear probing from the slot picked by the first word. Returns the slot holding key, or the empty slot
+        # where it would go, and whether the slot is occupied.
+        slot = key[0] % self.capacity
+        while True:
+            row = self.table[slot].tolist()
+            if row == key:
+                return slot, True
+            if not any(row):
+                return slot, False
+            slot = (slot + 1) % self.capacity
+
+    def __contains__(self, array):
+        return self._find(self._key(array))[1]
+
+    def get_state(self, since=0):
+        """
+        :param since: an earlier len() of the set, to only get what was added after it, e.g. for incremental
+                      checkpoints.
+        :return: (n, words) array of the digests added, in the order they were added.
+        """
+        return self.table[self.log[since:len(self)]]
+
+    def set_state(self, state):
+        """
+        Adds the digests from get_state. Restores the set if it is empty and every state is given in order.
+        """
+        with self._lock:
+            for key in state.tolist():
+                self._insert(key)
+
+    def clear(self):
+        with self._lock:
+            self.table[:] = 0
+            self._count.value = 0
+
+    def _insert(self, key):
+        slot, occupied = self._find(key)
+        if occupied:
+            return False
+        if self._count.value >= self.max_entries:
+            raise RuntimeError("DigestSet is full with %d arrays, make it for more (e.g. utils.SEEN_CAPACITY)"
+                               % self._count.value)
+        self.table[slot] = key
+        self.log[self._count.value] = slot
+        self._count.value += 1
+        return True
+
+    def add(self, array):
+        """
+        :return: True if the array had not been seen before.
+        """
+        key = self._key(array)
+        with self._lock:
+            return self._insert(key)
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter over the arrays added to it. Never forgets an array, but wrongly claims an unseen array was seen
+    with probability false_positive_rate once capacity arrays have been added. Smaller than a DigestSet: ~1.2 bytes
+    per array at a 1% false positive rate.
+    """
+    def __init__(self, capacity=10 ** 7, false_positive_rate=0.01):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.num_bits = int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self._shared = RawArray("B", (self.num_bits + 7) // 8)
+        self._count = RawValue("q", 0)
+        self._lock = Lock()
+        self.bits = np.frombuffer(self._shared, dtype=np.uint8)
+
+    def __len__(self):
+        return self._count.value
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def _positions(self, array):
+        # double hashing: the k positions are h1 + i * h2.
+        digest = _digest(array, 16)
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little")
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def _test(self, positions):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def __contains__(self, array):
+        return self._test(self._positions(array))
+
+    def get_state(self):
+        return self.bits.copy(), len(self)
+
+    def clear(self):
+        with self._lock:
+            self.bits[:] = 0
+            self._count.value = 0
+
+    def set_state(self, state):
+        bits, count = state
+        self.bits[:] = bits
+        self._count.value = count
+
+    def add(self, array):
+        """
+        :return: True if the array had (probably) not been seen before.
+        """
+        positions = self._positions(array)
+        with self._lock:
+            if self._test(positions):
+                return False
+            for p in positions:
+                self.bits[p >> 3] |= 1 << (p & 7)
+            self._count.value += 1
+        return True
@@ -0,0 +1,211 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+import numpy as np
+
+
+def _pad(rows, width):
+    # features may get longer as the run goes on (e.g. a new material is used), missing trailing features are 0.
+    matrix = np.zeros((len(rows), width))
+    for i, row in enumerate(rows):
+        row = row[:width]
+        matrix[i, :len(row)] = row
+    return matrix
+
+
+def _ranks(values):
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="stable")] = np.arange(len(values))
+    return ranks
+
+
+class Surrogate(object):
+    """
+    Predicts fitness from the features robots give through get_surrogate_features, so that only promising (or
+    poorly understood) robots are simulated.
+
+    The model is an ensemble of ridge regressions, each fit to a bootstrap sample of the evaluated robots. The mean of
+    the ensemble is the prediction and its spread the uncertainty. Robots are ranked by how good their predicted fitness
+    is plus uncertainty_weight * std and the top budget fraction is simulated. A random audit_fraction of the rest is
+    simulated anyway: how many of those reach the front estimates how much of the front screening loses.
+
+    Until min_samples robots have been evaluated everything is simulated.
+    """
+    def __init__(self, budget=0.5, retrain_every=1, min_samples=50, max_samples=5000, ensemble_size=5,
+                 uncertainty_weight=1.0, audit_fraction=0.1, ridge=1e-2, seed=0, maximize=True):
+        """
+        :param budget: fraction of the screened robots to simulate.
+        :param retrain_every: refit the model every this many generations.
+        :param min_samples: number of evaluated robots needed before screening starts.
+        :param max_samples: train on at most this many of the most recently evaluated robots.
+        :param ensemble_size: number of bootstrap models.
+        :param uncertainty_weight: how much to favour robots the models disagree on.
+        :param audit_fraction: fraction of the rejected robots to simulate anyway, to measure what screening costs.
+        :param ridge: regularization strength.
+        :param seed: the surrogate has its own random generator, so it does not change the run's random sequence.
+        :param maximize: True if higher fitnesses are better, False if they are errors to minimize (e.g. robots with
+                         optimize_mode "error").
+        """
+        assert 0 < budget <= 1, "budget must be in (0, 1]"
+        self.budget = budget
+        self.retrain_every = retrain_every
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.ensemble_size = ensemble_size
+        self.uncertainty_weight = uncertainty_weight
+        self.audit_fraction = audit_fraction
+        self.ridge = ridge
+        self.maximize = maximize
+        self.random = np.random.RandomState(seed)
+
+        self.features = []
+        self.fitnesses = []
+        self.width = None
+        self.weights = None
+        self.mean = self.scale = None
+        self.generations_since_training = 0
+
+        self.predictions = {}  # id(robot) -> predicted fitness, for robots simulated this generation.
+        self.audited = set()  # id(robot) of rejected robots simulated anyway.
+        self.stats = None
+        self.reset_stats()
+
+    @property
+    def trained(self):
+        return self.weights is not None
+
+    def reset_stats(self):
+        """
+        :return: the metrics gathered since the last call.
+        """
+        stats = self.stats
+        self.stats = {"screened": 0, "simulations_saved": 0, "audited": 0, "audited_on_front": 0}
+        return stats
+
+    def _design(self, rows):
+        x = (_pad(rows, self.width) - self.mean) / self.scale
+        return np.hstack([x, np.ones((len(x), 1))])
+
+    def train(self):
+        rows = self.features[-self.max_samples:]
+        y = np.array(self.fitnesses[-self.max_samples:])
+        self.width = max(len(r) for r in rows)
+        raw = _pad(rows, self.width)
+        self.mean = raw.mean(axis=0)
+        self.scale = raw.std(axis=0)
+        self.scale[self.scale == 0] = 1
+        x = self._design(rows)
+        penalty = self.ridge * len(y) * np.eye(x.shape[1])
+        penalty[-1, -1] = 0  # the intercept is not regularized.
+
+        weights = []
+        for _ in range(self.ensemble_size):
+            sample = self.random.randint(0, len(y), len(y))
+            xs = x[sample]
+            weights.append(np.linalg.solve(xs.T @ xs + penalty, xs.T @ y[sample]))
+        self.weights = np.array(weights).T
+        self.generations_since_training = 0
+
+    def predict(self, rows):
+        """
+        :param rows: list of feature arrays.
+        :return: (predicted fitness, uncertainty) arrays.
+        """
+        predictions = self._design(rows) @ self.weights
+        return predictions.mean(axis=1), predictions.std(axis=1)
+
+    def screen(self, robots):
+        """
+        Picks which robots to simulate.
+        :param robots: robots which need to be evaluated.
+        :return: (robots to simulate, robots rejected)
+        """
+        self.predictions = {}
+        self.audited = set()
+        self.generations_since_training += 1
+        if len(self.fitnesses) >= self.min_samples and (not self.trained or
+                                                        self.generations_since_training >= self.retrain_every):
+            self.train()
+
+        screened = []
+        features = []
+        simulate = []
+        for r in robots:
+            f = r.get_surrogate_features()
+            if f is None:
+                simulate.append(r)
+            else:
+                screened.append(r)
+                features.append(np.asarray(f, dtype=np.float64))
+        if not self.trained or not screened:
+            return robots, []
+
+        mean, std = self.predict(features)
+        # optimistic: the best fitness the robot is likely to have.
+        goodness = mean if self.maximize else -mean
+        order = np.argsort(-(goodness + self.uncertainty_weight * std), kind="stable")
+        keep = int(math.ceil(self.budget * len(screened)))
+        rejected = []
+        for position, i in enumerate(order):
+            robot = screened[i]
+            if position < keep:
+                simulate.append(robot)
+            elif self.random.random_sample() < self.audit_fraction:
+                simulate.append(robot)
+                self.audited.add(id(robot))
+            else:
+                rejected.append(robot)
+                continue
+            self.predictions[id(robot)] = mean[i]
+
+        self.stats["screened"] += len(screened)
+        self.stats["simulations_saved"] += len(rejected)
+        self.stats["audited"] += len(self.audited)
+        return simulate, rejected
+
+    def observe(self, robots):
+        """
+        Learns from robots which have just been evaluated, and records how good the predictions for them were.
+        """
+        actual, predicted = [], []
+        for r in robots:
+            f = r.get_surrogate_features()
+            if f is None:
+                continue
+            self.features.append(np.asarray(f, dtype=np.float64))
+            self.fitnesses.append(r.get_fitness())
+            if id(r) in self.predictions:
+                actual.append(r.get_fitness())
+                predicted.append(self.predictions[id(r)])
+        del self.features[:-self.max_samples]
+        del self.fitnesses[:-self.max_samples]
+
+        if len(actual) >= 2:
+            actual, predicted = np.array(actual), np.array(predicted)
+            self.stats["mean_absolute_error"] = float(np.abs(actual - predicted).mean())
+            rank_actual, rank_predicted = _ranks(actual), _ranks(predicted)
+            if rank_actual.std() > 0 and rank_predicted.std() > 0:
+                self.stats["rank_correlation"] = float(np.corrcoef(rank_actual, rank_predicted)[0, 1])
+
+    def record_front(self, front):
+        """
+        :param front: the non-dominated robots after culling. Counts how many of them were audited rejects.
+        """
+        on_front = sum(1 for r in front if id(r) in self.audited)
+        self.stats["audited_on_front"] += on_front
+        if self.audit_fraction > 0:
+            # every audited reject stands for 1 / audit_fraction rejects.
+            self.stats["estimated_front_lost"] = on_front * (1 - self.audit_fraction) / self.audit_fraction
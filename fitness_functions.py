@@ -0,0 +1,130 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+import zlib
+
+import numpy as np
+
+# Reference fitness functions of a morphology (an array of material ids, 0 is empty), all maximized. They stand in for
+# a simulator so the search can be run, benchmarked and regression tested as shipped, see SyntheticSimulator.
+
+
+def voxel_count(morphology):
+    return float(np.count_nonzero(morphology))
+
+
+def material_diversity(morphology):
+    """
+    :return: the entropy (in bits) of the materials of the non-empty voxels.
+    """
+    counts = np.bincount(morphology.ravel())[1:]
+    counts = counts[counts > 0]
+    if len(counts) == 0:
+        return 0.0
+    p = counts / counts.sum()
+    return float((p * np.log2(1 / p)).sum())
+
+
+def largest_component(morphology):
+    """
+    :return: the number of voxels in the largest set of non-empty voxels connected through their faces.
+    """
+    filled = morphology > 0
+    if not filled.any():
+        return 0
+    # every voxel takes the smallest label of its neighbours until nothing changes.
+    empty = filled.size
+    labels = np.where(filled, np.arange(filled.size).reshape(filled.shape), empty)
+    while True:
+        new = labels.copy()
+        for axis in range(labels.ndim):
+            lower = tuple(slice(None, -1) if a == axis else slice(None) for a in range(labels.ndim))
+            upper = tuple(slice(1, None) if a == axis else slice(None) for a in range(labels.ndim))
+            np.minimum(new[lower], labels[upper], out=new[lower])
+            np.minimum(new[upper], labels[lower], out=new[upper])
+        new[~filled] = empty
+        if np.array_equal(new, labels):
+            return int(np.bincount(labels[filled]).max())
+        labels = new
+
+
+def exposed_faces(morphology):
+    """
+    :return: the number of faces of non-empty voxels which touch an empty voxel or the edge of the workspace.
+    """
+    padded = np.pad(morphology > 0, 1).astype(np.int8)
+    return int(sum(np.count_nonzero(np.diff(padded, axis=axis)) for axis in range(padded.ndim)))
+
+
+def compactness(morphology):
+    """
+    :return: in (0, 1]: the fraction of voxels in the largest connected piece, times how close the surface is to that
+             of a cube of the same volume. 0 for an empty morphology.
+    """
+    filled = np.count_nonzero(morphology)
+    if filled == 0:
+        return 0.0
+    connected = largest_component(morphology) / filled
+    return float(connected * 2 * morphology.ndim * filled ** ((morphology.ndim - 1) / morphology.ndim) /
+                 exposed_faces(morphology))
+
+
+FITNESS_FUNCTIONS = {
+    "voxels": voxel_count,
+    "diversity": material_diversity,
+    "compactness": compactness,
+}
+
+
+class SyntheticSimulator(object):
+    """
+    Stands in for a simulator with a tunable cost: spends seconds (times the fidelity, see evo.fidelity) either
+    burning cpu or sleeping (like waiting on an external simulator, which releases the GIL), then returns one of the
+    FITNESS_FUNCTIONS of the morphology. Below full fidelity the fitness is off by a deterministic error of up to noise
+    times (1 - fidelity). jitter makes some evaluations take longer, like simulations of unstable robots do.
+    Everything only depends on the morphology, so runs are reproducible and fitnesses can be cached.
+    """
+    def __init__(self, fitness="compactness", seconds=0.0, mode="burn", noise=0.1, jitter=0.0):
+        """
+        :param fitness: a name from FITNESS_FUNCTIONS.
+        :param seconds: time one full fidelity evaluation takes.
+        :param mode: "burn" to keep a cpu busy, "sleep" to wait.
+        :param noise: largest error of an evaluation at fidelity 0.
+        :param jitter: largest extra time, as a multiple of seconds.
+        """
+        assert fitness in FITNESS_FUNCTIONS, "fitness must be one of %s" % sorted(FITNESS_FUNCTIONS)
+        assert mode in ("burn", "sleep"), "mode must be burn or sleep"
+        self.fitness = fitness
+        self.seconds = seconds
+        self.mode = mode
+        self.noise = noise
+        self.jitter = jitter
+
+    @property
+    def identity(self):
+        # how long evaluations take does not change their fitness.
+        return "SyntheticSimulator(%r, noise=%r)" % (self.fitness, self.noise)
+
+    def __call__(self, morphology, fidelity=1.0):
+        # a number in [0, 1) which only depends on the morphology.
+        draw = zlib.crc32(np.ascontiguousarray(morphology).tobytes()) / 2 ** 32
+        seconds = self.seconds * fidelity * (1 + self.jitter * draw)
+        if self.mode == "sleep":
+            time.sleep(seconds)
+        else:
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                pass
+        return FITNESS_FUNCTIONS[self.fitness](morphology) + self.noise * (1 - fidelity) * (2 * draw - 1)
@@ -12,13 +12,33 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 import sys
+import shlex
 import random
+import argparse
 import numpy
 
 from evo.afpomoo import AFPOMoo
+from evo.async_afpomoo import AsyncAFPOMoo
+from evo.batching import AdaptiveChunking
+from evo.checkpoint import Checkpointer
+from evo.culling import CULL_MODES
+from evo.fault_tolerance import FaultTolerance
+from evo.fidelity import MultiFidelity
+from evo.fitness_cache import FitnessCache
+from evo.islands import TOPOLOGIES, IslandModel
+from evo.lineage import LineageRecorder
+from evo.executors import ProcessExecutor, SerialExecutor, ThreadExecutor, WorkerFarmExecutor
+from evo.seen_set import BloomFilter
+from evo.surrogate import Surrogate
+from fitness_functions import FITNESS_FUNCTIONS, SyntheticSimulator
+from morphology_io import CompactMorphology
+from simulator_sessions import WarmSimulator
+import softbot_robot
 from softbot_robot import SoftbotRobot
-from utils import StructureGenotype, StructurePhenotype, get_seq_num
+import utils
+from utils import get_seq_num
 
 
 # To change the number of materials,
@@ -37,26 +57,242 @@ GENS = 200 # how many generations are we optimizing for?
 
 printing = True
 
+
+def run_islands(args, robot_factory, make_executor=None):
+    # island i is seeded with seed + i, so every island (and the whole run) can be reproduced.
+    seeds = [args.seed + i for i in range(args.islands)]
+    kwargs = {"executor": make_executor} if make_executor is not None else {}
+    islands = IslandModel(robot_factory, seeds, pop_size=POP_SIZE, migration_interval=args.migration_interval,
+                          migrants=args.migrants, topology=args.migration_topology, cull_mode=args.cull_mode, **kwargs)
+    if printing:
+        print("%d islands with seeds %s" % (args.islands, seeds))
+
+    for generation in range(0, GENS, args.migration_interval):
+        stats = islands.epoch()
+        if printing:
+            print("generations %d to %d" % (generation, islands.generations - 1))
+            for s in stats:
+                print("island %(island)d: best fitness %(best_fitness).3f, %(front)d individuals are dominating, "
+                      "%(evaluations)d evaluations" % s)
+            print("%.2f evaluations per second" % islands.evaluations_per_second())
+
+    best_fit, best_robot = islands.get_best()
+    if printing:
+        print("best robot:", best_robot)
+    islands.cleanup()
+
+
 if __name__ == '__main__':
-    assert len(sys.argv) >= 2, "please run as python job.py seed"
-    seed = int(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Search for robot morphologies with AFPO.")
+    parser.add_argument("seed", type=int)
+    parser.add_argument("--executor", choices=["process", "thread", "serial", "farm"], default=None,
+                        help="where robots are evaluated (default: a process pool on this host, or in the island's "
+                             "own process with --islands)")
+    parser.add_argument("--workers", type=int, default=None, help="number of cpus to use (default: all of them)")
+    parser.add_argument("--farm-address", default="localhost:6000",
+                        help="host:port to accept farm workers on, join it with python worker.py host:port. "
+                             "Workers and job share the secret in the MORPH_SEARCH_AUTHKEY environment variable.")
+    parser.add_argument("--cull-mode", choices=sorted(CULL_MODES), default="legacy",
+                        help="how dominated robots are removed: legacy (default) keeps the original selection, "
+                             "tournament and crowding take a bounded time on large populations")
+    parser.add_argument("--steady-state", action="store_true",
+                        help="insert each robot as soon as it is evaluated instead of waiting for the whole generation")
+    parser.add_argument("--fitness-cache", type=int, default=0, metavar="ENTRIES",
+                        help="remember the fitness of this many bodies to skip re-simulating them (default: off)")
+    parser.add_argument("--fitness-cache-file", default=None,
+                        help="also keep every cached fitness in this sqlite file, so it is reused by later runs")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="GENS",
+                        help="save the run every this many generations (default: 0, never). Not with --islands")
+    parser.add_argument("--checkpoint-dir", default=None, help="where to save the run (default: checkpoint_<seed>)")
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--surrogate-budget", type=float, default=None, metavar="FRACTION",
+                        help="only simulate this fraction of the children a surrogate model predicts to be the best")
+    parser.add_argument("--surrogate-retrain-every", type=int, default=1, metavar="GENS",
+                        help="refit the surrogate model every this many generations (default: 1)")
+    parser.add_argument("--islands", type=int, default=0, metavar="N",
+                        help="run N populations in their own processes, seeded with seed, seed + 1, ...")
+    parser.add_argument("--migration-interval", type=int, default=5, metavar="GENS",
+                        help="generations between migrations between islands (default: 5)")
+    parser.add_argument("--migrants", type=int, default=2, help="robots each island sends per migration (default: 2)")
+    parser.add_argument("--migration-topology", choices=TOPOLOGIES, default="ring",
+                        help="which islands receive an island's migrants (default: ring)")
+    parser.add_argument("--phenotype-batch", type=int, default=0, metavar="N",
+                        help="build random phenotypes N at a time and filter them together (default: one by one)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="keep the population in NumPy arrays, for very large populations")
+    parser.add_argument("--lineage", default=None, metavar="FILE",
+                        help="record every robot's parent, fitness and morphology digest in the SQLite database FILE")
+    parser.add_argument("--task-timeout", type=float, default=None, metavar="SECONDS",
+                        help="give up on a simulation still running after SECONDS and run it again")
+    parser.add_argument("--task-retries", type=int, default=2, metavar="N",
+                        help="times a crashed or timed out simulation is run again before the robot is given the "
+                             "worst fitness (default: 2)")
+    parser.add_argument("--speculate-after", type=float, default=None, metavar="FRACTION",
+                        help="once FRACTION of a generation is evaluated, run copies of the slowest simulations on "
+                             "idle workers")
+    parser.add_argument("--chunk-size", default=None, metavar="N|auto",
+                        help="evaluate N robots per task, or pick N from how long evaluations take with auto")
+    parser.add_argument("--low-fidelity", type=float, default=None, metavar="FRACTION",
+                        help="simulate children for FRACTION of the time first, and fully only if they could reach "
+                             "the front")
+    parser.add_argument("--synthetic-fitness", choices=sorted(FITNESS_FUNCTIONS), default=None,
+                        help="evaluate robots with a reference fitness function instead of the simulator")
+    parser.add_argument("--synthetic-seconds", type=float, default=0.0, metavar="SECONDS",
+                        help="time each synthetic evaluation takes (default: 0)")
+    parser.add_argument("--synthetic-mode", choices=["burn", "sleep"], default="burn",
+                        help="burn cpu or sleep for --synthetic-seconds (default: burn)")
+    parser.add_argument("--simulator-command", default=None, metavar="COMMAND",
+                        help="keep one simulator process started with COMMAND running in every worker and stream "
+                             "morphologies to it, e.g. \"python ../simulator_server.py\"")
+    parser.add_argument("--simulator-restart-every", type=int, default=1000, metavar="N",
+                        help="start a new --simulator-command process after N evaluations (default: 1000)")
+    parser.add_argument("--morphology-storage", choices=CompactMorphology.ENCODINGS, default=None,
+                        help="keep only a compact copy of each robot's morphology, for large IND_SIZE and populations")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="append a JSON line with the time spent in each phase of every generation to FILE")
+    args = parser.parse_args()
+    seed = args.seed
+    if args.steady_state:
+        # robots which are still being evaluated can not be checkpointed.
+        assert not args.resume, "can not resume a --steady-state run"
+        assert not args.columnar, "--steady-state keeps its population in a list"
+        assert args.task_timeout is None and args.speculate_after is None, \
+            "--steady-state does not wait for slow simulations"
+        assert args.chunk_size is None, "--steady-state inserts robots one at a time"
+        assert args.low_fidelity is None, "--steady-state has no front to screen children against"
+        assert args.surrogate_budget is None, "--steady-state has no generation of children to rank"
+        args.checkpoint_every = 0
+    # everything else a resumed run depends on is saved in the checkpoint. Only the file of a fitness cache outlives
+    # the run (a resumed run finds the same fitnesses in it, but counts different hits).
+    assert not (args.resume and args.fitness_cache and args.fitness_cache_file is None), \
+        "only the --fitness-cache-file of a fitness cache is kept across a --resume"
+
+    if args.executor == "farm":
+        assert "MORPH_SEARCH_AUTHKEY" in os.environ, \
+            "please set MORPH_SEARCH_AUTHKEY to the secret the farm workers are started with"
 
     numpy.random.seed(seed)
     random.seed(seed)
+    utils.PHENOTYPE_BATCH_SIZE = args.phenotype_batch
+    softbot_robot.MORPHOLOGY_STORAGE = args.morphology_storage
+    if args.synthetic_fitness is not None:
+        softbot_robot.SIMULATOR = SyntheticSimulator(args.synthetic_fitness, seconds=args.synthetic_seconds,
+                                                     mode=args.synthetic_mode)
+    if args.simulator_command is not None:
+        assert args.synthetic_fitness is None, "--synthetic-fitness replaces the simulator"
+        softbot_robot.SIMULATOR = WarmSimulator(shlex.split(args.simulator_command),
+                                                max_evaluations=args.simulator_restart_every, timeout=args.task_timeout)
+
+    # create the shared set of seen morphologies before any worker processes are started.
+    if utils.FORCE_MORPH_ONCE:
+        # every generation makes about POP_SIZE new morphologies (children and an immigrant), with room to spare.
+        utils.get_morphologies_seen_before(expected=2 * POP_SIZE * (GENS + 1) * max(1, args.islands))
 
     # Setup evo run
     def get_phenotype():
-        new_phenotype = StructurePhenotype(StructureGenotype)
+        new_phenotype = utils.random_phenotype()
         return new_phenotype
 
     def robot_factory():
         phenotype = get_phenotype()
         return SoftbotRobot(phenotype, get_seq_num, "run_%d" % seed)
 
-    afpo_alg = AFPOMoo(robot_factory, pop_size=POP_SIZE)
+    def make_executor(cpus_per_task):
+        if args.executor == "serial":
+            return SerialExecutor()
+        elif args.executor == "thread":
+            return ThreadExecutor(args.workers, cpus_per_task=cpus_per_task)
+        elif args.executor == "farm":
+            host, port = args.farm_address.rsplit(":", 1)
+            return WorkerFarmExecutor((host, int(port)), authkey=os.environ["MORPH_SEARCH_AUTHKEY"].encode())
+        return ProcessExecutor(args.workers, cpus_per_task=cpus_per_task)
+
+    if args.islands:
+        assert not (args.steady_state or args.resume or args.fitness_cache or args.fitness_cache_file or
+                    args.surrogate_budget is not None or args.columnar or args.lineage or
+                    args.task_timeout is not None or args.speculate_after is not None or
+                    args.chunk_size is not None or args.low_fidelity is not None), \
+            "--islands runs plain AFPO populations"
+        assert not args.checkpoint_every, "--islands runs can not be checkpointed"
+        assert args.executor != "farm", "every island would listen on the same --farm-address"
+        run_islands(args, robot_factory, make_executor if args.executor is not None else None)
+        sys.exit(0)
+
+    lineage = LineageRecorder(args.lineage) if args.lineage is not None else None
+    fitness_cache = None
+    if args.fitness_cache or args.fitness_cache_file:
+        fitness_cache = FitnessCache(max_entries=args.fitness_cache or 100000, path=args.fitness_cache_file,
+                                     evaluator=softbot_robot.evaluator_identity())
+    if args.steady_state:
+        afpo_alg = AsyncAFPOMoo(robot_factory, pop_size=POP_SIZE, messages_file=args.profile, cull_mode=args.cull_mode,
+                                executor=make_executor, id_allocator=utils.ROBOT_IDS, lineage=lineage,
+                                fitness_cache=fitness_cache)
+    else:
+        surrogate = None
+        if args.surrogate_budget is not None:
+            surrogate = Surrogate(budget=args.surrogate_budget, retrain_every=args.surrogate_retrain_every, seed=seed)
+        fault_tolerance = None
+        if args.task_timeout is not None or args.speculate_after is not None:
+            fault_tolerance = FaultTolerance(timeout=args.task_timeout, retries=args.task_retries,
+                                             speculate_after=args.speculate_after)
+        chunking = None
+        if args.chunk_size is not None:
+            assert fault_tolerance is None, "--chunk-size can not be combined with --task-timeout or --speculate-after"
+            chunking = AdaptiveChunking(fixed_size=None if args.chunk_size == "auto" else int(args.chunk_size))
+        afpo_alg = AFPOMoo(robot_factory, pop_size=POP_SIZE, messages_file=args.profile, cull_mode=args.cull_mode,
+                           executor=make_executor, fitness_cache=fitness_cache, id_allocator=utils.ROBOT_IDS,
+                           surrogate=surrogate, columnar=args.columnar,
+                           lineage=lineage, fault_tolerance=fault_tolerance, chunking=chunking,
+                           fidelity=MultiFidelity(args.low_fidelity) if args.low_fidelity is not None else None)
+
+    checkpointer = None
+    if args.checkpoint_every or args.resume:
+        checkpointer = Checkpointer(args.checkpoint_dir or "checkpoint_%d" % seed, every=max(1, args.checkpoint_every))
+
+    # how many of the morphologies seen are in the checkpoint's journals already.
+    seen_saved = [0]
+
+    def checkpoint_extra():
+        # state which lives outside of the algorithm. The robot ids are saved with the algorithm.
+        # a Bloom filter can not list what was added since the last snapshot, so it is saved whole.
+        seen = utils.get_morphologies_seen_before() if utils.FORCE_MORPH_ONCE else None
+        return {"seen": seen.get_state() if isinstance(seen, BloomFilter) else None,
+                "surrogate": afpo_alg.surrogate,
+                "phenotype_sampler": utils.PHENOTYPE_SAMPLER,
+                "phenotypes_checked": (utils.StructurePhenotype.checked, utils.StructurePhenotype.accepted)}
+
+    def checkpoint_journal():
+        # only the digests of the morphologies seen since the last snapshot.
+        if not utils.FORCE_MORPH_ONCE or isinstance(utils.get_morphologies_seen_before(), BloomFilter):
+            return None
+        added = utils.get_morphologies_seen_before().get_state(since=seen_saved[0])
+        seen_saved[0] += len(added)
+        return added
+
+    first_generation = 0
+    if args.resume:
+        assert checkpointer.exists(), "no checkpoint to resume from in %s" % checkpointer.directory
+        last_generation, extra = checkpointer.load(afpo_alg)
+        if utils.FORCE_MORPH_ONCE:
+            # forget the morphologies of the population the checkpoint's replaced.
+            utils.get_morphologies_seen_before().clear()
+            if extra["seen"] is not None:
+                utils.get_morphologies_seen_before().set_state(extra["seen"])
+            for added in checkpointer.load_journal():
+                utils.get_morphologies_seen_before().set_state(added)
+            seen_saved[0] = len(utils.get_morphologies_seen_before())
+        # the surrogate's model and training set, and the random phenotypes built but not handed out yet.
+        afpo_alg.surrogate = extra["surrogate"]
+        utils.PHENOTYPE_SAMPLER = extra["phenotype_sampler"]
+        utils.StructurePhenotype.checked, utils.StructurePhenotype.accepted = extra["phenotypes_checked"]
+        first_generation = last_generation + 1
+        if lineage is not None:
+            # generations after the checkpoint are run again.
+            lineage.truncate(first_generation)
+        print("resuming after generation %d" % last_generation)
 
     # do each generation.
-    for generation in range(GENS):
+    for generation in range(first_generation, GENS):
         if printing:
             print("generation %d" % (generation))
 
@@ -64,8 +300,39 @@ if __name__ == '__main__':
 
         if printing:
             print("%d individuals are dominating" % (dom_data[0],))
+            print("%(dominance_comparisons)d dominance comparisons, %(cull_comparisons)d culling comparisons"
+                  % afpo_alg.generation_stats)
+            if args.steady_state:
+                print("%.2f evaluations per second" % afpo_alg.generation_stats["evaluations_per_second"])
+            if "chunks" in afpo_alg.generation_stats:
+                print("evaluated in %(chunks)d tasks of up to %(chunk_size)d robots" % afpo_alg.generation_stats)
+            if "fidelity_screened" in afpo_alg.generation_stats:
+                print("fidelity: %(fidelity_promoted)d of %(fidelity_screened)d children fully simulated, "
+                      "%(fidelity_low_evaluations)d short simulations, %(fidelity_compute_saved).1f full simulations "
+                      "saved" % afpo_alg.generation_stats)
+            if "cache_hits" in afpo_alg.generation_stats:
+                print("fitness cache: %(cache_hits)d hits, %(cache_misses)d misses, %(cache_duplicates)d duplicates"
+                      % afpo_alg.generation_stats)
+            if "surrogate_screened" in afpo_alg.generation_stats:
+                print("surrogate: %(surrogate_simulations_saved)d of %(surrogate_screened)d simulations saved, "
+                      "%(surrogate_audited_on_front)d of %(surrogate_audited)d audited rejects reached the front"
+                      % afpo_alg.generation_stats)
+            if any(afpo_alg.generation_stats.get(k) for k in ("dispatch_retries", "dispatch_penalties",
+                                                              "dispatch_speculative")):
+                print("dispatch: %(dispatch_failures)d failed, %(dispatch_timeouts)d timed out, "
+                      "%(dispatch_retries)d retried, %(dispatch_penalties)d penalized, "
+                      "%(dispatch_speculative_wins)d of %(dispatch_speculative)d copies finished first"
+                      % afpo_alg.generation_stats)
+            print("%.1f%% of candidate phenotypes were valid" % (100 * utils.acceptance_rate()))
             dom_inds = sorted(dom_data[1], key= lambda x: x.get_fitness(), reverse=False)
             print('\n'.join([str(d) for d in dom_inds]))
 
         best_fit, best_robot = afpo_alg.get_best()
 
+        saved = args.checkpoint_every and checkpointer.maybe_save(afpo_alg, generation, checkpoint_extra,
+                                                                  checkpoint_journal)
+        if saved and printing:
+            print("checkpoint: wrote %d new robots in %.1f ms" % (checkpointer.last_save_robots,
+                                                                  1000 * checkpointer.last_save_seconds))
+
+    afpo_alg.cleanup()
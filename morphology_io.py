@@ -0,0 +1,183 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import struct
+import tempfile
+
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+
+# Ways of handing a morphology to a simulator.
+# Text: one line per non-empty voxel in the format x,y,z|materialId
+# Binary: MAGIC, then the number of dimensions and each dimension as uint32, then one uint8 material id per voxel in
+# C order (x major). Material ids must be < 256.
+
+MAGIC = b"MRPH\x01"
+
+
+@lru_cache(maxsize=4)
+def _voxel_prefixes(shape):
+    # "x,y,z|" for every voxel, built once per workspace size.
+    line = ",".join(["%d"] * len(shape)) + "|"
+    return np.array([line % index for index in np.ndindex(*shape)], dtype=object)
+
+
+@lru_cache(maxsize=4)
+def _material_names(count):
+    return np.array([str(i) for i in range(count)], dtype=object)
+
+
+def morphology_to_text(morphology):
+    """
+    Vectorized equivalent of '\n'.join("%d,%d,%d|%d" % (*index, x) for index, x in np.ndenumerate(m) if x)
+    """
+    flat = morphology.ravel()
+    voxels = np.flatnonzero(flat)
+    if len(voxels) == 0:
+        return ""
+    materials = flat[voxels]
+    names = _material_names(max(256, int(materials.max()) + 1))
+    return "\n".join((_voxel_prefixes(morphology.shape)[voxels] + names[materials]).tolist())
+
+
+def morphology_to_bytes(morphology):
+    header = MAGIC + struct.pack("<%dI" % (morphology.ndim + 1), morphology.ndim, *morphology.shape)
+    return header + np.ascontiguousarray(morphology, dtype=np.uint8).tobytes()
+
+
+def morphology_from_bytes(data):
+    ndim, = struct.unpack_from("<I", data, len(MAGIC))
+    shape = struct.unpack_from("<%dI" % ndim, data, len(MAGIC) + 4)
+    offset = len(MAGIC) + 4 * (ndim + 1)
+    return np.frombuffer(data, dtype=np.uint8, offset=offset).reshape(shape)
+
+
+@contextmanager
+def morphology_handoff(morphology, file_name, mode="file", binary=False):
+    """
+    Writes the morphology somewhere a simulator can open it by path, and cleans up afterwards.
+    To hand it over through a pipe instead, pass morphology_to_text / morphology_to_bytes as the simulator's stdin.
+    :param file_name: name to use for the file, e.g. Robot_Morph_0000000001.txt
+    :param mode: "file": in the current directory (the original behaviour).
+                 "memfd": an anonymous in-memory file (Linux only), falls back to "shm" elsewhere.
+                 "shm": a file in /dev/shm (or the temp directory if there is no /dev/shm).
+    :param binary: write the binary format instead of text.
+    :return: the path of the morphology, valid until the with block ends.
+    """
+    data = morphology_to_bytes(morphology) if binary else morphology_to_text(morphology).encode()
+
+    if mode == "memfd" and hasattr(os, "memfd_create"):
+        fd = os.memfd_create(file_name)
+        try:
+            with os.fdopen(fd, "wb", closefd=False) as f:
+                f.write(data)
+            # through the pid, so child processes can open it without inheriting the descriptor.
+            yield "/proc/%d/fd/%d" % (os.getpid(), fd)
+        finally:
+            os.close(fd)
+        return
+
+    if mode in ("memfd", "shm"):
+        directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        path = os.path.join(directory, "%d_%s" % (os.getpid(), file_name))
+    elif mode == "file":
+        path = file_name
+    else:
+        raise ValueError("unknown morphology handoff mode %s" % mode)
+
+    with open(path, "wb") as f:
+        f.write(data)
+    try:
+        yield path
+    finally:
+        os.remove(path)
+
+
+def _smallest(values, at_least=0):
+    # values in the narrowest unsigned type which holds them (and at_least).
+    top = max(int(values.max()) if len(values) else 0, at_least)
+    return values.astype(np.min_scalar_type(top))
+
+
+class CompactMorphology(object):
+    """
+    A morphology kept small while a robot waits in the population, decoded (to its original dtype and shape) only
+    when it is needed. Encodings:
+      dense:  every voxel, as the narrowest unsigned type which holds the highest material.
+      sparse: flat indices and materials of the non-empty voxels, for mostly empty bodies.
+      rle:    run lengths and materials of runs of equal voxels (in C order), for bodies made of large blocks.
+      auto:   whichever of them is smallest.
+    """
+    __slots__ = ("shape", "dtype", "encoding", "data")
+
+    ENCODINGS = ("dense", "sparse", "rle", "auto")
+
+    def __init__(self, morphology, encoding="auto"):
+        assert encoding in self.ENCODINGS, "encoding must be one of %s" % (self.ENCODINGS,)
+        morphology = np.asarray(morphology)
+        assert morphology.size == 0 or morphology.min() >= 0, "material ids can not be negative"
+        self.shape = morphology.shape
+        self.dtype = morphology.dtype.str
+        flat = morphology.ravel()
+        candidates = [encoding] if encoding != "auto" else ["dense", "sparse", "rle"]
+        best = None
+        for candidate in candidates:
+            data = getattr(self, "_encode_" + candidate)(flat)
+            if best is None or sum(a.nbytes for a in data) < sum(a.nbytes for a in best[1]):
+                best = candidate, data
+        self.encoding, self.data = best
+
+    @staticmethod
+    def _encode_dense(flat):
+        return (_smallest(flat),)
+
+    @staticmethod
+    def _encode_sparse(flat):
+        voxels = np.flatnonzero(flat)
+        return _smallest(voxels, len(flat)), _smallest(flat[voxels])
+
+    @staticmethod
+    def _encode_rle(flat):
+        if len(flat) == 0:
+            return _smallest(flat), _smallest(flat)
+        starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+        lengths = np.diff(np.concatenate([starts, [len(flat)]]))
+        return _smallest(lengths), _smallest(flat[starts])
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.data)
+
+    def decode(self):
+        """
+        :return: a new array equal to the morphology this was made from.
+        """
+        size = int(np.prod(self.shape))
+        if self.encoding == "dense":
+            flat = self.data[0].astype(self.dtype)
+        elif self.encoding == "sparse":
+            flat = np.zeros(size, dtype=self.dtype)
+            flat[self.data[0]] = self.data[1]
+        else:
+            flat = np.repeat(self.data[1].astype(self.dtype), self.data[0])
+        return flat.reshape(self.shape)
+
+    def __getstate__(self):
+        return self.shape, self.dtype, self.encoding, self.data
+
+    def __setstate__(self, state):
+        self.shape, self.dtype, self.encoding, self.data = state
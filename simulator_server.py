@@ -0,0 +1,53 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A long lived simulator process for simulator_sessions.WarmSimulator (job.py --simulator-command): it starts once per
+worker and then evaluates the morphologies streamed to its stdin. Replace evaluate and initialize below with the
+simulator, or run it with --synthetic-fitness to serve a fitness_functions.SyntheticSimulator, e.g. for benchmarks.
+"""
+
+import time
+import argparse
+
+from fitness_functions import FITNESS_FUNCTIONS, SyntheticSimulator
+from simulator_sessions import serve
+
+
+def initialize():
+    # load the simulator, its materials and the environment once, instead of once per robot.
+    pass
+
+
+def evaluate(morphology, fidelity):
+    # simulate the morphology (an array of material ids, 0 is empty) for fidelity times the full simulation time and
+    # return its fitness.
+    raise NotImplementedError("Please implement robot evaluation. ")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="evaluate morphologies streamed to stdin until it is closed")
+    parser.add_argument("--synthetic-fitness", choices=sorted(FITNESS_FUNCTIONS), default=None,
+                        help="serve a reference fitness function instead of the simulator")
+    parser.add_argument("--synthetic-seconds", type=float, default=0.0, metavar="SECONDS",
+                        help="time each synthetic evaluation takes (default: 0)")
+    parser.add_argument("--synthetic-mode", choices=["burn", "sleep"], default="burn")
+    parser.add_argument("--startup-seconds", type=float, default=0.0, metavar="SECONDS",
+                        help="time the synthetic simulator takes to start, like loading a simulator does")
+    args = parser.parse_args()
+
+    if args.synthetic_fitness is not None:
+        initialize = lambda: time.sleep(args.startup_seconds)  # noqa: E731
+        evaluate = SyntheticSimulator(args.synthetic_fitness, seconds=args.synthetic_seconds, mode=args.synthetic_mode)
+    serve(evaluate, initialize)
@@ -0,0 +1,293 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import select
+import struct
+import threading
+import subprocess
+
+from morphology_io import morphology_from_bytes, morphology_to_bytes
+
+# The protocol spoken with a simulator process over its stdin and stdout, see serve:
+#   request: <I length> <d fidelity> <length bytes of morphology_io.morphology_to_bytes>. A length of 0 is a ping.
+#   reply:   <d fitness> <I length> <length bytes of an error message>. A length of 0 means it succeeded.
+REQUEST = struct.Struct("<Id")
+REPLY = struct.Struct("<dI")
+
+
+class SessionError(Exception):
+    """
+    The simulator crashed (or an in-process one raised) or did not reply in time. The session is not used again.
+    """
+
+
+class SimulatorError(Exception):
+    """
+    The simulator replied with an error, e.g. for a morphology it can not simulate. The session is still usable.
+    """
+
+
+class _ProcessSession(object):
+    """
+    A simulator process which evaluates morphologies streamed to its stdin until it is closed.
+    """
+    def __init__(self, command, timeout):
+        self.timeout = timeout
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def _read(self, size):
+        data = b""
+        fd = self.process.stdout.fileno()
+        deadline = time.time() + self.timeout if self.timeout is not None else None
+        while len(data) < size:
+            if deadline is not None:
+                ready, _, _ = select.select([fd], [], [], max(0.0, deadline - time.time()))
+                if not ready:
+                    self.process.kill()
+                    raise SessionError("no reply from the simulator after %.1f s" % self.timeout)
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                try:
+                    code = self.process.wait(timeout=1)
+                except subprocess.TimeoutExpired:
+                    code = None
+                raise SessionError("the simulator closed its stdout (exit code %s)" % code)
+            data += chunk
+        return data
+
+    def _request(self, fidelity, data):
+        try:
+            self.process.stdin.write(REQUEST.pack(len(data), fidelity) + data)
+        except (BrokenPipeError, OSError) as e:
+            raise SessionError("the simulator went away: %r" % e)
+        fitness, length = REPLY.unpack(self._read(REPLY.size))
+        if length:
+            raise SimulatorError(self._read(length).decode(errors="replace"))
+        return fitness
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def ping(self):
+        self._request(0.0, b"")
+
+    def evaluate(self, morphology, fidelity):
+        return self._request(fidelity, morphology_to_bytes(morphology))
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=1)
+            except Exception:
+                self.process.kill()
+                self.process.wait()
+
+
+class _InProcessSession(object):
+    """
+    A simulator context built by factory() in the worker, e.g. one which loads a simulator library once.
+    """
+    def __init__(self, factory):
+        self.context = factory()
+
+    def alive(self):
+        return True
+
+    def ping(self):
+        if hasattr(self.context, "ping"):
+            self.context.ping()
+
+    def evaluate(self, morphology, fidelity):
+        try:
+            return self.context(morphology, fidelity)
+        except Exception as e:
+            # the context may be left in any state, so it is built again.
+            raise SessionError("the simulator failed: %r" % e) from e
+
+    def close(self):
+        if hasattr(self.context, "close"):
+            self.context.close()
+
+
+# (pid, thread) -> key -> (session, evaluations, time of the last use), so every pool worker keeps its own sessions
+# and a forked worker never uses its parent's.
+_SESSIONS = {}
+_STATS = {}
+
+
+def session_stats():
+    """
+    :return: what the sessions of this process and thread did so far: starts, restarts, crashes, evaluations,
+             start_seconds (spent starting sessions) and evaluate_seconds (spent evaluating).
+    """
+    return _STATS.setdefault((os.getpid(), threading.get_ident()), {
+        "starts": 0, "restarts": 0, "crashes": 0, "evaluations": 0, "start_seconds": 0.0, "evaluate_seconds": 0.0})
+
+
+class WarmSimulator(object):
+    """
+    Evaluates morphologies with a long lived simulator instead of starting one per robot: either a process fed through
+    its stdin (see serve), or an in-process context. Set it as softbot_robot.SIMULATOR. It is pickled along with every
+    task, but each worker process (and thread) starts its simulator once and keeps it across tasks and generations.
+
+    A session is restarted after max_evaluations evaluations (simulators which leak), when it has crashed, or when it
+    does not answer a ping after being idle for check_after_idle seconds (e.g. between generations). An evaluation
+    which fails because the session crashed or timed out is tried once more on a new session before the error is
+    raised, e.g. to evo.fault_tolerance.FaultTolerance.
+    """
+    def __init__(self, command=None, factory=None, max_evaluations=1000, timeout=None, check_after_idle=5.0):
+        """
+        :param command: argument list starting a simulator process which speaks the protocol of serve.
+        :param factory: instead of command, a picklable function building an in-process simulator, which is called
+                        with (morphology, fidelity) and may have ping and close methods.
+        :param max_evaluations: evaluations before the session is replaced by a new one, None to never replace it.
+        :param timeout: seconds to wait for a simulator process to start or reply, None to wait forever.
+        :param check_after_idle: seconds a session may sit idle before it is pinged before its next evaluation.
+        """
+        assert (command is None) != (factory is None), "give either a command or a factory"
+        self.command = tuple(command) if command is not None else None
+        self.factory = factory
+        self.max_evaluations = max_evaluations
+        self.timeout = timeout
+        self.check_after_idle = check_after_idle
+
+    @property
+    def identity(self):
+        # the simulator is named by how it is started. Change the command (e.g. add a version) when it changes.
+        if self.command is not None:
+            return "WarmSimulator(%s)" % " ".join(self.command)
+        return "WarmSimulator(%s.%s)" % (self.factory.__module__, self.factory.__qualname__)
+
+    @property
+    def key(self):
+        return self.command, self.factory
+
+    def _start(self, stats):
+        start = time.perf_counter()
+        if self.command is not None:
+            session = _ProcessSession(self.command, self.timeout)
+        else:
+            session = _InProcessSession(self.factory)
+        try:
+            # waits until the simulator is ready, so its start up is not counted as evaluation time.
+            session.ping()
+        except Exception as e:
+            self._close(session)
+            raise SessionError("the simulator did not start: %r" % e) from e
+        stats["starts"] += 1
+        stats["start_seconds"] += time.perf_counter() - start
+        return session
+
+    def _sessions(self):
+        return _SESSIONS.setdefault((os.getpid(), threading.get_ident()), {})
+
+    def _session(self, stats):
+        entry = self._sessions().get(self.key)
+        if entry is not None:
+            session, evaluations, last_used = entry
+            healthy = session.alive()
+            if healthy and self.check_after_idle is not None and time.time() - last_used > self.check_after_idle:
+                try:
+                    session.ping()
+                except Exception:
+                    healthy = False
+            if healthy and (self.max_evaluations is None or evaluations < self.max_evaluations):
+                return session, evaluations
+            if not healthy:
+                stats["crashes"] += 1
+            stats["restarts"] += 1
+            self.close()
+        session = self._start(stats)
+        self._sessions()[self.key] = (session, 0, time.time())
+        return session, 0
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """
+        Stops the session of this process and thread, if there is one.
+        """
+        entry = self._sessions().pop(self.key, None)
+        if entry is not None:
+            self._close(entry[0])
+
+    def __call__(self, morphology, fidelity=1.0):
+        stats = session_stats()
+        for attempt in range(2):
+            try:
+                session, evaluations = self._session(stats)
+                start = time.perf_counter()
+                fitness = session.evaluate(morphology, fidelity)
+            except SessionError:
+                stats["crashes"] += 1
+                self.close()
+                if attempt == 1:
+                    raise
+                continue
+            except SimulatorError:
+                self._sessions()[self.key] = (session, evaluations + 1, time.time())
+                raise
+            stats["evaluations"] += 1
+            stats["evaluate_seconds"] += time.perf_counter() - start
+            self._sessions()[self.key] = (session, evaluations + 1, time.time())
+            return fitness
+
+
+def serve(evaluate, initialize=None, stdin=None, stdout=None):
+    """
+    The simulator side of a WarmSimulator session: reads requests from stdin and answers them until stdin is closed.
+    Wrap a simulator with it, see simulator_server.py.
+    :param evaluate: function (morphology array, fidelity) -> fitness.
+    :param initialize: called once before the first request, e.g. to load the simulator.
+    """
+    stdin = stdin if stdin is not None else sys.stdin.buffer
+    stdout = stdout if stdout is not None else sys.stdout.buffer
+    if initialize is not None:
+        initialize()
+
+    def read(size):
+        data = b""
+        while len(data) < size:
+            chunk = stdin.read(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    while True:
+        header = read(REQUEST.size)
+        if header is None:
+            return
+        length, fidelity = REQUEST.unpack(header)
+        data = read(length) if length else b""
+        if data is None:
+            return
+        if not length:
+            stdout.write(REPLY.pack(0.0, 0))
+        else:
+            try:
+                stdout.write(REPLY.pack(float(evaluate(morphology_from_bytes(data), fidelity)), 0))
+            except Exception as e:
+                message = repr(e).encode()
+                stdout.write(REPLY.pack(0.0, len(message)) + message)
+        stdout.flush()
@@ -12,31 +12,93 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import uuid
-import os
+import copy
+import zlib
+import struct
+import pickle
 import numpy as np
 
 from evo.moo_interfaces import MOORobotInterface
+from evo.fitness_cache import array_digest
+from evo.fidelity import FULL_FIDELITY
+from morphology_io import CompactMorphology, morphology_handoff
+
+# how morphologies are handed to the simulator, see morphology_io.morphology_handoff.
+# "file" writes to the current directory, "memfd" and "shm" keep it in memory.
+MORPHOLOGY_HANDOFF = "file"
+MORPHOLOGY_BINARY = False
+
+# fitness of robots whose simulation keeps failing or timing out, see evo.fault_tolerance.FaultTolerance. Finite, so
+# that objective differences (e.g. crowding distances) stay numbers.
+PENALTY_FITNESS = -1e12
+
+# how robots keep their morphology while they wait in the population. None keeps the phenotype's arrays. "dense",
+# "sparse", "rle" or "auto" keep a morphology_io.CompactMorphology instead, and have the phenotype drop its arrays
+# until the robot is mutated (see utils.StructurePhenotype.release_expression), so the parent holds one small copy.
+MORPHOLOGY_STORAGE = None
+
+# bump whenever evaluate_morphology starts computing different fitnesses, so fitness cache files written before are
+# not used, see evaluator_identity.
+EVALUATOR_VERSION = 1
+
+# a fitness_functions.SyntheticSimulator to evaluate robots with instead of a real simulator, e.g. for benchmarks, or a
+# simulator_sessions.WarmSimulator which keeps one simulator running in every worker. It is sent to the workers along
+# with the morphology.
+SIMULATOR = None
+
+def evaluator_identity():
+    """
+    :return: names what robots are evaluated with, e.g. for evo.fitness_cache.FitnessCache.
+    """
+    if SIMULATOR is not None:
+        return SIMULATOR.identity
+    return "softbot_robot.evaluate_morphology %d" % EVALUATOR_VERSION
 
 class SoftbotRobot(MOORobotInterface):
+    age_attribute = "age"
+
     def __init__(self, phenotype, seq_num_gen, run_dir):
         self.run_dir = run_dir
         self.seq_num_gen = seq_num_gen
         self.seq_num = self.seq_num_gen()
         self.phenotype = phenotype
-        self.evaluated_phenotype = self.phenotype.get_phenotype()
+        self._read_morphology()
+
+        self.fitness = 0
+        self.needs_eval = True
+        # fidelity -> fitness of every evaluation of this morphology, see evo.fidelity.MultiFidelity.
+        self.fidelity = FULL_FIDELITY
+        self.results = {}
+
+        self.age = 0
+
+    def _read_morphology(self):
         self.morphology = None
         for (name, details) in self.phenotype.get_phenotype():
             if name == "material":
                 self.morphology = details["state"]
         assert self.morphology is not None, "Morphology should not be None!"
+        if MORPHOLOGY_STORAGE is not None:
+            self.phenotype.release_expression()
 
-        self.id = self.set_uuid()
+    def _stored_morphology(self):
+        # the morphology as it is kept: an array, or a CompactMorphology which is decoded on access.
+        return self._morphology
 
-        self.fitness = 0
-        self.needs_eval = True
+    @property
+    def morphology(self):
+        morphology = self._stored_morphology()
+        return morphology.decode() if isinstance(morphology, CompactMorphology) else morphology
 
-        self.age = 0
+    @morphology.setter
+    def morphology(self, morphology):
+        if MORPHOLOGY_STORAGE is not None and morphology is not None:
+            morphology = CompactMorphology(morphology, MORPHOLOGY_STORAGE)
+        self._morphology = morphology
+
+    @property
+    def evaluated_phenotype(self):
+        return list(self.phenotype.get_phenotype())
 
     def __str__(self):
         return self.__repr__()
@@ -61,16 +123,34 @@ class SoftbotRobot(MOORobotInterface):
     def mutate(self):
         self.needs_eval = True
         self.phenotype.mutate()
-        self.evaluated_phenotype = self.phenotype.get_phenotype()
-        for (name, details) in self.phenotype.get_phenotype():
-            if name == "material":
-                self.morphology = details["state"]
+        self._read_morphology()
 
         self.fitness = 0
+        self.results = {}
 
-        self.set_uuid()
         self.seq_num = self.seq_num_gen()
 
+    def clone_for_mutation(self):
+        # mutate() re-expresses the phenotype, which replaces (rather than changes) the morphology and the state arrays
+        # of the network nodes and phenotype mapping, so the clone can share them instead of copying them.
+        # They are made read only, so an in place change would fail loudly instead of changing the parent.
+        shared = self._state_arrays()
+        for array in shared:
+            array.flags.writeable = False
+        return copy.deepcopy(self, {id(array): array for array in shared})
+
+    def _state_arrays(self):
+        # a compact morphology is not an array and is simply copied.
+        arrays = [self._stored_morphology()]
+        genotype = self.phenotype.genotype
+        for name, details in genotype.to_phenotype_mapping.items():
+            arrays.append(details.get("state"))
+        for network in getattr(genotype, "networks", []):
+            nodes = network.graph.node if hasattr(network.graph, "node") else network.graph.nodes
+            for name in network.graph:
+                arrays.append(nodes[name].get("state"))
+        return [a for a in arrays if isinstance(a, np.ndarray)]
+
     def get_minimize_vals(self):
         return [self.get_age()]
 
@@ -96,47 +176,120 @@ class SoftbotRobot(MOORobotInterface):
         return 1
 
     def compute_work(self, test=True, **kwargs):
+        self.fitness = self.evaluate_morphology(self.morphology, self.get_seq_num(), self.get_fidelity(), SIMULATOR)
+
+    def get_work_payload(self):
+        # only the morphology is needed to evaluate a robot, so don't pickle the CPPN or phenotype for the workers.
+        # a compact morphology is sent as it is and decoded by the worker.
+        return self.get_seq_num(), self._stored_morphology(), self.get_fidelity(), SIMULATOR
+
+    def get_cache_key(self):
+        # the fitness only depends on the morphology (and fidelity), so identical bodies share a letter.
+        digest = array_digest(self.morphology)
+        if self.get_fidelity() == FULL_FIDELITY:
+            return digest
+        return digest + struct.pack("<d", self.get_fidelity())
+
+    def get_fidelity(self):
+        return self.fidelity
+
+    def set_fidelity(self, fidelity):
+        self.fidelity = fidelity
+        self.needs_eval = fidelity not in self.results
+        self.fitness = self.results.get(fidelity, 0)
+
+    def get_surrogate_features(self):
+        # the size of the bounding box, the voxels touching the ground and the voxels of each material. The counts go
+        # last since their number depends on the highest material used.
+        morphology = self.morphology
+        counts = np.bincount(morphology.ravel())[1:]
+        filled = np.argwhere(morphology > 0)
+        if len(filled) == 0:
+            return np.zeros(morphology.ndim + 1 + len(counts))
+        extent = filled.max(axis=0) - filled.min(axis=0) + 1
+        on_ground = np.count_nonzero(morphology[..., filled[:, -1].min()])
+        return np.concatenate([extent, [on_ground], counts]).astype(np.float64)
+
+    @classmethod
+    def complete_payload(cls, payload):
+        seq_num, morphology, fidelity, simulator = payload
+        if isinstance(morphology, CompactMorphology):
+            morphology = morphology.decode()
+        return cls.evaluate_morphology(morphology, seq_num, fidelity, simulator), fidelity
+
+    @staticmethod
+    def evaluate_morphology(morphology, seq_num, fidelity=FULL_FIDELITY, simulator=None):
+        if simulator is not None:
+            return simulator(morphology, fidelity)
+
         # convert numpy matrix of morphology to flattened file describing the morphology
         # for each voxel that is not air, write a line to the file in the format of
         # x,y,z|materialId
+        with morphology_handoff(morphology, "Robot_Morph_%.10d.txt" % seq_num, mode=MORPHOLOGY_HANDOFF,
+                                binary=MORPHOLOGY_BINARY) as morph_path:
 
-        morph_str = '\n'.join("%d,%d,%d|%d"%(*index,x) for index, x in np.ndenumerate(self.morphology) if x)
-        with open("Robot_Morph_%.10d.txt"%self.get_seq_num(), "w") as f:
-            f.write(morph_str)
-
-        # run simulator to optimize morphology, compute and save fitness
-        # self.fitness =
-        # An example fitness function to minimize the number of voxels in a robot
-        # self.fitness = -1 * np.sum(self.morphology > 0)
-
-
-        # delete the morphology file.
-        os.remove("Robot_Morph_%.10d.txt"%self.get_seq_num())
+            # run simulator on morph_path to optimize morphology, compute and return fitness. Below full fidelity
+            # only simulate that fraction of the time (or simulate a coarser copy of the morphology).
+            # fitness =
+            # An example fitness function to minimize the number of voxels in a robot
+            # fitness = -1 * np.sum(morphology > 0)
 
-        raise NotImplementedError("Please implement robot evaluation. ")
+            # the morphology file is deleted when leaving the with block.
+            raise NotImplementedError("Please implement robot evaluation. ")
 
     def write_letter(self):
         """
         When using ParallelPy with MPI for distributing simulations across multiple nodes,
         we only sync metadata about the simulation back to the evolutionary algorithm dispatch node.
         """
-        return self.fitness
+        return self.fitness, self.get_fidelity()
+
+    def get_penalty_letter(self):
+        return PENALTY_FITNESS, self.get_fidelity()
 
     def open_letter(self, letter):
-        self.fitness = letter
-        self.needs_eval = False
+        fitness, fidelity = letter
+        self.results[fidelity] = fitness
+        if fidelity == self.get_fidelity():
+            self.fitness = fitness
+            self.needs_eval = False
         return None
 
-    def set_uuid(self):
-        self.id = uuid.uuid1()
-        return self.id
-
     def get_num_evaluations(self, test=False):
         return 1
 
     def get_age(self):
         return self.age
 
+    def get_checkpoint_state(self):
+        # only the age changes once a robot has been evaluated.
+        return self.age
+
+    def set_checkpoint_state(self, state):
+        self.age = state
+
+    def get_genome(self):
+        # the compressed phenotype, plus what evaluating it found so the robot is not simulated again.
+        # the morphology goes along, so a phenotype which released its arrays does not have to be expressed again.
+        phenotype = zlib.compress(pickle.dumps(self.phenotype, protocol=pickle.HIGHEST_PROTOCOL))
+        return phenotype, self.seq_num, self.fitness, self.age, self.needs_eval, self._stored_morphology()
+
+    def from_genome(self, genome):
+        phenotype, seq_num, fitness, age, needs_eval, morphology = genome
+        robot = copy.copy(self)
+        robot.phenotype = pickle.loads(zlib.decompress(phenotype))
+        # every island keeps its morphologies the same way, so the stored form is kept as it is.
+        robot._morphology = morphology
+        if MORPHOLOGY_STORAGE is not None:
+            robot.phenotype.release_expression()
+        robot.seq_num = seq_num
+        robot.fitness = fitness
+        robot.age = age
+        robot.needs_eval = needs_eval
+        robot.fidelity = FULL_FIDELITY
+        robot.results = {} if needs_eval else {FULL_FIDELITY: fitness}
+        return robot
+
     def _flatten(self, l):
         ret = []
         for items in l:
@@ -0,0 +1,108 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import random
+
+import numpy as np
+
+from benchmarks.common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.checkpoint import Checkpointer
+from evo.executors import SerialExecutor
+from evo.fidelity import MultiFidelity
+from test_fidelity import FidelityRobot
+
+
+class AgingRobot(ToyRobot):
+    # only the age changes once a robot is evaluated.
+    def get_checkpoint_state(self):
+        return self.age
+
+    def set_checkpoint_state(self, state):
+        self.age = state
+
+
+def snapshot(afpo):
+    return [(s.get_id(), s.age, s.fitness) for s in afpo.students], [s.get_id() for s in afpo.dominating]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    random.seed(0)
+    np.random.seed(0)
+    afpo = AFPOMoo(lambda: AgingRobot(0), pop_size=10, executor=SerialExecutor())
+    for _ in range(3):
+        afpo.generation()
+    Checkpointer(str(tmp_path)).save(afpo, 2, extra={"counter": 7})
+    expected = snapshot(afpo), random.random(), np.random.rand(), afpo.get_robot_id()
+    afpo.cleanup()
+
+    random.seed(1)
+    np.random.seed(1)
+    restored = AFPOMoo(lambda: AgingRobot(0), pop_size=10, executor=SerialExecutor())
+    assert Checkpointer(str(tmp_path)).load(restored) == (2, {"counter": 7})
+    assert (snapshot(restored), random.random(), np.random.rand(), restored.get_robot_id()) == expected
+    restored.cleanup()
+
+
+def test_robots_are_written_once(tmp_path):
+    random.seed(0)
+    afpo = AFPOMoo(lambda: AgingRobot(0), pop_size=10, executor=SerialExecutor())
+    checkpointer = Checkpointer(str(tmp_path))
+    for generation in range(8):
+        saved = set(checkpointer.segments)
+        afpo.generation()
+        checkpointer.save(afpo, generation)
+        # robots saved before only have their age written again.
+        assert checkpointer.last_save_robots == len([s for s in afpo.students if s.get_id() not in saved])
+        # and segments without a live robot are deleted.
+        segments = set(f for f in os.listdir(str(tmp_path)) if f.startswith("robots_"))
+        assert segments == set("robots_%d.pkl.z" % n for n in checkpointer.segments.values())
+    expected = snapshot(afpo)
+    afpo.cleanup()
+
+    restored = AFPOMoo(lambda: AgingRobot(0), pop_size=10, executor=SerialExecutor())
+    Checkpointer(str(tmp_path)).load(restored)
+    assert snapshot(restored) == expected
+    restored.cleanup()
+
+
+def run(directory, generations, stop=None, resume=False, **afpo_kwargs):
+    """
+    :return: the ids and objectives of the students after every generation, from the one after the checkpoint on.
+    """
+    random.seed(0)
+    np.random.seed(0)
+    afpo = AFPOMoo(lambda: FidelityRobot(0), pop_size=20, executor=SerialExecutor(), **afpo_kwargs)
+    checkpointer = Checkpointer(str(directory), every=2)
+    first = 0
+    if resume:
+        first = checkpointer.load(afpo)[0] + 1
+    history = []
+    for generation in range(first, generations):
+        afpo.generation()
+        history.append([(s.get_id(), s.age, s.fitness) for s in afpo.students])
+        checkpointer.maybe_save(afpo, generation)
+        if generation == stop:
+            break
+    afpo.cleanup()
+    return history
+
+
+def test_resumed_run_screens_children_like_the_uninterrupted_run(tmp_path):
+    full = run(tmp_path / "full", 10, fidelity=MultiFidelity(0.25))
+    # the last checkpoint is written after generation 5, generation 6 is lost.
+    run(tmp_path / "resumed", 10, stop=6, fidelity=MultiFidelity(0.25))
+    assert run(tmp_path / "resumed", 10, resume=True, fidelity=MultiFidelity(0.25)) == full[6:]
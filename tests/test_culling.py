@@ -0,0 +1,54 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+from benchmarks.common import toy_population
+from evo.culling import CULL_MODES
+from evo.pareto import make_sorter
+
+
+@pytest.mark.parametrize("mode", sorted(CULL_MODES))
+def test_cull_keeps_the_front_and_stops_at_the_target(mode):
+    students = toy_population(100, seed=3)
+    sorter = make_sorter(students)
+    front = set(sorter.front())
+    target = max(40, len(front))
+    CULL_MODES[mode](students, sorter, target)
+    alive = [i for i, s in enumerate(students) if s is not None]
+    assert len(alive) == target
+    assert front <= set(alive)
+
+
+@pytest.mark.parametrize("mode", sorted(CULL_MODES))
+def test_cull_follows_the_random_sequence(mode):
+    survivors = []
+    for _ in range(2):
+        students = toy_population(60, seed=4)
+        random.seed(5)
+        CULL_MODES[mode](students, make_sorter(students), 30)
+        survivors.append([s.get_id() for s in students if s is not None])
+    assert survivors[0] == survivors[1]
+
+
+def test_crowding_keeps_whole_fronts_in_rank_order():
+    students = toy_population(80, seed=6)
+    sorter = make_sorter(students)
+    ranks = sorter.ranks()
+    CULL_MODES["crowding"](students, sorter, 30)
+    kept = [ranks[i] for i, s in enumerate(students) if s is not None]
+    dropped = [ranks[i] for i, s in enumerate(students) if s is None]
+    assert max(kept) <= min(dropped)
@@ -0,0 +1,52 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+
+from evo.executors import ProcessExecutor
+
+
+def hang():
+    # like a simulator which never returns.
+    time.sleep(60)
+
+
+def wait(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def test_pool_is_replaced_once_every_worker_is_stuck():
+    executor = ProcessExecutor(processes=2)
+    hung = [executor.submit(hang) for _ in range(2)]
+    queued = executor.submit(wait, 0, "queued")
+    time.sleep(0.5)
+    assert executor.cancel(hung[0]) == set()
+    assert executor.cancel(hung[1]) == set(hung)
+    assert executor.next_completed(timeout=30) == (queued, "queued")
+    executor.close()
+
+
+def test_queued_cancelled_tasks_do_not_count_as_stuck():
+    executor = ProcessExecutor(processes=2)
+    hung = executor.submit(hang)
+    running = executor.submit(wait, 1, "running")
+    queued = executor.submit(wait, 0, "queued")
+    time.sleep(0.5)
+    assert executor.cancel(hung) == set()
+    # only one worker is stuck, so the running task must not be started over.
+    assert executor.cancel(queued) == set()
+    assert executor.next_completed(timeout=30) == (running, "running")
+    executor.pool.terminate()
@@ -0,0 +1,82 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+from benchmarks.common import ToyRobot
+from evo.afpomoo import AFPOMoo
+from evo.executors import SerialExecutor
+from evo.fidelity import FULL_FIDELITY, MultiFidelity
+
+
+class FidelityRobot(ToyRobot):
+    # a short simulation which roughly agrees with the full one.
+    def __init__(self, seq_num):
+        ToyRobot.__init__(self, seq_num, age=0)
+        self.fidelity = FULL_FIDELITY
+        self.results = {}
+
+    def mutate(self):
+        ToyRobot.mutate(self)
+        self.results = {}
+
+    def get_fidelity(self):
+        return self.fidelity
+
+    def set_fidelity(self, fidelity):
+        self.fidelity = fidelity
+        self.needs_eval = fidelity not in self.results
+        self.fitness = self.results.get(fidelity, 0)
+
+    def compute_work(self, serial=False):
+        full = (self.seq_num * 7919 % 1000) / 1000.0
+        self.fitness = full if self.fidelity == FULL_FIDELITY else full + 0.2 * ((self.seq_num * 31 % 7) / 7 - 0.5)
+
+    def write_letter(self):
+        return self.fitness, self.fidelity
+
+    def open_letter(self, letter):
+        fitness, fidelity = letter
+        self.results[fidelity] = fitness
+        if fidelity == self.fidelity:
+            self.fitness = fitness
+            self.needs_eval = False
+
+
+def evolve(generations, **afpo_kwargs):
+    random.seed(0)
+    afpo = AFPOMoo(lambda: FidelityRobot(0), pop_size=20, executor=SerialExecutor(), **afpo_kwargs)
+    history = []
+    for _ in range(generations):
+        afpo.generation()
+        history.append([(s.get_id(), s.age, s.fitness) for s in afpo.students])
+        assert all(s.get_fidelity() == FULL_FIDELITY and not s.needs_evaluation() for s in afpo.students)
+    afpo.cleanup()
+    return history
+
+
+def test_screening_rejects_children():
+    random.seed(0)
+    afpo = AFPOMoo(lambda: FidelityRobot(0), pop_size=20, executor=SerialExecutor(), fidelity=MultiFidelity(0.25))
+    rejected = 0
+    for _ in range(10):
+        afpo.generation()
+        rejected += afpo.generation_stats["fidelity_screened"] - afpo.generation_stats["fidelity_promoted"]
+    afpo.cleanup()
+    assert rejected > 0
+
+
+def test_columnar_population_screens_like_a_list():
+    # the front is kept as robots from one generation to the next, their ages must not lag behind the columns.
+    assert evolve(15, fidelity=MultiFidelity(0.25), columnar=True) == evolve(15, fidelity=MultiFidelity(0.25))
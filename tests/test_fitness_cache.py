@@ -0,0 +1,61 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from evo.fitness_cache import FitnessCache, array_digest
+
+
+def test_digest_tells_dtype_shape_and_contents_apart():
+    a = np.zeros((2, 3), dtype=np.uint8)
+    assert array_digest(a) == array_digest(a.copy())
+    assert array_digest(a) != array_digest(a.reshape(3, 2))
+    assert array_digest(a) != array_digest(a.astype(np.uint16))
+    b = a.copy()
+    b[1, 2] = 1
+    assert array_digest(a) != array_digest(b)
+
+
+def test_least_recently_used_letters_are_dropped():
+    cache = FitnessCache(max_entries=2)
+    cache.put(b"a", 1.0)
+    cache.put(b"b", 2.0)
+    assert cache.get(b"a") == 1.0
+    cache.put(b"c", 3.0)
+    assert cache.get(b"b") is None
+    assert (cache.get(b"a"), cache.get(b"c")) == (1.0, 3.0)
+    assert cache.reset_stats() == (3, 1)
+    assert cache.reset_stats() == (0, 0)
+
+
+def test_letters_outlive_the_run_in_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = FitnessCache(max_entries=1, path=path, evaluator="simulator 1")
+    cache.put(b"a", (1.0, 0.25))
+    cache.put(b"b", (2.0, 1.0))
+    # dropped from memory, but still in the file.
+    assert cache.get(b"a") == (1.0, 0.25)
+    cache.close()
+
+    cache = FitnessCache(path=path, evaluator="simulator 1")
+    assert cache.get(b"b") == (2.0, 1.0)
+    cache.close()
+
+
+def test_file_of_another_evaluator_is_refused(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    FitnessCache(path=path, evaluator="simulator 1").close()
+    with pytest.raises(ValueError):
+        FitnessCache(path=path, evaluator="simulator 2")
@@ -0,0 +1,99 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import pickle
+
+from multiprocessing import Pool, Process, Queue
+
+from evo import ids
+from evo.ids import IdAllocator, NODE_SPACE
+
+IDS = IdAllocator(name="test_ids")
+
+
+class Robot(object):
+    # just enough of a robot to draw a new seq num on every mutation, like SoftbotRobot does.
+    def __init__(self, seq_num_gen):
+        self.seq_num_gen = seq_num_gen
+        self.seq_num = seq_num_gen()
+
+    def mutate(self):
+        self.seq_num = self.seq_num_gen()
+
+
+def mutate_many(robot, count):
+    # the robot (and its allocator) reach the worker pickled, like robots sent to an executor.
+    robot = pickle.loads(robot)
+    seq_nums = []
+    for _ in range(count):
+        robot.mutate()
+        seq_nums.append(robot.seq_num)
+    return seq_nums
+
+
+def draw(count, results):
+    results.put([IDS() for _ in range(count)])
+
+
+def test_ids_count_up_in_one_process():
+    allocator = IdAllocator(block_size=4)
+    assert [allocator() for _ in range(10)] == list(range(1, 11))
+    assert IdAllocator(node=3)() == 3 * NODE_SPACE + 1
+
+
+def test_ids_are_unique_across_processes():
+    processes = 4
+    per_process = 5000
+    seq_nums = [IDS() for _ in range(1000)]
+
+    # processes forked from a parent which already drew ids.
+    results = Queue()
+    workers = [Process(target=draw, args=(per_process, results)) for _ in range(processes)]
+    for w in workers:
+        w.start()
+    seq_nums += [i for _ in workers for i in results.get()]
+    for w in workers:
+        w.join()
+
+    # and robots mutated in a pool, while the parent draws ids too.
+    robot = pickle.dumps(Robot(IDS))
+    with Pool(processes) as pool:
+        pending = [pool.apply_async(mutate_many, (robot, per_process // 10)) for _ in range(processes * 4)]
+        seq_nums += [IDS() for _ in range(per_process)]
+        for p in pending:
+            seq_nums += p.get()
+
+    assert len(seq_nums) == 1000 + processes * per_process + per_process + processes * 4 * (per_process // 10)
+    assert len(seq_nums) == len(set(seq_nums))
+
+
+def test_state_round_trip():
+    allocator = IdAllocator()
+    for _ in range(5):
+        allocator()
+    state = allocator.get_state()
+    restored = IdAllocator()
+    restored.set_state(state)
+    assert restored() == 6
+    assert allocator() == 6
+
+
+def test_unused_allocators_are_dropped():
+    before = len(ids._ALLOCATORS)
+    allocators = [IdAllocator() for _ in range(10)]
+    assert len(ids._ALLOCATORS) == before + 10
+    del allocators
+    gc.collect()
+    assert len(ids._ALLOCATORS) == before
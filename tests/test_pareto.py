@@ -0,0 +1,104 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import numpy as np
+import pytest
+
+from benchmarks.common import ToyRobot, toy_population
+from evo.pareto import DominanceSort, LegacyDominanceSort, ParetoArchive, legacy_front
+
+
+class ThreeObjectiveRobot(ToyRobot):
+    def __init__(self, seq_num):
+        ToyRobot.__init__(self, seq_num)
+        self.size = random.random()
+
+    def get_minimize_vals(self):
+        return [self.age, self.size]
+
+
+class CustomRobot(ToyRobot):
+    # dominance of its own, which only the legacy sort can answer.
+    def dominates(self, other):
+        return ToyRobot.dominates(self, other)
+
+
+def wide_front_population(size):
+    # older robots are fitter, so nobody dominates anybody.
+    return [ToyRobot(i, fitness=float(i), age=i) for i in range(size)]
+
+
+def populations():
+    random.seed(1)
+    yield toy_population(21)
+    yield toy_population(300, seed=2)
+    yield wide_front_population(50)
+    # ties in every objective, broken by seq num.
+    yield [ToyRobot(i, fitness=0.5, age=3) for i in range(10)]
+    yield [ThreeObjectiveRobot(i) for i in range(200)]
+
+
+@pytest.mark.parametrize("students", list(populations()))
+def test_front_matches_legacy_front(students):
+    assert list(DominanceSort(students).front()) == legacy_front(students)
+    custom = [CustomRobot(s.seq_num, fitness=s.fitness, age=s.age) for s in students
+              if not isinstance(s, ThreeObjectiveRobot)]
+    assert list(LegacyDominanceSort(custom).front()) == legacy_front(custom)
+
+
+@pytest.mark.parametrize("students", list(populations()))
+def test_dominance_matrix_matches_dominates(students):
+    sorter = DominanceSort(students)
+    counts = [sum(t.dominates(s) for t in students) for s in students]
+    assert list(sorter.dominator_counts()) == counts
+    some = range(min(30, len(students)))
+    assert [[sorter.dominates(i, j) for j in some] for i in some] == \
+        [[students[i].dominates(students[j]) for j in some] for i in some]
+
+
+@pytest.mark.parametrize("students", list(populations()))
+def test_ranks_peel_the_fronts(students):
+    ranks = DominanceSort(students).ranks()
+    # the same ranks from the dominance matrix, which is used for more than two objectives.
+    sorter = DominanceSort(students)
+    sorter.packed
+    assert list(sorter.ranks()) == list(ranks)
+
+    remaining = list(range(len(students)))
+    rank = 0
+    while remaining:
+        front = [remaining[i] for i in legacy_front([students[i] for i in remaining])]
+        assert sorted(np.flatnonzero(ranks == rank)) == front
+        remaining = [i for i in remaining if i not in front]
+        rank += 1
+
+
+def test_archive_follows_an_aging_population():
+    random.seed(0)
+    ids = [0]
+
+    def new_robot():
+        ids[0] += 1
+        return ThreeObjectiveRobot(ids[0])
+
+    population = [new_robot() for _ in range(200)]
+    archive = ParetoArchive(capacity=16)
+    for _ in range(10):
+        for robot in population:
+            robot.iterate_generation()
+        random.shuffle(population)
+        population = population[:100] + [new_robot() for _ in range(100)]
+        assert list(archive.sync(population)) == list(DominanceSort(population).front())
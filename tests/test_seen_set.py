@@ -0,0 +1,58 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import numpy as np
+
+from evo.seen_set import BloomFilter, DigestSet
+
+
+def arrays(count, seed):
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, 3, size=(4, 4, 4)).astype(np.uint8) for _ in range(count)]
+
+
+def test_digest_set_is_restored_from_its_states():
+    seen = DigestSet.for_entries(1000)
+    first, second = arrays(100, 0), arrays(100, 1)
+    assert all(seen.add(a) for a in first)
+    states = [seen.get_state()]
+    assert all(seen.add(a) for a in second)
+    states.append(seen.get_state(since=states[0].shape[0]))
+
+    # e.g. a resumed run, whose own initial population was seen before the checkpoint was loaded.
+    restored = DigestSet.for_entries(1000)
+    extra = arrays(10, 2)
+    for a in extra:
+        restored.add(a)
+    restored.clear()
+    for state in states:
+        restored.set_state(state)
+    assert len(restored) == len(seen) == 200
+    assert all(a in restored for a in first + second)
+    assert not any(a in restored for a in extra)
+    assert not restored.add(first[0])
+
+
+def test_bloom_filter_is_restored_from_its_state():
+    seen = BloomFilter(1000)
+    for a in arrays(100, 0):
+        seen.add(a)
+    restored = BloomFilter(1000)
+    restored.add(arrays(1, 2)[0])
+    restored.clear()
+    assert len(restored) == 0
+    restored.set_state(seen.get_state())
+    assert len(restored) == 100
+    assert all(a in restored for a in arrays(100, 0))
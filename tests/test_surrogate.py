@@ -0,0 +1,67 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from benchmarks.common import ToyRobot
+from evo.surrogate import Surrogate
+
+WEIGHTS = np.array([1.0, -2.0, 0.5])
+
+
+class FeatureRobot(ToyRobot):
+    # a fitness the ridge regressions can learn exactly.
+    def __init__(self, seq_num, rng):
+        ToyRobot.__init__(self, seq_num, age=0)
+        self.features = rng.rand(3)
+        self.fitness = float(self.features @ WEIGHTS)
+
+    def get_surrogate_features(self):
+        return self.features
+
+
+def robots(count, seed):
+    rng = np.random.RandomState(seed)
+    return [FeatureRobot(i, rng) for i in range(count)]
+
+
+def test_everything_is_simulated_until_there_are_enough_samples():
+    surrogate = Surrogate(budget=0.2, min_samples=50)
+    surrogate.observe(robots(49, 0))
+    children = robots(10, 1)
+    assert surrogate.screen(children) == (children, [])
+
+
+@pytest.mark.parametrize("maximize", [True, False])
+def test_the_best_predicted_children_are_simulated(maximize):
+    surrogate = Surrogate(budget=0.25, min_samples=50, uncertainty_weight=0, audit_fraction=0, ridge=1e-9,
+                          maximize=maximize)
+    surrogate.observe(robots(100, 0))
+    children = robots(20, 1)
+    simulate, rejected = surrogate.screen(children)
+    best = sorted(children, key=lambda r: r.fitness, reverse=maximize)[:5]
+    assert sorted(r.get_id() for r in simulate) == sorted(r.get_id() for r in best)
+    assert len(rejected) == 15
+    assert surrogate.reset_stats()["simulations_saved"] == 15
+
+
+def test_audited_rejects_are_simulated_and_counted():
+    surrogate = Surrogate(budget=0.1, min_samples=50, audit_fraction=0.5)
+    surrogate.observe(robots(100, 0))
+    simulate, rejected = surrogate.screen(robots(100, 1))
+    stats = surrogate.reset_stats()
+    assert len(simulate) == 10 + stats["audited"]
+    assert 0 < stats["audited"] < 90
+    assert len(simulate) + len(rejected) == 100
@@ -0,0 +1,91 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+import threading
+
+from multiprocessing import Process
+from multiprocessing.connection import Client
+
+import pytest
+
+from evo.executors import TaskFailed, WorkerFarmExecutor, run_worker
+
+
+def square(x):
+    return x * x
+
+
+def crash_once(marker, x):
+    # the first worker to run this dies without replying, like a node going down.
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return x
+
+
+def fail(x):
+    raise ValueError(x)
+
+
+@pytest.fixture
+def farm():
+    # a farm on localhost, with two workers joining it like python worker.py would.
+    executor = WorkerFarmExecutor(("localhost", 0))
+    workers = [Process(target=run_worker, args=(executor.address, executor.authkey)) for _ in range(2)]
+    for w in workers:
+        w.start()
+    yield executor
+    executor.close()
+    for w in workers:
+        w.join(timeout=10)
+
+
+def test_results_come_back(farm):
+    assert sorted(farm.map_unordered(square, [(i,) for i in range(50)])) == [(i, i * i) for i in range(50)]
+
+
+def test_errors_are_raised_by_next_completed(farm):
+    ticket = farm.submit(fail, 3)
+    with pytest.raises(TaskFailed) as error:
+        farm.next_completed(timeout=10)
+    assert error.value.ticket == ticket
+    assert isinstance(error.value.error, ValueError)
+
+
+def test_task_which_can_not_be_sent_fails(farm):
+    ticket = farm.submit(square, threading.Lock())
+    with pytest.raises(TaskFailed) as error:
+        farm.next_completed(timeout=10)
+    assert error.value.ticket == ticket
+    # the worker is still there for the next task.
+    assert list(farm.map_unordered(square, [(3,)])) == [(0, 9)]
+
+
+def test_task_of_a_lost_worker_is_run_again(farm, tmp_path):
+    ticket = farm.submit(crash_once, str(tmp_path / "crashed"), 7)
+    assert farm.next_completed(timeout=10) == (ticket, 7)
+
+
+def test_worker_with_the_wrong_authkey_is_turned_away(farm, capsys):
+    with pytest.raises(Exception):
+        Client(farm.address, authkey=b"not the key")
+    for _ in range(100):
+        if "could not connect" in capsys.readouterr().err:
+            break
+        time.sleep(0.05)
+    else:
+        pytest.fail("the rejected worker was not reported")
+    assert sorted(farm.map_unordered(square, [(2,), (3,)])) == [(0, 4), (1, 9)]
@@ -13,11 +13,15 @@
 # limitations under the License.
 
 from queue import Queue
+from collections import deque
 
 import numpy as np
 from evosorocore.Genome import Genotype, Phenotype, make_material_tree
 from evosorocore.Networks import CPPN
 
+from evo.ids import IdAllocator
+from evo.seen_set import BloomFilter, DigestSet
+
 IND_SIZE = (8,8,7)
 MIN_PERCENT_FULL = 0.5
 
@@ -25,6 +29,9 @@ MIN_PERCENT_FULL = 0.5
 NUM_MATERIALS = 10 # at a minimum we need 1 material.)
 assert NUM_MATERIALS >= 1, "NUM_MATERIALS must be >= 1"
 
+# smallest unsigned integer type which can hold every material id.
+MORPHOLOGY_DTYPE = np.uint8 if NUM_MATERIALS < 2 ** 8 else np.uint16
+
 class Node(object):
     def __init__(self, id, isLeaf):
         self.id = id
@@ -39,44 +46,115 @@ class Node(object):
         else:
             return "Internal node %d with parent %s and children %d %d" %(self.id, str(self.parentId), self.childA.id, self.childB.id)
 
-all_nodes = [Node(id, True) for id in range(NUM_MATERIALS + 1)]
+def material_tree(num_materials):
+    """
+    :return: (every node, leaves first, names of the internal nodes) of the tree for num_materials materials.
+    """
+    all_nodes = [Node(id, True) for id in range(num_materials + 1)]
+
+    currentNodeIdx = num_materials + 1
 
-currentNodeIdx = NUM_MATERIALS + 1
+    nodes_needing_parents = Queue()
 
-nodes_needing_parents = Queue()
+    for node in all_nodes:
+        nodes_needing_parents.put(node)
 
-for node in all_nodes:
-    nodes_needing_parents.put(node)
+    while (nodes_needing_parents.qsize() >= 2):
+        child_a  = nodes_needing_parents.get()
+        child_b  = nodes_needing_parents.get()
+        child_a.parentId = str(currentNodeIdx)
+        child_b.parentId = str(currentNodeIdx)
+        parent = Node(str(currentNodeIdx), False)
+        parent.childA = child_a
+        parent.childB = child_b
+        nodes_needing_parents.put(parent)
+        all_nodes.append(parent)
+        currentNodeIdx += 1
 
-while (nodes_needing_parents.qsize() >= 2):
-    child_a  = nodes_needing_parents.get()
-    child_b  = nodes_needing_parents.get()
-    child_a.parentId = str(currentNodeIdx)
-    child_b.parentId = str(currentNodeIdx)
-    parent = Node(str(currentNodeIdx), False)
-    parent.childA = child_a
-    parent.childB = child_b
-    nodes_needing_parents.put(parent)
-    all_nodes.append(parent)
-    currentNodeIdx += 1
+    return all_nodes, [n.id for n in reversed(all_nodes[num_materials + 1:])]
 
-NODE_NAMES = [n.id for n in reversed(all_nodes[NUM_MATERIALS + 1:])]
+all_nodes, NODE_NAMES = material_tree(NUM_MATERIALS)
+
+def configure(ind_size=None, num_materials=None):
+    """
+    Changes the workspace size or the number of materials of robots created from now on, e.g. to benchmark several
+    settings in one process. Robots which already exist keep theirs.
+    """
+    global IND_SIZE, NUM_MATERIALS, MORPHOLOGY_DTYPE, all_nodes, NODE_NAMES, PHENOTYPE_SAMPLER
+    # phenotypes the sampler has built already have the old settings.
+    PHENOTYPE_SAMPLER = None
+    if ind_size is not None:
+        IND_SIZE = tuple(ind_size)
+    if num_materials is not None:
+        assert num_materials >= 1, "NUM_MATERIALS must be >= 1"
+        NUM_MATERIALS = num_materials
+        MORPHOLOGY_DTYPE = np.uint8 if NUM_MATERIALS < 2 ** 8 else np.uint16
+        all_nodes, NODE_NAMES = material_tree(NUM_MATERIALS)
 
 FORCE_MORPH_ONCE = False
-MORPHOLOGIES_SEEN_BEFORE = {}
+# digests of every morphology seen so far, only used if FORCE_MORPH_ONCE is set.
+# Setting SEEN_FALSE_POSITIVE_RATE uses a smaller Bloom filter instead, which occasionally rejects a new morphology.
+# The set is sized for at least SEEN_CAPACITY morphologies (more if the run is expected to make more), and can not grow
+# once it is shared with the workers.
+SEEN_CAPACITY = 3 * 2 ** 20
+SEEN_FALSE_POSITIVE_RATE = None
+MORPHOLOGIES_SEEN_BEFORE = None
 
-robot_seq_number = 0
+def get_morphologies_seen_before(expected=None):
+    """
+    The set lives in shared memory, so call this before starting any worker processes to have them all use it.
+    :param expected: how many morphologies the run will make, e.g. from POP_SIZE and GENS. Only used when the set is
+                     made, i.e. by the first call.
+    :return: the set of morphologies seen so far.
+    """
+    global MORPHOLOGIES_SEEN_BEFORE
+    if MORPHOLOGIES_SEEN_BEFORE is None:
+        morphologies = max(SEEN_CAPACITY, expected or 0)
+        if SEEN_FALSE_POSITIVE_RATE is None:
+            MORPHOLOGIES_SEEN_BEFORE = DigestSet.for_entries(morphologies)
+        else:
+            MORPHOLOGIES_SEEN_BEFORE = BloomFilter(morphologies, SEEN_FALSE_POSITIVE_RATE)
+    return MORPHOLOGIES_SEEN_BEFORE
+
+# one sequence of robot ids, shared with every worker process forked after this module is imported.
+ROBOT_IDS = IdAllocator(name="robots")
 def get_seq_num():
-    global robot_seq_number
-    robot_seq_number += 1
-    return robot_seq_number
+    return ROBOT_IDS()
+
+
+class GridCachedCPPN(CPPN):
+    """
+    A CPPN which computes its x, y, z, d and b input grids once per workspace size and shares them with every other
+    CPPN, instead of rebuilding them voxel by voxel on every expression.
+    """
+    cache_inputs = True
+    input_grids = {}
+
+    def set_input_node_states(self, orig_size_xyz):
+        key = tuple(orig_size_xyz)
+        if not self.cache_inputs:
+            return CPPN.set_input_node_states(self, orig_size_xyz)
+
+        nodes = self.graph.node if hasattr(self.graph, "node") else self.graph.nodes
+        input_names = getattr(self, "input_node_names", ["x", "y", "z", "d", "b"])
+        if key not in self.input_grids:
+            CPPN.set_input_node_states(self, orig_size_xyz)
+            grids = {name: nodes[name]["state"] for name in input_names if name in nodes}
+            for grid in grids.values():
+                # shared by every CPPN, so make sure nobody changes them in place.
+                grid.flags.writeable = False
+            self.input_grids[key] = grids
+
+        for name, grid in self.input_grids[key].items():
+            if name in nodes:
+                nodes[name]["state"] = grid
 
 
 class StructureGenotype(Genotype):
     def __init__(self):
         Genotype.__init__(self, orig_size_xyz=IND_SIZE)
 
-        self.add_network(CPPN(output_node_names=NODE_NAMES))
+        self.add_network(GridCachedCPPN(output_node_names=NODE_NAMES))
 
         self.to_phenotype_mapping.add_map(name="material", tag="<Data>", func=make_material_tree,
                                           dependency_order=NODE_NAMES, output_type=int)
@@ -94,24 +172,177 @@ class StructureGenotype(Genotype):
                                                 material_if_true=l_child, material_if_false=r_child)
 
 class StructurePhenotype(Phenotype):
-    def is_valid(self, min_percent_full=MIN_PERCENT_FULL):
+    # False once release_expression dropped the expressed arrays.
+    expressed = True
+
+    def get_phenotype(self):
+        # remember the expressed phenotype until the next mutation instead of recomputing it on every call.
+        if getattr(self, "_phenotype", None) is None:
+            self._express()
+            self._phenotype = list(Phenotype.get_phenotype(self))
+        return self._phenotype
+
+    def release_expression(self):
+        """
+        Drops the arrays of the expressed phenotype (the states of the network nodes and of the phenotype mapping),
+        e.g. once a robot keeps its own compact copy of the morphology. The genotype is expressed again the next time
+        they are needed.
+        """
+        for details in _expression_dicts(self.genotype):
+            for key, value in list(details.items()):
+                if isinstance(value, np.ndarray):
+                    details[key] = None
+        self._phenotype = None
+        self.expressed = False
+
+    def _express(self):
+        if not self.expressed:
+            self.genotype.express()
+            self.expressed = True
+
+    def __getstate__(self):
+        # the cached expression is rebuilt on demand, so it is not pickled or copied along.
+        state = self.__dict__.copy()
+        state.pop("_phenotype", None)
+        return state
+
+    def mutate(self, *args, **kwargs):
+        self._express()
+        self._phenotype = None
+        result = Phenotype.mutate(self, *args, **kwargs)
+        self._phenotype = None
+        return result
+
+    # how many candidates is_valid checked and how many of them were valid, see acceptance_rate.
+    checked = 0
+    accepted = 0
+    # set while a PhenotypeSampler builds candidates, which it then checks a whole batch at a time.
+    defer_validity = False
+
+    def is_valid(self, min_percent_full=None):
+        if StructurePhenotype.defer_validity:
+            return True
+        StructurePhenotype.checked += 1
+        valid = self._is_valid(MIN_PERCENT_FULL if min_percent_full is None else min_percent_full)
+        StructurePhenotype.accepted += valid
+        return valid
+
+    def _is_valid(self, min_percent_full):
+        # cheapest and most likely to fail first: random candidates are mostly rejected for being too empty.
+        state = _material_state(self.genotype)
+        if state is not None and np.count_nonzero(state > 0) < _min_voxels(self.genotype.orig_size_xyz,
+                                                                            min_percent_full):
+            return False
+
         for name, details in self.genotype.to_phenotype_mapping.items():
-            if np.isnan(details["state"]).any():  # no value should be NAN.
+            # no value should be NAN. Integer states never are.
+            if details["state"].dtype.kind == "f" and np.isnan(details["state"]).any():
                 return False
 
-            if name == "material":  # check material states.
-                state = details["state"]
+        # only valid morphologies are added to the set of morphologies seen before.
+        if FORCE_MORPH_ONCE and state is not None:
+            return get_morphologies_seen_before().add(state.astype(MORPHOLOGY_DTYPE))
+        return True
 
-                if FORCE_MORPH_ONCE and tuple(state.flatten()) in MORPHOLOGIES_SEEN_BEFORE:
-                    return False
 
-                # for robot to not be entirely empty space.
-                num_vox = np.sum(state > 0)
-                if num_vox < np.product(self.genotype.orig_size_xyz) * min_percent_full:  # must have enough structure
-                    return False
+def _expression_dicts(genotype):
+    # the dicts holding the arrays computed when the genotype is expressed.
+    dicts = [details for name, details in genotype.to_phenotype_mapping.items()]
+    for network in getattr(genotype, "networks", []):
+        nodes = network.graph.node if hasattr(network.graph, "node") else network.graph.nodes
+        dicts.extend(nodes[name] for name in network.graph)
+    return dicts
 
-                if FORCE_MORPH_ONCE:
-                    MORPHOLOGIES_SEEN_BEFORE[tuple(state.flatten())] = 1
 
-        return True
+def _material_state(genotype):
+    for name, details in genotype.to_phenotype_mapping.items():
+        if name == "material":
+            return details["state"]
+    return None
+
+
+def _min_voxels(size_xyz, min_percent_full):
+    # for robot to not be entirely empty space.
+    return np.prod(size_xyz) * min_percent_full
+
+
+class PhenotypeSampler(object):
+    """
+    Hands out random valid phenotypes, built batch_size candidates at a time without checking each one as it is built,
+    then filtered with one vectorized pass over the whole batch: the voxel count of every candidate first, the NaN
+    check only for the candidates which are full enough. Morphologies are only checked against (and added to) the set
+    of morphologies seen before when they are handed out.
+    """
+    def __init__(self, genotype_class=StructureGenotype, batch_size=32, min_percent_full=None):
+        self.genotype_class = genotype_class
+        self.batch_size = batch_size
+        self.min_percent_full = min_percent_full
+        self.ready = deque()
+        self.generated = 0
+        self.accepted = 0
+
+    def acceptance_rate(self):
+        return self.accepted / self.generated if self.generated else 1.0
+
+    def _fill(self):
+        StructurePhenotype.defer_validity = True
+        try:
+            candidates = [StructurePhenotype(self.genotype_class) for _ in range(self.batch_size)]
+        finally:
+            StructurePhenotype.defer_validity = False
+        self.generated += len(candidates)
+
+        genotypes = [c.genotype for c in candidates]
+        min_percent_full = MIN_PERCENT_FULL if self.min_percent_full is None else self.min_percent_full
+        keep = np.arange(len(candidates))
+        materials = [_material_state(g) for g in genotypes]
+        if materials[0] is not None:
+            counts = np.count_nonzero(np.stack(materials).reshape(len(candidates), -1) > 0, axis=1)
+            keep = keep[counts >= _min_voxels(genotypes[0].orig_size_xyz, min_percent_full)]
+
+        for name, details in genotypes[0].to_phenotype_mapping.items():
+            if len(keep) == 0:
+                break
+            if details["state"].dtype.kind != "f":
+                continue
+            states = np.stack([genotypes[i].to_phenotype_mapping[name]["state"] for i in keep])
+            keep = keep[~np.isnan(states.reshape(len(keep), -1)).any(axis=1)]
+
+        self.ready.extend(candidates[i] for i in keep)
+
+    def __call__(self):
+        while True:
+            while not self.ready:
+                self._fill()
+            phenotype = self.ready.popleft()
+            if FORCE_MORPH_ONCE:
+                state = _material_state(phenotype.genotype).astype(MORPHOLOGY_DTYPE)
+                if not get_morphologies_seen_before().add(state):
+                    continue
+            self.accepted += 1
+            return phenotype
+
+
+# build random phenotypes this many at a time, see PhenotypeSampler. 0 builds and checks them one by one.
+PHENOTYPE_BATCH_SIZE = 0
+PHENOTYPE_SAMPLER = None
+
+def random_phenotype():
+    global PHENOTYPE_SAMPLER
+    if PHENOTYPE_BATCH_SIZE <= 0:
+        return StructurePhenotype(StructureGenotype)
+    if PHENOTYPE_SAMPLER is None:
+        PHENOTYPE_SAMPLER = PhenotypeSampler(batch_size=PHENOTYPE_BATCH_SIZE)
+    return PHENOTYPE_SAMPLER()
+
+def acceptance_rate():
+    """
+    :return: the fraction of candidate phenotypes which were valid, over everything checked so far.
+    """
+    checked = StructurePhenotype.checked
+    accepted = StructurePhenotype.accepted
+    if PHENOTYPE_SAMPLER is not None:
+        checked += PHENOTYPE_SAMPLER.generated
+        accepted += PHENOTYPE_SAMPLER.accepted
+    return accepted / checked if checked else 1.0
 
@@ -0,0 +1,29 @@
+# Copyright 2020 David Matthews
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+from evo.executors import run_workers
+
+# Joins the worker farm of a job started with python job.py <seed> --executor farm --farm-address host:port
+# The shared secret is read from the MORPH_SEARCH_AUTHKEY environment variable so it does not show up in ps.
+
+if __name__ == '__main__':
+    assert len(sys.argv) >= 2, "please run as python worker.py host:port [processes]"
+    assert "MORPH_SEARCH_AUTHKEY" in os.environ, "please set MORPH_SEARCH_AUTHKEY to the same value as the job"
+    host, port = sys.argv[1].rsplit(":", 1)
+    processes = int(sys.argv[2]) if len(sys.argv) >= 3 else None
+
+    run_workers((host, int(port)), os.environ["MORPH_SEARCH_AUTHKEY"].encode(), processes=processes)